@@ -0,0 +1,104 @@
+"""
+Benchmark single-area vs multi-area (batched) Overpass queries in `get_data`
+
+By default the crawler runs against a local stub Overpass server that models
+a fixed cost per request (network round trip, query start-up) plus a cost per
+resolved area, so the numbers show how batching amortises the per-request overhead.
+Use `--url` and `--ags` to measure against a real Overpass instance instead (be gentle).
+
+    python src/benchmarks/bench_overpass_batching.py --areas 60 --batch-sizes 1 5 10 20
+"""
+import argparse
+import http.server
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from src.cheapatlas.commons.building_store import BuildingStore
+from src.cheapatlas.pipelines.data_acquisition.nodes import AREA_MARKER, get_data
+
+
+def stub_overpass(request_overhead: float, area_cost: float, buildings_per_area: int):
+    """Start a local Overpass stub, return (server, request counter)"""
+    counter = {'requests': 0}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            counter['requests'] += 1
+            query = parse_qs(urlparse(self.path).query)['data'][0]
+            ids = re.findall(r'"de:amtlicher_gemeindeschluessel"="(\w+)"', query)
+            time.sleep(request_overhead + area_cost * len(ids))
+
+            elements = []
+            for boundary_id in ids:
+                if AREA_MARKER in query:
+                    elements.append({'type': AREA_MARKER, 'id': 1, 'tags': {'ags': boundary_id}})
+                elements.extend({'type': 'way', 'id': int(boundary_id) * 10 ** 6 + i, 'nodes': [1, 2, 3, 1],
+                                 'center': {'lat': 50.0, 'lon': 8.0},
+                                 'tags': {'building': 'house'}} for i in range(buildings_per_area))
+            body = json.dumps({'version': 0.6, 'elements': elements}).encode()
+
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, counter
+
+
+def run(url: str, ags_list, areas_per_query: int, max_concurrency: int):
+    saved_location = tempfile.mkdtemp()
+    overpass = {'url': url,
+                'max_concurrency': max_concurrency,
+                'areas_per_query': areas_per_query}
+    try:
+        started = time.perf_counter()
+        get_data(pd.DataFrame({'ags': ags_list}), 'ags', BuildingStore(saved_location, 'ags', 'csv'), overpass,
+                 manifest_path=os.path.join(saved_location, 'progress.sqlite'))
+        return time.perf_counter() - started
+    finally:
+        shutil.rmtree(saved_location)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Overpass interpreter url (default: local stub)')
+    parser.add_argument('--ags', nargs='+', help='AGS codes to crawl (default: synthetic)')
+    parser.add_argument('--areas', type=int, default=60, help='number of synthetic areas')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 5, 10, 20])
+    parser.add_argument('--max-concurrency', type=int, default=2)
+    parser.add_argument('--request-overhead', type=float, default=0.25, help='stub: seconds per request')
+    parser.add_argument('--area-cost', type=float, default=0.02, help='stub: seconds per resolved area')
+    parser.add_argument('--buildings-per-area', type=int, default=300, help='stub: buildings per area')
+    args = parser.parse_args()
+
+    counter = None
+    url = args.url
+    if url is None:
+        server, counter = stub_overpass(args.request_overhead, args.area_cost, args.buildings_per_area)
+        url = f'http://127.0.0.1:{server.server_port}/api/interpreter'
+    ags_list = args.ags or [f'{i:08d}' for i in range(1, args.areas + 1)]
+
+    print(f'{"areas/query":>12} {"requests":>9} {"seconds":>9} {"requests/s":>11} {"areas/s":>9}')
+    for areas_per_query in args.batch_sizes:
+        before = counter['requests'] if counter else 0
+        seconds = run(url, ags_list, areas_per_query, args.max_concurrency)
+        n_requests = (counter['requests'] - before) if counter else -(-len(ags_list) // areas_per_query)
+        print(f'{areas_per_query:>12} {n_requests:>9} {seconds:>9.2f} '
+              f'{n_requests / seconds:>11.2f} {len(ags_list) / seconds:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark the JSON vs CSV Overpass wire format: payload bytes and parse time per AGS
+
+By default synthetic responses are rendered the way Overpass formats them
+(indented JSON with `out center`, tab-separated CSV with header).
+Use `--url` and `--ags` to download real responses in both formats instead (be gentle).
+
+    python src/benchmarks/bench_overpass_wire_format.py --buildings 1000 10000 100000
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+
+import requests
+
+from src.cheapatlas.commons.overpass_parser import END_MARKER, iter_csv_frames, iter_frames
+from src.cheapatlas.pipelines.data_acquisition.nodes import (BUILDING_COLUMNS, build_overpass_query,
+                                                            with_wire_format)
+
+CHUNK_SIZE = 2 ** 16
+TAGS = [('building', ['house', 'yes', 'residential', 'garage', 'apartments']),
+        ('building:levels', ['1', '2', '3']),
+        ('addr:city', ['Köln']),
+        ('addr:housenumber', ['1', '12a', '117']),
+        ('addr:postcode', ['50667', '50668']),
+        ('addr:street', ['Hohe Straße', 'Domkloster'])]
+
+
+def synthetic_json(n: int) -> bytes:
+    rng = random.Random(42)
+    elements = []
+    for i in range(n):
+        elements.append({'type': 'way', 'id': 10 ** 8 + i,
+                         'center': {'lat': round(50.9 + rng.random() / 10, 7),
+                                    'lon': round(6.9 + rng.random() / 10, 7)},
+                         'nodes': [10 ** 9 + i * 5 + k for k in range(5)],
+                         'tags': {key: rng.choice(values) for key, values in TAGS if rng.random() < 0.7}})
+    return json.dumps({'version': 0.6, 'generator': 'Overpass API', 'elements': elements},
+                      indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def json_to_csv(payload: bytes) -> bytes:
+    fields = ['building', 'building:levels', 'source', 'addr:city', 'addr:housenumber',
+              'addr:postcode', 'addr:street', 'addr:suburb']
+    lines = ['\t'.join(['@type', '@id', '@lat', '@lon'] + fields)]
+    for element in json.loads(payload)['elements']:
+        tags = element.get('tags', {})
+        lines.append('\t'.join([element['type'], str(element['id']),
+                                str(element['center']['lat']), str(element['center']['lon'])]
+                               + [tags.get(field, '') for field in fields]))
+    lines.append('\t'.join([END_MARKER, '1'] + [''] * (len(fields) + 2)))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def download(url: str, boundary_id: str, wire_format: str) -> bytes:
+    query = with_wire_format(build_overpass_query('ags', boundary_id), wire_format)
+    response = requests.get(url, params={'data': query})
+    response.raise_for_status()
+    return response.content
+
+
+def parse_seconds(parse, payload: bytes, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        chunks = (payload[i:i + CHUNK_SIZE] for i in range(0, len(payload), CHUNK_SIZE))
+        started = time.perf_counter()
+        rows = sum(len(df) for df in parse(chunks))
+        best = min(best, time.perf_counter() - started)
+    return best, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Overpass interpreter url (default: synthetic payloads)')
+    parser.add_argument('--ags', nargs='+', help='AGS codes to download')
+    parser.add_argument('--buildings', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.url:
+        cases = [(boundary_id, download(args.url, boundary_id, 'json'), download(args.url, boundary_id, 'csv'))
+                 for boundary_id in args.ags]
+    else:
+        cases = []
+        for n in args.buildings:
+            payload = synthetic_json(n)
+            cases.append((f'{n} bld', payload, json_to_csv(payload)))
+
+    parse_json = lambda chunks: iter_frames(chunks, BUILDING_COLUMNS)
+    parse_csv = lambda chunks: (df for _, df in iter_csv_frames(chunks, BUILDING_COLUMNS))
+
+    print(f'{"area":>12} {"format":>6} {"rows":>8} {"bytes":>12} {"gzip bytes":>11} {"parse s":>9} {"rows/s":>11}')
+    for name, json_payload, csv_payload in cases:
+        for wire_format, payload, parse in (('json', json_payload, parse_json), ('csv', csv_payload, parse_csv)):
+            seconds, rows = parse_seconds(parse, payload, args.repeat)
+            print(f'{name:>12} {wire_format:>6} {rows:>8} {len(payload):>12} {len(gzip.compress(payload)):>11} '
+                  f'{seconds:>9.3f} {rows / seconds:>11.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark joining the buildings of an area (AGS/PLZ) with the region buildings
+
+A synthetic region (ids, footprint, timestamp, in the pyrosm layout) and areas of crawled building ids:
+- merge: former `df.merge(region_df)` per area, the whole region is hashed for every area
+- index: id index built once for the region (`IndexedBuildings`), every area looks up its buildings
+  by binary search and merges only those
+
+    python src/benchmarks/bench_region_lookup.py --buildings 5000000 --areas 20 --area-size 5000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.cheapatlas.commons.region_index import IndexedBuildings
+
+
+def synthetic_region(n: int, seed: int = 42):
+    """Region buildings: ways then relations, ascending ids like in the dump"""
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(10 ** 9, size=n, replace=False))
+    footprints = np.array([shapely.box(7 + i / 1000, 51, 7.0005 + i / 1000, 51.0005) for i in range(1000)])
+    return pd.DataFrame({'id': ids,
+                         'geometry': footprints[rng.integers(0, len(footprints), n)],
+                         'timestamp': rng.integers(1.5e9, 1.7e9, n),
+                         'building': 'yes'})
+
+
+def synthetic_areas(region: pd.DataFrame, areas: int, size: int, seed: int = 42):
+    """Crawled buildings of the areas, 1% of them not in the dump"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(areas):
+        # buildings of an area are neighbours, a slice of the region with some new ids
+        start = rng.integers(0, len(region) - size)
+        ids = region['id'].to_numpy()[start:start + size].copy()
+        ids[rng.random(size) < 0.01] += 10 ** 9
+        frames.append(pd.DataFrame({'id': rng.permutation(ids), 'tags.building': 'house'}))
+    return frames
+
+
+def join_merge(region: pd.DataFrame, area: pd.DataFrame):
+    return area.merge(region[['id', 'geometry', 'timestamp']], how='left', on='id')
+
+
+def join_index(region: IndexedBuildings, area: pd.DataFrame):
+    return area.merge(region.select(area['id']), how='left', on='id')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--buildings', type=int, default=5000000, help='buildings in the region')
+    parser.add_argument('--areas', type=int, default=20)
+    parser.add_argument('--area-size', type=int, default=5000, help='buildings per area')
+    args = parser.parse_args()
+
+    region = synthetic_region(args.buildings)
+    areas = synthetic_areas(region, args.areas, args.area_size)
+
+    started = time.perf_counter()
+    indexed = IndexedBuildings(region)
+    build = time.perf_counter() - started
+
+    print(f'{"mode":>6} {"index s":>8} {"ms/area":>8} {"total s":>8}')
+    for mode, join, source, setup in (('merge', join_merge, region, 0.0), ('index', join_index, indexed, build)):
+        started = time.perf_counter()
+        results = [join(source, area) for area in areas]
+        seconds = time.perf_counter() - started
+        assert all(len(df) == len(area) and df['geometry'].notna().sum() == area['id'].isin(region['id']).sum()
+                   for df, area in zip(results, areas))
+        print(f'{mode:>6} {setup:>8.2f} {seconds / len(areas) * 1000:>8.1f} {setup + seconds:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
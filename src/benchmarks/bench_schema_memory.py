@@ -0,0 +1,138 @@
+"""
+Benchmark the peak memory (RSS) of loading one district with and without the schema registry
+
+A synthetic district (municipalities of the 02_intermediate stage, OSM-like tag distributions)
+is written once, then read in a fresh process per mode:
+- adhoc: per-file `pd.read_csv` with the former `dtype=` dicts and per-cell `nodes` converter
+- schema-csv / schema-parquet: `BuildingStore.read_prefix`, typed with the schema registry
+
+    python src/benchmarks/bench_schema_memory.py --buildings 100000 300000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from src.cheapatlas.commons.building_store import BuildingStore
+
+DISTRICT = '05315'
+BUILDING_TAGS = ['house'] * 40 + ['yes'] * 30 + ['garage'] * 10 + ['apartments'] * 8 + ['residential', 'shed', 'school']
+STREETS = [f'{name}straße' for name in ('Haupt', 'Schul', 'Kirch', 'Berg', 'Wald', 'Garten', 'Linden', 'Bahnhof')]
+
+
+def synthetic_district(n: int, municipalities: int, seed: int = 42):
+    """Buildings of a district in the intermediate stage layout, one dataframe per municipality"""
+    rng = random.Random(seed)
+    streets = [f'{street} {i}' for street in STREETS for i in range(50)]
+    frames = {}
+    for m in range(municipalities):
+        ags = f'{DISTRICT}{m:03d}'
+        size = n // municipalities
+        tags = [rng.choice(BUILDING_TAGS) for _ in range(size)]
+        frames[ags] = pd.DataFrame({
+            'type': 'way',
+            'id': [m * 10 ** 7 + i for i in range(size)],
+            'nodes': [[rng.randrange(10 ** 9) for _ in range(rng.randint(4, 12))] for _ in range(size)],
+            'center.lat': [50.9 + rng.random() * 0.2 for _ in range(size)],
+            'center.lon': [6.9 + rng.random() * 0.2 for _ in range(size)],
+            'tags.building': tags,
+            'building_levels': [rng.choice(['1', '2', '2', '3', None]) for _ in range(size)],
+            'tags.source': [rng.choice(['', 'Bing', 'survey']) or None for _ in range(size)],
+            'tags.addr:city': f'Gemeinde {m}',
+            'tags.addr:housenumber': [str(rng.randint(1, 200)) for _ in range(size)],
+            'postcode': f'50{m:03d}',
+            'tags.addr:street': [rng.choice(streets) for _ in range(size)],
+            'tags.addr:suburb': None,
+            'ags': ags,
+            'geometry': None,
+            'timestamp': 0,
+            'building_types': ['residential' if tag in ('house', 'apartments', 'residential') else
+                               'to_be_classified' if tag == 'yes' else 'other' for tag in tags],
+        })
+    return frames
+
+
+def read_adhoc(root: str):
+    """District as read before the schema registry"""
+    frames = []
+    for name in sorted(os.listdir(root)):
+        frames.append(pd.read_csv(os.path.join(root, name), index_col=None, header=0, low_memory=False,
+                                  dtype={'tags.addr:suburb': 'object',
+                                         'tags.building:levels': 'object',
+                                         'tags.source': str,
+                                         'postcode': str},
+                                  converters={'nodes': lambda x: x.strip('[]').split(', ')}))
+    return pd.concat(frames, axis=0, ignore_index=True)
+
+
+def peak_rss() -> int:
+    """Peak resident memory of this process in bytes"""
+    try:
+        # high-water mark of the address space, unlike ru_maxrss not inherited from the parent on exec
+        with open('/proc/self/status') as f:
+            return next(int(x.split()[1]) for x in f if x.startswith('VmHWM:')) * 1024
+    except (OSError, StopIteration):
+        # ru_maxrss is in KiB on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def measure(mode: str, root: str, queue):
+    baseline = peak_rss()
+    started = time.perf_counter()
+    if mode == 'adhoc':
+        df = read_adhoc(root)
+    else:
+        df = BuildingStore(root, 'ags', mode.split('-')[1]).read_prefix(DISTRICT)
+    seconds = time.perf_counter() - started
+    queue.put((peak_rss() - baseline, int(df.memory_usage(deep=True).sum()), seconds))
+
+
+def run(mode: str, root: str):
+    """Measure a mode in a fresh process (peak RSS never goes down)"""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(mode, root, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--buildings', type=int, nargs='+', default=[100000, 300000], help='buildings per district')
+    parser.add_argument('--municipalities', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f'{"buildings":>10} {"mode":>15} {"peak RSS MiB":>13} {"frame MiB":>10} {"seconds":>8}')
+    for n in args.buildings:
+        folder = tempfile.mkdtemp()
+        try:
+            frames = synthetic_district(n, args.municipalities)
+            stores = {'csv': BuildingStore(os.path.join(folder, 'csv'), 'ags', 'csv'),
+                      'parquet': BuildingStore(os.path.join(folder, 'parquet'), 'ags', 'parquet')}
+            for ags, df in frames.items():
+                # former layout: untyped CSV written by pandas, nodes as a list repr
+                os.makedirs(os.path.join(folder, 'adhoc'), exist_ok=True)
+                df.to_csv(os.path.join(folder, 'adhoc', f'buildings_ags_{ags}.csv'), index=False)
+                for store in stores.values():
+                    store.write(ags, df)
+            del frames
+
+            for mode in ('adhoc', 'schema-csv', 'schema-parquet'):
+                root = os.path.join(folder, mode.split('-')[-1])
+                peak, frame, seconds = run(mode, root)
+                print(f'{n:>10} {mode:>15} {peak / 2 ** 20:>13.1f} {frame / 2 ** 20:>10.1f} {seconds:>8.2f}')
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Summary of the building objects written for an area, kept in the progress manifest next to its progress entry
+
+Reports and dashboards aggregate these few rows per area (buildings and surface area per building type)
+instead of reading the footprints of every area again.
+"""
+import numpy as np
+import pandas as pd
+
+from src.cheapatlas.commons.geometry import GEOMETRY_COLUMN, surface_areas
+
+# building type of the areas without classification yet (etc: 01_raw) or of unclassified buildings
+NO_TYPE = ''
+
+
+def area_stats(df: pd.DataFrame) -> dict:
+    """
+    Number of buildings and total surface area (m², from the footprints) per building type
+
+    Args:
+        df: building objects of an area (`building_types` and footprint `geometry` columns if available)
+    Returns:
+        dictionary of building type -> (buildings, surface area or None without footprints)
+    """
+    if 'building_types' in df.columns:
+        types = df['building_types'].astype(object).where(df['building_types'].notna(), NO_TYPE)
+    else:
+        types = pd.Series(NO_TYPE, index=df.index, dtype=object)
+    has_footprints = GEOMETRY_COLUMN in df.columns
+    surface = surface_areas(df[GEOMETRY_COLUMN]) if has_footprints else np.full(len(df), np.nan)
+
+    grouped = pd.DataFrame({'building_type': types.to_numpy(), 'surface_area': surface}) \
+        .groupby('building_type', sort=True)['surface_area'].agg(['size', 'sum'])
+    return {building_type: (int(row['size']), float(row['sum']) if has_footprints else None)
+            for building_type, row in grouped.iterrows()}
@@ -0,0 +1,125 @@
+"""
+Atomic writes of output files
+
+Files are written to a temporary file next to their final location, flushed to disk (fsync)
+and renamed into place. A killed worker therefore leaves either the previous complete file or
+none at all, never a truncated one, and writing an area again simply replaces its file.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+import logging
+log = logging.getLogger(__name__)
+
+
+@contextmanager
+def atomic_path(path: str):
+    """
+    Yield a temporary path to write the content of `path` to
+    The temporary file replaces `path` if the block completes, it is removed if the block raises
+    """
+    folder = os.path.dirname(path) or '.'
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        yield tmp_path
+        fsync_file(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_dir(folder)
+
+
+def write_csv(df, path: str, **kwargs):
+    """`df.to_csv(path, **kwargs)`, atomically (index is not written by default)"""
+    kwargs.setdefault('index', False)
+    with atomic_path(path) as tmp_path:
+        df.to_csv(tmp_path, **kwargs)
+
+
+class AtomicCsvWriter:
+    """
+    Write a CSV file batch by batch (etc: streamed Overpass responses)
+    The batches go to a temporary file, renamed to `path` on commit. Nothing is written to `path`
+    if no batch was written or the writer is aborted
+
+    Used as a context manager: committed if the block completes, aborted if it raises
+
+    Args:
+        path: final location of the CSV file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self._file = None
+        self._tmp_path = None
+
+    def write(self, df):
+        """Append a dataframe (header written with the first batch)"""
+        if self._file is None:
+            folder = os.path.dirname(self.path) or '.'
+            os.makedirs(folder, exist_ok=True)
+            fd, self._tmp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+            self._file = os.fdopen(fd, 'w', newline='')
+            df.to_csv(self._file, header=True, index=False)
+        else:
+            df.to_csv(self._file, header=False, index=False)
+        self.rows = self.rows + len(df)
+
+    def commit(self) -> bool:
+        """
+        Move the written batches to `path`
+
+        Returns:
+            True if the file was written, False if there was nothing to write
+        """
+        if self._file is None:
+            return False
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self.path)
+        fsync_dir(os.path.dirname(self.path) or '.')
+        return True
+
+    def abort(self):
+        """Drop the written batches"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self._tmp_path)
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def fsync_file(path: str):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def fsync_dir(folder: str):
+    """Persist a rename in `folder` (not supported on every platform, etc: Windows)"""
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
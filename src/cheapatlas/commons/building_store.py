@@ -0,0 +1,329 @@
+"""
+Storage of per-area building objects of a pipeline stage (01_raw ... 07_model_output)
+
+Two backends:
+- csv: one `buildings_<boundary_type>_<boundary_id>.csv` file per area (original layout)
+- parquet: Hive-partitioned Parquet, zstd compressed, typed columns, footprints as WKB (GeoParquet),
+  node lists as list<int64>, labels dictionary encoded
+    <root>/state=<2 digits>/district=<5 digits>/ags=<AGS>/part-0.parquet  (municipality level)
+    <root>/state=<2 digits>/district=<5 digits>/part-0.parquet            (district level)
+    <root>/plz=<PLZ>/part-0.parquet                                       (postal codes)
+
+As in Hive datasets, partition key columns are not stored in the files, they are restored on read.
+Writes are atomic for both backends (temporary file + fsync + rename).
+Both backends read and write the columns with the dtypes of the schema registry (see `schema`).
+"""
+import glob
+import json
+import os
+import re
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from src.cheapatlas.commons.atomic_io import AtomicCsvWriter, fsync_dir
+from src.cheapatlas.commons.geometry import geo_columns, geo_metadata, is_geometry_column, to_wkb
+from src.cheapatlas.commons.node_lists import format_node_lists, is_node_list_column, to_node_list_array
+from src.cheapatlas.commons.schema import apply_schema, as_text, csv_dtypes
+
+import logging
+log = logging.getLogger(__name__)
+
+BACKENDS = ('csv', 'parquet')
+PARQUET_FILE = 'part-0.parquet'
+# schema metadata key holding the column order, partition key columns included
+COLUMNS_METADATA = b'cheapatlas.columns'
+
+
+def partition_keys(boundary_type: str, boundary_id: str):
+    """
+    Hive partition keys of an area, from the top level down
+
+    Returns:
+        list of (key, value), etc: [('state', '01'), ('district', '01001'), ('ags', '01001000')]
+    """
+    boundary_id = str(boundary_id)
+    if boundary_type != 'ags':
+        return [(boundary_type, boundary_id)]
+    keys = [('state', boundary_id[:2]), ('district', boundary_id[:5])]
+    if len(boundary_id) > 5:
+        keys.append(('ags', boundary_id))
+    return keys
+
+
+class BuildingStore:
+    """
+    Args:
+        root: folder of the stage (etc: data/02_intermediate/buildings_data)
+        boundary_type: PLZ or AGS
+        backend: csv or parquet
+        compression: Parquet compression codec
+    """
+
+    def __init__(self, root: str, boundary_type: str = 'ags', backend: str = 'csv', compression: str = 'zstd'):
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown storage backend {backend}, expected one of {BACKENDS}')
+        self.root = root
+        self.boundary_type = boundary_type
+        self.backend = backend
+        self.compression = compression
+
+    def __repr__(self):
+        return f'BuildingStore({self.root!r}, {self.boundary_type!r}, {self.backend!r})'
+
+    def stage_name(self, stage: str) -> str:
+        """Progress manifest stage of this store, outputs of different backends are tracked separately"""
+        return stage if self.backend == 'csv' else f'{stage}.{self.backend}'
+
+    def path(self, boundary_id: str) -> str:
+        """File holding the building objects of an area"""
+        if self.backend == 'csv':
+            return f'{self.root}/buildings_{self.boundary_type}_{boundary_id}.csv'
+        folders = [f'{key}={value}' for key, value in partition_keys(self.boundary_type, boundary_id)]
+        return os.path.join(self.root, *folders, PARQUET_FILE)
+
+    def exists(self, boundary_id: str) -> bool:
+        return os.path.exists(self.path(boundary_id))
+
+    def writer(self, boundary_id: str):
+        """Writer of an area, written batch by batch and committed atomically (see `AtomicCsvWriter`)"""
+        if self.backend == 'csv':
+            return BuildingCsvWriter(self.path(boundary_id))
+        return AtomicParquetWriter(self.path(boundary_id),
+                                   dict(partition_keys(self.boundary_type, boundary_id)),
+                                   compression=self.compression)
+
+    def write(self, boundary_id: str, df: pd.DataFrame) -> str:
+        """Replace the building objects of an area, returns the written file"""
+        with self.writer(boundary_id) as writer:
+            writer.write(df)
+        return writer.path
+
+    def read(self, boundary_id: str, columns=None, **csv_args) -> pd.DataFrame:
+        """
+        Read the building objects of an area
+
+        Args:
+            boundary_id: PLZ/AGS/district id
+            columns: subset of columns to read
+            csv_args: arguments of `pd.read_csv`, not used by typed backends
+        Returns:
+            dataframe typed with the schema registry for every backend
+        """
+        if self.backend == 'csv':
+            dtype = dict(csv_dtypes(), **csv_args.pop('dtype', {}))
+            return apply_schema(pd.read_csv(self.path(boundary_id), usecols=columns, dtype=dtype, **csv_args))
+        return apply_schema(read_parquet_partition(self.path(boundary_id), columns))
+
+    def read_prefix(self, prefix: str, **csv_args) -> pd.DataFrame:
+        """Read and concatenate all areas whose id starts with `prefix` (etc: municipalities of a district)"""
+        frames = [self.read(boundary_id, **csv_args) for boundary_id in sorted(self.existing(prefix))]
+        if not frames:
+            raise FileNotFoundError(f'No {self.boundary_type} starting with {prefix} in {self.root}')
+        # categories differing between areas are concatenated as strings, categorical again after
+        return apply_schema(pd.concat(frames, axis=0, ignore_index=True))
+
+    def columns(self, boundary_id: str):
+        """Column names of an area, without reading its data"""
+        if self.backend == 'csv':
+            return list(pd.read_csv(self.path(boundary_id), nrows=0).columns)
+        schema = pq.read_schema(self.path(boundary_id))
+        return stored_columns(schema)
+
+    def existing(self, prefix: str = ''):
+        """
+        Non-empty outputs of the stage
+
+        Returns:
+            dictionary of boundary id -> file
+        """
+        if not os.path.exists(self.root):
+            return {}
+
+        outputs = {}
+        if self.backend == 'csv':
+            pattern = re.compile(f'buildings_{re.escape(self.boundary_type)}_({re.escape(prefix)}[^._]*)\\.csv$')
+            for entry in os.scandir(self.root):
+                match = pattern.match(entry.name)
+                if match and entry.stat().st_size > 0:
+                    outputs[match.group(1)] = entry.path
+            return outputs
+
+        for path in glob.glob(os.path.join(self.root, *self._glob_folders(prefix), PARQUET_FILE), recursive=True):
+            boundary_id = os.path.basename(os.path.dirname(path)).split('=', 1)[1]
+            if boundary_id.startswith(prefix):
+                outputs[boundary_id] = path
+        return outputs
+
+    def _glob_folders(self, prefix: str):
+        """Partition folders (glob patterns) of the areas starting with `prefix`, at both AGS levels"""
+        if self.boundary_type != 'ags':
+            return [f'{self.boundary_type}={prefix}*']
+        state = prefix[:2] if len(prefix) >= 2 else prefix + '*'
+        district = prefix[:5] if len(prefix) >= 5 else prefix + '*'
+        # districts are the leaf level of district stages, municipalities of the others
+        return [f'state={state}', f'district={district}', '**']
+
+
+class BuildingCsvWriter(AtomicCsvWriter):
+    """`AtomicCsvWriter` writing the schema dtypes, node lists as "[1, 2, 3]" text"""
+
+    def write(self, df):
+        df = apply_schema(df)
+        lists = [column for column in df.columns if is_node_list_column(df[column])]
+        if lists:
+            df = df.assign(**{column: format_node_lists(to_node_list_array(df[column])) for column in lists})
+        super().write(df)
+
+
+class AtomicParquetWriter:
+    """
+    Write a Parquet file batch by batch into a temporary file, renamed to `path` on commit
+    The schema is fixed by the first batch cast with the schema registry: footprints as WKB,
+    node lists as list<int64>, categories dictionary encoded, other text columns as strings,
+    later batches are cast to it.
+    Partition key columns are dropped from the file and recorded in its metadata
+
+    Args:
+        path: final location of the file
+        partition_values: partition key -> value of the file (etc: {'state': '01', 'ags': '01001000'})
+        compression: Parquet compression codec
+        metadata: extra schema metadata of the file (bytes -> bytes)
+    """
+
+    def __init__(self, path: str, partition_values: dict = None, compression: str = 'zstd', metadata: dict = None):
+        self.path = path
+        self.partition_values = partition_values or {}
+        self.compression = compression
+        self.metadata = metadata or {}
+        self.rows = 0
+        self.schema = None
+        self._writer = None
+        self._tmp_path = None
+
+    def write(self, df: pd.DataFrame):
+        columns = [str(x) for x in df.columns]
+        df = df.drop(columns=[x for x in df.columns if x in self.partition_values])
+        table = to_table(apply_schema(df))
+        if self._writer is None:
+            fields = [field.with_type(storage_type(field.type)) for field in table.schema]
+            metadata = dict(table.schema.metadata or {})
+            metadata[COLUMNS_METADATA] = json.dumps(columns).encode()
+            metadata.update(self.metadata)
+            self.schema = pa.schema(fields, metadata=metadata)
+
+            folder = os.path.dirname(self.path)
+            os.makedirs(folder, exist_ok=True)
+            # hidden file, skipped by Hive dataset readers
+            fd, self._tmp_path = tempfile.mkstemp(dir=folder, prefix=f'.{os.path.basename(self.path)}.', suffix='.tmp')
+            os.close(fd)
+            self._writer = pq.ParquetWriter(self._tmp_path, self.schema, compression=self.compression)
+        self._writer.write_table(table.cast(self.schema))
+        self.rows = self.rows + len(df)
+
+    def commit(self) -> bool:
+        if self._writer is None:
+            return False
+        self._writer.close()
+        self._writer = None
+        with open(self._tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(self._tmp_path, self.path)
+        fsync_dir(os.path.dirname(self.path))
+        return True
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.remove(self._tmp_path)
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def storage_type(arrow_type):
+    """Type of a column fitting every batch: empty columns as strings, dictionary indices as int32"""
+    if pa.types.is_null(arrow_type):
+        return pa.string()
+    if pa.types.is_dictionary(arrow_type):
+        value_type = arrow_type.value_type
+        return pa.dictionary(pa.int32(), pa.string() if pa.types.is_null(value_type) else value_type)
+    return arrow_type
+
+
+def to_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Arrow table of a dataframe
+    Footprints are encoded in bulk as WKB (GeoParquet metadata), node lists as list<int64>,
+    values of other text (object) columns are written as strings like in CSV files
+    """
+    geometries = [column for column in df.columns if is_geometry_column(df[column])]
+    lists = [column for column in df.columns if column not in geometries and is_node_list_column(df[column])]
+    arrays = {column: pa.array(to_wkb(df[column]), type=pa.binary()) for column in geometries}
+    arrays.update({column: to_node_list_array(df[column]) for column in lists})
+
+    # numbers held in object columns (etc: after concatenating with an empty standard frame) stay numbers
+    df = pd.DataFrame(df.drop(columns=geometries + lists)).infer_objects()
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].map(as_text)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for column, array in arrays.items():
+        table = table.append_column(column, array)
+    if not geometries:
+        return table
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'geo'] = geo_metadata(geometries)
+    return table.replace_schema_metadata(metadata)
+
+
+def arrow_list_dtype(arrow_type):
+    return pd.ArrowDtype(arrow_type) if pa.types.is_list(arrow_type) else None
+
+
+def stored_columns(schema: pa.Schema):
+    """Column order of a file written by `AtomicParquetWriter`, partition key columns included"""
+    metadata = schema.metadata or {}
+    if COLUMNS_METADATA in metadata:
+        return json.loads(metadata[COLUMNS_METADATA])
+    return schema.names
+
+
+def read_parquet_partition(path: str, columns=None, filters=None) -> pd.DataFrame:
+    """
+    Read one partition file, partition key columns restored from its folders
+    Footprints are decoded in bulk into shapely geometries, list columns (node lists) are
+    wrapped zero-copy as `pd.ArrowDtype` columns
+
+    Args:
+        path: Parquet file
+        columns: subset of columns to read
+        filters: row filters of `pq.read_table` (etc: [('id', 'in', ids)]), row groups are skipped on their statistics
+    """
+    schema = pq.read_schema(path)
+    order = stored_columns(schema)
+    if columns is not None:
+        order = [x for x in order if x in columns]
+    table = pq.read_table(path, columns=[x for x in order if x in schema.names], filters=filters)
+    geometries = [x for x in geo_columns(schema.metadata) if x in table.column_names]
+    df = table.drop(geometries).to_pandas(types_mapper=arrow_list_dtype)
+    for column in geometries:
+        df[column] = shapely.from_wkb(table.column(column).to_numpy(zero_copy_only=False))
+
+    partition_values = dict(x.split('=', 1) for x in os.path.dirname(path).split(os.sep) if '=' in x)
+    for column in order:
+        if column not in df.columns and column in partition_values:
+            df[column] = partition_values[column]
+    return df[order]
@@ -0,0 +1,168 @@
+"""
+Download manager for large files (e.g. Geofabrik region dumps)
+
+- Several files are fetched concurrently
+- Partial files (`<file>.part`) are resumed with HTTP Range requests
+- Each file is verified against its `.md5` sidecar (Geofabrik publishes `<file>.md5`)
+- Files only appear under their final name once complete and verified (temp file + rename)
+- Optionally, unchanged files are skipped with conditional requests (see `FreshnessManifest`)
+"""
+import hashlib
+import os
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from tqdm import tqdm  # progress bar
+
+from src.cheapatlas.commons.freshness import FreshnessManifest
+
+import logging
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2 ** 20
+
+
+class DownloadError(Exception):
+    """Raised when a file can not be downloaded completely or fails verification"""
+
+
+def download_file(url: str, output_path: str, session=None, verify_md5: bool = True,
+                  max_retries: int = 3, timeout: float = 60, progress: bool = True,
+                  manifest: FreshnessManifest = None) -> bool:
+    """
+    Download `url` to `output_path`, resuming `<output_path>.part` if it exists
+    With a freshness manifest, an existing file is only downloaded again if the server copy changed
+
+    Args:
+        url: file url
+        output_path: final location of the file
+        session: requests session (or the `requests` module)
+        verify_md5: verify the file against `<url>.md5`
+        max_retries: retries (resuming from the last received byte) on connection errors
+        timeout: seconds without data before a connection is considered broken
+        progress: show a progress bar
+        manifest: freshness manifest, used for conditional requests and updated after the download
+    Returns:
+        True if the file was downloaded, False if it is unchanged on the server
+    Raises:
+        DownloadError: file incomplete after all retries or md5 mismatch
+    """
+    http = session if session is not None else requests
+    part_path = output_path + '.part'
+    validator_path = part_path + '.etag'
+    conditional = manifest.conditional_headers(url, output_path) if manifest is not None else {}
+    remote = {}
+
+    for attempt in range(max_retries + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            # Only resume if the remote file is still the one the partial file belongs to
+            if os.path.exists(validator_path):
+                with open(validator_path) as f:
+                    headers['If-Range'] = f.read().strip()
+        else:
+            headers.update(conditional)
+
+        try:
+            with http.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 304:
+                    log.info(f'{url} is unchanged, skip download')
+                    return False
+                if response.status_code == 416:
+                    # Nothing left to download
+                    break
+                response.raise_for_status()
+                if response.status_code != 206:
+                    offset = 0  # server sent the whole (possibly changed) file
+                remote = {'etag': response.headers.get('ETag'),
+                          'last_modified': response.headers.get('Last-Modified')}
+
+                validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                if offset == 0 and validator:
+                    with open(validator_path, 'w') as f:
+                        f.write(validator)
+
+                length = response.headers.get('Content-Length')
+                total = offset + int(length) if length is not None else None
+                with open(part_path, 'ab' if offset else 'wb') as f, \
+                        tqdm(total=total, initial=offset, unit='B', unit_scale=True, miniters=1,
+                             desc=os.path.basename(output_path), disable=not progress, leave=False) as bar:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        bar.update(len(chunk))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                if total is not None and os.path.getsize(part_path) < total:
+                    raise requests.exceptions.ConnectionError(f'Connection closed early for {url}')
+            break
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.Timeout) as e:
+            log.warning(f'Download of {url} interrupted at attempt {attempt + 1}: {e}')
+    else:
+        raise DownloadError(f'Can not download {url} after {max_retries + 1} attempts')
+
+    if verify_md5:
+        expected_md5 = fetch_md5(http, url, timeout)
+        md5 = file_md5(part_path)
+        if md5 != expected_md5:
+            os.remove(part_path)
+            raise DownloadError(f'MD5 mismatch for {url}: expected {expected_md5}, got {md5}')
+
+    os.replace(part_path, output_path)
+    if os.path.exists(validator_path):
+        os.remove(validator_path)
+    if manifest is not None:
+        manifest.update(url, output_path, **remote)
+    return True
+
+
+def download_files(jobs, max_workers: int = 4, session: requests.Session = None, **kwargs):
+    """
+    Download several (url, output_path) jobs concurrently over one pooled session
+    Failures are logged, other files continue downloading. A given `session` is left open
+
+    Returns:
+        dictionary of url -> True if downloaded, False if unchanged (see `download_file`), else the exception raised
+    """
+    results = {}
+    with ExitStack() as stack:
+        http = session
+        if http is None:
+            # own session, sized to the workers and closed afterwards
+            http = stack.enter_context(requests.Session())
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+            http.mount('http://', adapter)
+            http.mount('https://', adapter)
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+
+        futures = {executor.submit(download_file, url, output_path, http, **kwargs): url
+                   for url, output_path in jobs}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                results[url] = future.result()
+                if results[url]:
+                    log.info(f'Downloaded {url}')
+            except Exception as e:
+                results[url] = e
+                log.error(f'Can not download {url}. Error: {e}')
+    return results
+
+
+def fetch_md5(session, url: str, timeout: float = 60) -> str:
+    """Read the expected md5 checksum from the `<url>.md5` sidecar (`<md5>  <filename>`)"""
+    response = session.get(url + '.md5', timeout=timeout)
+    response.raise_for_status()
+    return response.text.split()[0].lower()
+
+
+def file_md5(path: str) -> str:
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
@@ -0,0 +1,65 @@
+"""
+Freshness manifest for periodically republished remote files (e.g. Geofabrik region dumps)
+
+Records the `ETag`, `Last-Modified` and size of every downloaded url in a JSON file,
+so later runs can send conditional requests and skip files the server has not changed.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class FreshnessManifest:
+    """
+    Args:
+        path: location of the JSON manifest (etc: data/01_raw/geofabrik_manifest.json)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                log.warning(f'Can not read freshness manifest {path}, all files are treated as changed')
+
+    def conditional_headers(self, url: str, output_path: str) -> dict:
+        """
+        Headers of a conditional request for `url`
+        Empty if the local copy is missing or does not match the recorded size
+        """
+        entry = self.entries.get(url)
+        if not entry or not os.path.exists(output_path) or os.path.getsize(output_path) != entry.get('size'):
+            return {}
+
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def update(self, url: str, output_path: str, etag: str = None, last_modified: str = None):
+        """Record a completed download and persist the manifest"""
+        with self._lock:
+            self.entries[url] = {'etag': etag,
+                                 'last_modified': last_modified,
+                                 'size': os.path.getsize(output_path),
+                                 'downloaded_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            self.save()
+
+    def save(self):
+        folder = os.path.dirname(self.path) or '.'
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
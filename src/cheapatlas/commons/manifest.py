@@ -0,0 +1,214 @@
+"""
+Per-stage progress manifest of the per-area (PLZ/AGS/district) pipeline loops
+
+One SQLite table records for every (stage, boundary id) the status, row count, input hash, duration
+and output size of the last run. Resume decisions are lookups in this table instead of directory scans,
+and an area only counts as done once its output was written completely.
+A second table keeps a summary of the output of every done area (buildings and surface area per building type,
+see `area_stats`), aggregated by reports instead of reading the outputs again.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import logging
+log = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST_PATH = 'data/progress.sqlite'
+
+DONE = 'done'
+FAILED = 'failed'
+
+
+class StageManifest:
+    """
+    Args:
+        path: location of the SQLite database (etc: data/progress.sqlite)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self._lock = threading.Lock()
+        # several worker processes may record progress at once (etc: regions enhanced in parallel)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=60)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS progress (
+                stage TEXT NOT NULL,
+                boundary_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                rows INTEGER,
+                input_hash TEXT,
+                duration REAL,
+                output_path TEXT,
+                output_size INTEGER,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (stage, boundary_id)
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS area_stats (
+                stage TEXT NOT NULL,
+                boundary_id TEXT NOT NULL,
+                building_type TEXT NOT NULL,
+                buildings INTEGER NOT NULL,
+                surface_area REAL,
+                PRIMARY KEY (stage, boundary_id, building_type)
+            )""")
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def done_ids(self, stage: str) -> set:
+        """Set of boundary ids completed in `stage` whose output is still in place (see `output_intact`)"""
+        with self._lock:
+            rows = self._conn.execute('SELECT boundary_id, output_path, output_size FROM progress '
+                                      'WHERE stage = ? AND status = ?', (stage, DONE)).fetchall()
+        done = {boundary_id for boundary_id, output_path, output_size in rows
+                if output_intact(output_path, output_size)}
+        if len(done) < len(rows):
+            log.warning(f'{len(rows) - len(done)} done area(s) of {stage} lost their output, processing them again')
+        return done
+
+    def get(self, stage: str, boundary_id: str):
+        """Entry of an area as a dictionary, None if the area was never processed"""
+        with self._lock:
+            cursor = self._conn.execute('SELECT * FROM progress WHERE stage = ? AND boundary_id = ?',
+                                        (stage, str(boundary_id)))
+            row = cursor.fetchone()
+            columns = [x[0] for x in cursor.description]
+        return dict(zip(columns, row)) if row is not None else None
+
+    def is_done(self, stage: str, boundary_id: str, input_hash: str = None) -> bool:
+        """Check if an area is completed with its output in place (from the same input, if `input_hash` is given)"""
+        entry = self.get(stage, boundary_id)
+        if entry is None or entry['status'] != DONE:
+            return False
+        if not output_intact(entry['output_path'], entry['output_size']):
+            return False
+        return input_hash is None or entry['input_hash'] == input_hash
+
+    def entries(self, stage: str, prefix: str = ''):
+        """Entries of a stage whose boundary id starts with `prefix` (etc: AGS of a district)"""
+        with self._lock:
+            cursor = self._conn.execute('SELECT * FROM progress WHERE stage = ? AND substr(boundary_id, 1, ?) = ? '
+                                        'ORDER BY boundary_id', (stage, len(prefix), prefix))
+            rows = cursor.fetchall()
+            columns = [x[0] for x in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def record(self, stage: str, boundary_id: str, status: str = DONE, rows: int = None,
+               input_hash: str = None, duration: float = None, output_path: str = None, error: str = None):
+        """Insert or replace the entry of an area"""
+        output_size = os.path.getsize(output_path) if output_path and os.path.exists(output_path) else None
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO progress VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               (stage, str(boundary_id), status, rows, input_hash, duration,
+                                output_path, output_size, error, time.time()))
+
+    def record_stats(self, stage: str, boundary_id: str, stats: dict):
+        """Replace the summary of an area (building type -> (buildings, surface area), see `area_stats`)"""
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.execute('DELETE FROM area_stats WHERE stage = ? AND boundary_id = ?',
+                                   (stage, str(boundary_id)))
+                self._conn.executemany('INSERT INTO area_stats VALUES (?, ?, ?, ?, ?)',
+                                       [(stage, str(boundary_id), building_type, buildings, surface_area)
+                                        for building_type, (buildings, surface_area) in stats.items()])
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def stats(self, stage: str, prefix: str = ''):
+        """
+        Summary of the done areas of a stage whose boundary id starts with `prefix`
+        Returns:
+            dictionary of boundary id -> {building type: (buildings, surface area)}, areas without summary left out
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT s.boundary_id, s.building_type, s.buildings, s.surface_area, '
+                                      'p.output_path, p.output_size '
+                                      'FROM area_stats s JOIN progress p '
+                                      'ON p.stage = s.stage AND p.boundary_id = s.boundary_id '
+                                      'WHERE s.stage = ? AND p.status = ? AND substr(s.boundary_id, 1, ?) = ?',
+                                      (stage, DONE, len(prefix), prefix)).fetchall()
+        result = {}
+        for boundary_id, building_type, buildings, surface_area, output_path, output_size in rows:
+            if output_intact(output_path, output_size):
+                result.setdefault(boundary_id, {})[building_type] = (buildings, surface_area)
+        return result
+
+    @contextmanager
+    def track(self, stage: str, boundary_id: str, input_hash: str = None):
+        """
+        Record the outcome of processing an area: done if the block completes, failed if it raises
+        The block fills the yielded dictionary with `rows`, `output_path` and optionally `stats` (see `area_stats`)
+        """
+        result = {}
+        start = time.monotonic()
+        try:
+            yield result
+        except Exception as e:
+            self.record(stage, boundary_id, FAILED, input_hash=input_hash,
+                        duration=time.monotonic() - start, error=str(e))
+            raise
+        # summary first: a done area never comes with the summary of a previous run
+        self.record_stats(stage, boundary_id, result.get('stats', {}))
+        self.record(stage, boundary_id, DONE, rows=result.get('rows'), input_hash=input_hash,
+                    duration=time.monotonic() - start, output_path=result.get('output_path'))
+
+    def bootstrap(self, stage: str, store):
+        """
+        Import the outputs of runs before the manifest existed (see `BuildingStore.existing`)
+        Only done once per stage, empty files are not imported
+        """
+        with self._lock:
+            known = self._conn.execute('SELECT COUNT(*) FROM progress WHERE stage = ?', (stage,)).fetchone()[0]
+        if known:
+            return
+
+        outputs = store.existing()
+        for boundary_id, output_path in outputs.items():
+            self.record(stage, boundary_id, DONE, output_path=output_path)
+        if outputs:
+            log.info(f'Imported {len(outputs)} existing output(s) of {stage} into the progress manifest')
+
+
+def output_intact(output_path: str, output_size: int) -> bool:
+    """
+    Check if the output recorded for a done area is still in place: same file size as when it was recorded
+    Entries without output file (etc: region change lists) are always intact
+    """
+    if output_path is None:
+        return True
+    try:
+        return os.path.getsize(output_path) == output_size
+    except OSError:
+        return False
+
+
+def file_fingerprint(*paths) -> str:
+    """Hash of the name, size and modification time of input files (missing files included as such)"""
+    digest = hashlib.sha256()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f'{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+        except OSError:
+            digest.update(f'{os.path.basename(path)}:missing;'.encode())
+    return digest.hexdigest()
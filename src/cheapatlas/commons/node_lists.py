@@ -0,0 +1,76 @@
+"""
+Bulk conversion of the OSM `nodes` column (node ids of a way) between stages
+
+Node lists are held as an Arrow list<int64> array: one offsets buffer plus one flat int64 values
+buffer, no Python object per row. In dataframes the column has the `pd.ArrowDtype(list<int64>)`
+dtype, Parquet files store it as is and CSV files as "[1, 2, 3]" text, parsed in bulk.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+NODES_COLUMN = 'nodes'
+NODE_LIST_TYPE = pa.list_(pa.int64())
+
+
+def is_node_list_column(series: pd.Series) -> bool:
+    """Check if a column holds node lists: named "nodes" or an Arrow list column"""
+    if series.name == NODES_COLUMN:
+        return True
+    return isinstance(series.dtype, pd.ArrowDtype) and pa.types.is_list(series.dtype.pyarrow_dtype)
+
+
+def to_node_list_array(values) -> pa.ListArray:
+    """
+    Node lists as an Arrow list<int64> array
+
+    Args:
+        values: Arrow backed series, lists/arrays of ids, "[1, 2]" text (CSV files) or missing values
+    Returns:
+        list<int64> array, null where missing
+    """
+    if isinstance(values, pd.Series) and isinstance(values.dtype, pd.ArrowDtype):
+        array = pa.array(values.array)
+        if isinstance(array, pa.ChunkedArray):
+            array = array.combine_chunks()
+        return array.cast(NODE_LIST_TYPE)
+
+    values = pd.Series(values, dtype=object).to_numpy()
+    is_text = np.fromiter((isinstance(x, str) for x in values), dtype=bool, count=len(values))
+    if is_text.any():
+        return parse_node_lists(values)
+    is_list = np.fromiter((isinstance(x, (list, tuple, np.ndarray)) for x in values), dtype=bool, count=len(values))
+    # lists are converted by Arrow in C++, missing values (None, NaN) become nulls
+    return pa.array(np.where(is_list, values, None), type=NODE_LIST_TYPE)
+
+
+def parse_node_lists(values) -> pa.ListArray:
+    """
+    Parse "[1, 2, 3]" node lists in bulk (one split of the joined column, no callback per row)
+    Lists of quoted ids ("['1', '2']", written by earlier releases) are accepted as well
+    """
+    text = pd.Series(values, dtype=object)
+    missing = text.isna().to_numpy()
+    stripped = text.fillna('').astype(str).str.replace(r"[\[\]' ]", '', regex=True)
+    lengths = np.where(stripped == '', 0, stripped.str.count(',') + 1)
+
+    offsets = np.zeros(len(text) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    joined = ','.join(stripped[lengths > 0])
+    ids = np.array(joined.split(','), dtype=np.int64) if joined else np.empty(0, dtype=np.int64)
+
+    # a null offset makes the list at its position null
+    mask = np.append(missing, False)
+    return pa.ListArray.from_arrays(pa.array(offsets, mask=mask), pa.array(ids))
+
+
+def format_node_lists(array: pa.ListArray) -> np.ndarray:
+    """Node lists as "[1, 2, 3]" text (CSV files), None where missing"""
+    joined = pc.binary_join(array.cast(pa.list_(pa.string())), ', ')
+    return pc.binary_join_element_wise('[', joined, ']', '').to_numpy(zero_copy_only=False)
+
+
+def node_list_series(values, index=None) -> pd.Series:
+    """Arrow backed `pd.ArrowDtype(list<int64>)` series of node lists (see `to_node_list_array`)"""
+    return pd.Series(pd.arrays.ArrowExtensionArray(to_node_list_array(values)), index=index)
@@ -0,0 +1,92 @@
+"""
+Extraction of building objects per area (PLZ/AGS) straight from OSM region dumps (Geofabrik)
+
+Boundaries and buildings are read from the dump with pyrosm. Every building is assigned to the area
+containing its center with one vectorised point-in-polygon spatial join (geopandas, STRtree index).
+"""
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+# boundary type -> (pyrosm boundary type, tag holding the area id)
+BOUNDARY_TAGS = {'ags': ('administrative', 'de:amtlicher_gemeindeschluessel'),
+                 'plz': ('postal_code', 'postal_code')}
+
+# tags not read by pyrosm by default
+EXTRA_BUILDING_TAGS = ['source', 'addr:suburb']
+
+
+def read_boundaries(osm, boundary_type: str, boundary_ids=None):
+    """
+    Read the area polygons of a region dump
+
+    Args:
+        osm: pyrosm OSM parser of the region dump
+        boundary_type: PLZ or AGS
+        boundary_ids: keep only these areas (all if None)
+    Returns:
+        GeoDataFrame with columns [boundary_type, geometry]
+    """
+    pyrosm_type, tag = BOUNDARY_TAGS[boundary_type]
+    boundaries = osm.get_boundaries(boundary_type=pyrosm_type, extra_attributes=[tag])
+    if boundaries is None or tag not in boundaries.columns:
+        return gpd.GeoDataFrame({boundary_type: [], 'geometry': []}, geometry='geometry', crs='EPSG:4326')
+
+    boundaries = boundaries[boundaries[tag].notna()].rename(columns={tag: boundary_type})
+    if boundary_ids is not None:
+        boundaries = boundaries[boundaries[boundary_type].isin(boundary_ids)]
+    return boundaries[[boundary_type, 'geometry']].reset_index(drop=True)
+
+
+def assign_buildings(buildings, boundaries, boundary_type: str, columns):
+    """
+    Assign buildings to the area containing their center (bounding box center, as Overpass `out center`)
+
+    Args:
+        buildings: GeoDataFrame of pyrosm buildings (id, osm_type, tags as columns, geometry)
+        boundaries: GeoDataFrame with columns [boundary_type, geometry]
+        boundary_type: PLZ or AGS
+        columns: standard column set of building objects (etc: 'type', 'id', 'center.lat', 'tags.building')
+    Returns:
+        DataFrame with `columns` and boundary_type, buildings outside of all areas are dropped
+    """
+    bounds = buildings.geometry.bounds
+    lon = ((bounds['minx'] + bounds['maxx']) / 2).to_numpy()
+    lat = ((bounds['miny'] + bounds['maxy']) / 2).to_numpy()
+    centers = gpd.GeoDataFrame(geometry=gpd.points_from_xy(lon, lat), crs=boundaries.crs)
+
+    joined = gpd.sjoin(centers, boundaries, how='inner', predicate='within')
+    # A center on the border of 2 areas belongs to the first one only
+    joined = joined[~joined.index.duplicated(keep='first')]
+
+    df = pd.DataFrame(index=np.arange(len(joined)))
+    rows = joined.index.to_numpy()
+    for column in columns:
+        if column == 'type':
+            df[column] = buildings['osm_type'].to_numpy()[rows]
+        elif column == 'id':
+            df[column] = buildings['id'].to_numpy(dtype=np.int64)[rows]
+        elif column in ('center.lat', 'center.lon'):
+            values = (lat if column == 'center.lat' else lon)[rows]
+            # Like `out center`, nodes have coordinates but no center
+            df[column] = np.where(buildings['osm_type'].to_numpy()[rows] == 'node', np.nan, values)
+        elif column.startswith('tags.') and column[5:] in buildings.columns:
+            df[column] = buildings[column[5:]].to_numpy()[rows]
+        else:
+            df[column] = None
+    df[boundary_type] = joined[boundary_type].to_numpy()
+    return df
+
+
+def extract_buildings(osm, boundary_type: str, columns, boundary_ids=None):
+    """
+    Read the buildings of a region dump and assign them to their PLZ/AGS area
+
+    Returns:
+        DataFrame with `columns` and boundary_type (empty if the dump has no areas/buildings)
+    """
+    boundaries = read_boundaries(osm, boundary_type, boundary_ids)
+    buildings = osm.get_buildings(extra_attributes=EXTRA_BUILDING_TAGS) if len(boundaries) else None
+    if buildings is None or len(buildings) == 0:
+        return pd.DataFrame(columns=list(columns) + [boundary_type])
+    return assign_buildings(buildings, boundaries, boundary_type, columns)
@@ -0,0 +1,354 @@
+"""
+Incremental parser for Overpass API JSON and CSV output
+
+Elements are decoded one by one from a stream of byte chunks and collected into
+fixed-size batches of typed column buffers, so peak memory is bounded by the batch size
+rather than by the size of the response.
+CSV output is read in chunks by the vectorised pandas CSV reader.
+Footprints of `out geom` output are encoded as (hex) WKB.
+"""
+import codecs
+import io
+import json
+import re
+import struct
+from array import array
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from shapely.geometry import LineString
+from shapely.ops import polygonize, unary_union
+
+from src.cheapatlas.commons.geometry import GEOMETRY_COLUMN
+from src.cheapatlas.commons.node_lists import NODES_COLUMN
+
+ELEMENTS_START = re.compile(r'"elements"\s*:\s*\[')
+REMARK = re.compile(r'"remark"\s*:\s*')
+WHITESPACE = ' \t\n\r,'
+
+# columns decoded into numeric buffers, everything else is kept as python objects
+INT_COLUMNS = ('id',)
+FLOAT_COLUMNS = ('center.lat', 'center.lon', 'lat', 'lon')
+# footprint of `out geom` elements (GEOMETRY_COLUMN) is kept as hex WKB, node ids of ways (NODES_COLUMN)
+# as a list<int64> column
+
+
+# derived element closing a CSV response, missing if the query stopped early (etc: timeout)
+END_MARKER = 'end_marker'
+
+
+class OverpassError(Exception):
+    """Raised when an Overpass response is malformed or reports a runtime error (remark)"""
+
+
+class ChunkStream(io.RawIOBase):
+    """Read-only binary file object over an iterator of byte chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            self._buf = next(self._chunks, None)
+            if self._buf is None:
+                self._buf = b''
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def iter_file_chunks(f, chunk_size: int = 2 ** 16):
+    """Read a binary file-like object as an iterator of byte chunks"""
+    return iter(lambda: f.read(chunk_size), b'')
+
+
+def iter_elements(chunks):
+    """
+    Yield the members of the top-level "elements" array of an Overpass JSON response
+
+    Args:
+        chunks: iterable of raw (utf-8) byte chunks of the response body
+    Raises:
+        OverpassError: no "elements" array in the response, or a runtime error remark
+            (etc: query timed out / out of memory) after the elements
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = next(chunks, None)
+        eof = chunk is None
+        buf = buf[pos:] + text_decoder.decode(chunk or b'', final=eof)
+        pos = 0
+
+    # Skip the header (version, generator, osm3s) up to the elements array
+    while True:
+        match = ELEMENTS_START.search(buf, pos)
+        if match:
+            pos = match.end()
+            break
+        if eof:
+            raise OverpassError(f'No elements in Overpass response: {buf[:200]}')
+        pos = max(len(buf) - 32, 0)  # key may be split between 2 chunks
+        fill()
+
+    # Decode elements one by one
+    while True:
+        while pos < len(buf) and buf[pos] in WHITESPACE:
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                raise OverpassError('Truncated Overpass response')
+            fill()
+            continue
+        if buf[pos] == ']':
+            pos += 1
+            break
+        try:
+            element, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise OverpassError('Truncated Overpass response')
+            fill()
+            continue
+        yield element
+
+    # Only the trailer (etc: remark) is left
+    while not eof:
+        fill()
+    match = REMARK.search(buf, pos)
+    if match:
+        remark, _ = decoder.raw_decode(buf, match.end())
+        if 'error' in remark:
+            raise OverpassError(remark)
+
+
+def iter_batches(elements, batch_size: int):
+    """Group an iterable of elements into lists of at most `batch_size` elements"""
+    batch = []
+    for element in elements:
+        batch.append(element)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def elements_to_frame(elements, columns):
+    """
+    Flatten Overpass elements into a dataframe with exactly `columns`
+    Nested keys are addressed like in `pd.json_normalize` (etc: 'center.lat', 'tags.building')
+    Node lists go straight into offsets + int64 values buffers (list<int64> column)
+    """
+    paths = [column.split('.', 1) for column in columns]
+    buffers = {}
+    for column in columns:
+        if column == NODES_COLUMN:
+            buffers[column] = (array('q', [0]), array('q'), bytearray())
+        elif column in INT_COLUMNS:
+            buffers[column] = array('q')
+        elif column in FLOAT_COLUMNS:
+            buffers[column] = array('d')
+        else:
+            buffers[column] = []
+
+    for element in elements:
+        for column, path in zip(columns, paths):
+            if column == GEOMETRY_COLUMN:
+                buffers[column].append(element_wkb(element))
+                continue
+            if column == NODES_COLUMN:
+                offsets, values, missing = buffers[column]
+                nodes = element.get(NODES_COLUMN)
+                values.extend(nodes or ())
+                offsets.append(len(values))
+                missing.append(nodes is None)
+                continue
+            value = element.get(path[0])
+            if len(path) > 1:
+                value = value.get(path[1]) if value is not None else None
+            if value is None and path[0] == 'center' and 'bounds' in element:
+                # `out geom` has no center, use the center of the bounding box like `out center`
+                bounds = element['bounds']
+                value = (bounds['min' + path[1]] + bounds['max' + path[1]]) / 2
+            if column in INT_COLUMNS:
+                buffers[column].append(value if value is not None else 0)
+            elif column in FLOAT_COLUMNS:
+                buffers[column].append(value if value is not None else np.nan)
+            else:
+                buffers[column].append(value)
+
+    data = {}
+    for column, buffer in buffers.items():
+        if column == NODES_COLUMN:
+            offsets, values, missing = buffer
+            # a null offset makes the list at its position null (elements without nodes)
+            mask = np.append(np.frombuffer(missing, dtype=bool), False)
+            nodes = pa.ListArray.from_arrays(pa.array(np.frombuffer(offsets, dtype=np.int64), mask=mask),
+                                             pa.array(np.frombuffer(values, dtype=np.int64)))
+            data[column] = pd.arrays.ArrowExtensionArray(nodes)
+        elif column in INT_COLUMNS:
+            data[column] = np.array(buffer, dtype=np.int64)
+        elif column in FLOAT_COLUMNS:
+            data[column] = np.array(buffer, dtype=np.float64)
+        else:
+            data[column] = pd.Series(buffer, dtype=object)
+    return pd.DataFrame(data, columns=list(columns))
+
+
+def element_wkb(element):
+    """
+    Encode the `out geom` geometry of an Overpass element as hex WKB, None without geometry
+        - node: point
+        - closed way: polygon, open way: line string
+        - relation: (multi)polygon of its outer minus inner member ways
+    """
+    if element.get('type') == 'node':
+        if element.get('lat') is None:
+            return None
+        return struct.pack('<BIdd', 1, 1, element['lon'], element['lat']).hex()
+
+    if element.get('type') == 'way':
+        coords = [(point['lon'], point['lat']) for point in element.get('geometry') or [] if point]
+        if len(coords) < 2:
+            return None
+        flat = [value for point in coords for value in point]
+        if len(coords) >= 4 and coords[0] == coords[-1]:
+            header = struct.pack('<BIII', 1, 3, 1, len(coords))
+        else:
+            header = struct.pack('<BII', 1, 2, len(coords))
+        return (header + struct.pack(f'<{len(flat)}d', *flat)).hex()
+
+    if element.get('type') == 'relation':
+        rings = {'outer': [], 'inner': []}
+        for member in element.get('members', []):
+            coords = [(point['lon'], point['lat']) for point in member.get('geometry') or [] if point]
+            if member.get('type') == 'way' and len(coords) >= 2:
+                rings['inner' if member.get('role') == 'inner' else 'outer'].append(LineString(coords))
+        outer = unary_union(list(polygonize(rings['outer'])))
+        if outer.is_empty:
+            return None
+        if rings['inner']:
+            outer = outer.difference(unary_union(list(polygonize(rings['inner']))))
+        return outer.wkb_hex
+
+    return None
+
+
+def iter_frames(chunks, columns, batch_size: int = 10000):
+    """Stream an Overpass JSON response as dataframes of at most `batch_size` rows with `columns`"""
+    for batch in iter_batches(iter_elements(chunks), batch_size):
+        yield elements_to_frame(batch, columns)
+
+
+def iter_area_frames(chunks, columns, marker: str, key: str, batch_size: int = 10000):
+    """
+    Stream a multi-area Overpass JSON response as (area id, dataframe) pairs
+    Result sets of the areas are separated by derived marker elements (`make <marker> <key>=<area id>`),
+    every element belongs to the area of the last marker before it
+
+    Raises:
+        OverpassError: element before the first marker (its area is unknown)
+    """
+    area_id = None
+    batch = []
+    for element in iter_elements(chunks):
+        if element.get('type') == marker:
+            if batch:
+                yield area_id, elements_to_frame(batch, columns)
+                batch = []
+            area_id = element['tags'][key]
+            continue
+        if area_id is None:
+            raise OverpassError(f'{element.get("type")} {element.get("id")} before the first area marker')
+        batch.append(element)
+        if len(batch) >= batch_size:
+            yield area_id, elements_to_frame(batch, columns)
+            batch = []
+    if batch:
+        yield area_id, elements_to_frame(batch, columns)
+
+
+def csv_fields(columns, key: str = None):
+    """
+    Render the field list of `[out:csv(...)]` for the standard `columns`
+    `key` adds the tag holding the boundary id of multi-area markers
+    """
+    fields = []
+    for column in columns:
+        if column in ('type', 'id'):
+            fields.append(f'::{column}')
+        elif column in ('center.lat', 'center.lon'):
+            fields.append(f'::{column.split(".")[1]}')
+        elif column.startswith('tags.'):
+            fields.append(f'"{column[5:]}"')
+    if key is not None:
+        fields.append(f'"{key}"')
+    return ', '.join(fields)
+
+
+def iter_csv_frames(chunks, columns, batch_size: int = 10000, marker: str = None, key: str = None):
+    """
+    Stream an Overpass `[out:csv(<csv_fields>; true; "\\t")]` response as (area id, dataframe) pairs
+    with exactly `columns`. Columns without CSV field (etc: nodes) are left empty.
+    Rows belong to the area of the last `marker` row before them, or to area None without marker.
+
+    Raises:
+        OverpassError: response does not end with the end marker (query stopped early),
+            or a row comes before the first `marker` row (its area is unknown)
+    """
+    reader = pd.read_csv(io.BufferedReader(ChunkStream(chunks)), sep='\t', dtype=str,
+                         chunksize=batch_size, keep_default_na=False, na_values=[''],
+                         quoting=3)  # csv.QUOTE_NONE, Overpass does not quote values
+    rename = {'@type': 'type', '@id': 'id', '@lat': 'center.lat', '@lon': 'center.lon'}
+
+    area_id = None
+    complete = False
+    for df in reader:
+        if complete:
+            raise OverpassError('Unexpected rows after the end of the Overpass response')
+        is_end = (df['@type'] == END_MARKER).to_numpy()
+        complete = bool(is_end.any())
+        df = df[~is_end]
+
+        if marker is not None:
+            # Forward fill the boundary id of the marker rows
+            is_marker = (df['@type'] == marker).to_numpy()
+            area = df[key].where(is_marker).ffill()
+            if area_id is not None:
+                area = area.fillna(area_id)
+            area_id = area.iloc[-1] if len(area) else area_id
+            df, area = df[~is_marker], area[~is_marker]
+            if area.isna().any():
+                row = df[area.isna()].iloc[0]
+                raise OverpassError(f'{row["@type"]} {row["@id"]} before the first area marker')
+
+        df = df.rename(columns=lambda x: rename.get(x, f'tags.{x}'))
+        df['id'] = df['id'].astype(np.int64)
+        # Like `out center` in JSON, nodes have coordinates but no center
+        is_node = (df['type'] == 'node').to_numpy()
+        for column in ('center.lat', 'center.lon'):
+            df[column] = pd.to_numeric(df[column]).where(~is_node)
+        df = df.reindex(columns=list(columns))
+
+        if marker is None:
+            yield None, df.reset_index(drop=True)
+            continue
+        for group_id, group_df in df.groupby(area.to_numpy(), sort=False):
+            yield group_id, group_df.reset_index(drop=True)
+
+    if not complete:
+        raise OverpassError('Incomplete Overpass CSV response (query timed out or ran out of memory)')
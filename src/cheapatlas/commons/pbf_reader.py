@@ -0,0 +1,94 @@
+"""
+Streaming reader of the buildings of an OSM region dump (pyosmium)
+
+Unlike `pyrosm.OSM.get_buildings`, a region is never materialised as a whole: buildings are yielded
+in chunks whose estimated size is bounded by `max_chunk_mb`, so peak memory is the node location index
+plus one chunk. `sparse_file_array,<file>` keeps the node locations on disk for regions too large for memory.
+Footprints are assembled by osmium (closed ways and multipolygon relations) and decoded in bulk per chunk.
+"""
+import json
+
+import numpy as np
+import osmium
+import pandas as pd
+import shapely
+
+from src.cheapatlas.commons.geometry import GEOMETRY_COLUMN
+
+import logging
+log = logging.getLogger(__name__)
+
+BUILDING_KEY = 'building'
+# same names as the columns of `pyrosm.OSM.get_buildings`, other tags as JSON in "tags"
+COLUMNS = ('id', 'osm_type', 'timestamp', BUILDING_KEY, 'tags', GEOMETRY_COLUMN)
+# estimated bytes of a building beside its footprint (id, timestamp, tags, python objects)
+ROW_OVERHEAD = 400
+
+
+def iter_buildings(pbf_path: str, max_chunk_mb: float = 64, node_index: str = 'flex_mem', bbox=None):
+    """
+    Yield the buildings of a region dump chunk by chunk
+
+    Args:
+        pbf_path: location of the region dump
+        max_chunk_mb: memory ceiling (estimated) of a chunk
+        node_index: osmium node location index (etc: flex_mem, sparse_file_array,data/nodes.idx)
+        bbox: (min lon, min lat, max lon, max lat), only buildings intersecting it if given
+    Yields:
+        DataFrame with COLUMNS, footprints as shapely geometries (polygons, multipolygons, points, lines)
+    """
+    wkb = osmium.geom.WKBFactory()
+    processor = (osmium.FileProcessor(pbf_path)
+                 .with_locations(osmium.index.create_map(node_index))
+                 .with_areas(osmium.filter.KeyFilter(BUILDING_KEY))
+                 # locations and areas are resolved first, only buildings are handed over to Python
+                 .with_filter(osmium.filter.KeyFilter(BUILDING_KEY)))
+
+    rows, size, skipped = [], 0, 0
+    for obj in processor:
+        try:
+            if obj.is_area():
+                # closed ways come back as areas, the ways themselves are skipped below
+                row = (obj.orig_id(), 'way' if obj.from_way() else 'relation', wkb.create_multipolygon(obj))
+            elif obj.is_node():
+                row = (obj.id, 'node', wkb.create_point(obj))
+            elif obj.is_way() and not obj.is_closed():
+                row = (obj.id, 'way', wkb.create_linestring(obj))
+            else:
+                continue
+        except RuntimeError:
+            # invalid footprint (etc: missing nodes at the border of the extract)
+            skipped = skipped + 1
+            continue
+
+        tags = {tag.k: tag.v for tag in obj.tags}
+        building = tags.pop(BUILDING_KEY)
+        rows.append(row + (int(obj.timestamp.timestamp()), building, json.dumps(tags) if tags else None))
+        size = size + len(row[2]) // 2 + ROW_OVERHEAD
+        if size >= max_chunk_mb * 2 ** 20:
+            yield buildings_frame(rows, bbox)
+            rows, size = [], 0
+
+    if rows:
+        yield buildings_frame(rows, bbox)
+    if skipped:
+        log.info(f'Skipped {skipped} buildings without valid footprint in {pbf_path}')
+
+
+def buildings_frame(rows, bbox=None) -> pd.DataFrame:
+    """Chunk of buildings, hex WKB footprints decoded in bulk (single polygons as Polygon like pyrosm)"""
+    ids, osm_types, hex_wkb, timestamps, building, tags = zip(*rows)
+    geometry = shapely.from_wkb(np.array(hex_wkb, dtype=object))
+    is_single = (shapely.get_type_id(geometry) == shapely.GeometryType.MULTIPOLYGON) & \
+                (shapely.get_num_geometries(geometry) == 1)
+    geometry[is_single] = shapely.get_geometry(geometry[is_single], 0)
+
+    df = pd.DataFrame({'id': np.array(ids, dtype=np.int64),
+                       'osm_type': osm_types,
+                       'timestamp': np.array(timestamps, dtype=np.int64),
+                       BUILDING_KEY: building,
+                       'tags': tags,
+                       GEOMETRY_COLUMN: geometry}, columns=list(COLUMNS))
+    if bbox is not None:
+        df = df[shapely.intersects(geometry, shapely.box(*bbox))].reset_index(drop=True)
+    return df
@@ -0,0 +1,235 @@
+"""
+Adaptive rate control for throttled HTTP endpoints (e.g. Overpass API)
+
+- Exponential backoff with full jitter between failed attempts
+- Honours `Retry-After` headers of 429/503/504 responses
+- Grows and shrinks the number of in-flight requests (AIMD) based on observed throttling
+- Reads the free slot information of the Overpass `/api/status` endpoint
+"""
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import requests
+
+import logging
+log = logging.getLogger(__name__)
+
+THROTTLE_STATUS = (429, 503, 504)
+
+
+class RateController:
+    """
+    Thread-safe concurrency limiter shared by all crawling workers
+
+    Args:
+        max_concurrency: upper bound of in-flight requests
+        min_concurrency: lower bound of in-flight requests
+        backoff_base: base delay (seconds) of the exponential backoff
+        backoff_max: maximum delay (seconds) between two attempts
+    """
+
+    def __init__(self, max_concurrency: int = 1, min_concurrency: int = 1,
+                 backoff_base: float = 1.0, backoff_max: float = 120.0):
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.min_concurrency = min(max(int(min_concurrency), 1), self.max_concurrency)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.limit = float(self.max_concurrency)
+        self._active = 0
+        self._blocked_until = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def concurrency(self) -> int:
+        return max(int(self.limit), self.min_concurrency)
+
+    def acquire(self):
+        """Block until a request slot is free and no pause is in effect"""
+        with self._cond:
+            while True:
+                wait = self._blocked_until - time.monotonic()
+                if wait <= 0 and self._active < self.concurrency:
+                    self._active += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self):
+        """Additive increase: one more slot per window of successful requests"""
+        with self._cond:
+            self.limit = min(self.limit + 1 / self.limit, float(self.max_concurrency))
+            self._cond.notify_all()
+
+    def on_throttle(self, retry_after: float = None):
+        """Multiplicative decrease, pausing all workers for `retry_after` seconds if given"""
+        with self._cond:
+            before = self.concurrency
+            self.limit = max(self.limit / 2, float(self.min_concurrency))
+            after = self.concurrency
+            if retry_after:
+                self.pause(retry_after)
+        # once per reduction, not for every throttled attempt at the lower bound
+        if after < before:
+            log.warning(f'Endpoint is throttling, reduce concurrency to {after}')
+
+    def pause(self, seconds: float):
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        """Delay before the next attempt: `Retry-After` if given, else capped exponential with full jitter"""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_base * 2 ** attempt, self.backoff_max))
+
+    def update_from_status(self, status_text: str):
+        """
+        Adjust to the slot information of the Overpass `/api/status` endpoint
+            - "Rate limit: N" caps the concurrency
+            - no slot available now ==> pause until the next slot is free
+        """
+        rate_limit, available, wait = parse_overpass_status(status_text)
+
+        with self._cond:
+            if rate_limit:
+                self.max_concurrency = min(self.max_concurrency, rate_limit)
+                self.min_concurrency = min(self.min_concurrency, self.max_concurrency)
+                self.limit = min(self.limit, float(self.max_concurrency))
+        if available == 0 and wait is not None:
+            self.pause(wait)
+
+
+def parse_retry_after(value) -> float:
+    """Parse a `Retry-After` header given as seconds or HTTP date. Return None if missing/invalid"""
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_overpass_status(status_text: str):
+    """
+    Extract (rate_limit, available_slots, seconds_until_next_slot) from Overpass `/api/status` output
+    Missing information is returned as None
+    """
+    rate_limit = re.search(r'Rate limit: (\d+)', status_text)
+    available = re.search(r'(\d+) slots? available now', status_text)
+    waits = [int(x) for x in re.findall(r'in (-?\d+) seconds', status_text)]
+
+    rate_limit = int(rate_limit.group(1)) if rate_limit else None
+    if available:
+        available = int(available.group(1))
+    elif waits:
+        available = 0
+    else:
+        available = None
+
+    return rate_limit, available, (max(min(waits), 0) if waits else None)
+
+
+def request_with_backoff(session, url: str, controller: RateController,
+                         max_retries: int = 3, status_url: str = None, **kwargs):
+    """
+    Send a GET request through the rate controller, retrying throttled (429/503/504), failed (5xx)
+    or unreachable attempts. Other client errors (etc: 400 bad query, 404) are not retried
+
+    Args:
+        session: requests session (or the `requests` module)
+        url: target url
+        controller: rate controller shared by all workers
+        max_retries: number of retries after the first attempt
+        status_url: optional Overpass `/api/status` url, polled after throttling
+        kwargs: passed to `session.get`. With `stream=True` the request slot is held until the body is read:
+            it is released when the returned response is closed (etc: `with response:`)
+    Returns:
+        response with status 200, or None if all attempts failed
+    Raises:
+        requests.HTTPError: client error response
+    """
+    for attempt in range(max_retries + 1):
+        retry_after = None
+        controller.acquire()
+        try:
+            response = session.get(url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            log.warning(e)
+            response = None
+        except BaseException:
+            controller.release()
+            raise
+
+        if response is not None and response.status_code == 200:
+            controller.on_success()
+            if kwargs.get('stream'):
+                hold_slot(response, controller)
+            else:
+                controller.release()
+            return response
+
+        if response is not None:
+            # read the (short) error body, so that closing hands the connection back to the pool
+            try:
+                response.content
+            except requests.exceptions.RequestException as e:
+                log.warning(e)
+            response.close()
+        controller.release()
+
+        if response is not None and response.status_code in THROTTLE_STATUS:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            controller.on_throttle(retry_after)
+            if status_url is not None:
+                try:
+                    controller.update_from_status(session.get(status_url).text)
+                except requests.exceptions.RequestException as e:
+                    log.warning(e)
+        elif response is not None and response.status_code < 500:
+            # the same request would fail again
+            log.error(f'{url} answered {response.status_code} {response.reason}, not retried')
+            response.raise_for_status()
+            raise requests.HTTPError(f'Unexpected status {response.status_code} for url: {url}', response=response)
+
+        if attempt < max_retries:
+            time.sleep(controller.backoff(attempt, retry_after))
+
+    return None
+
+
+def hold_slot(response, controller: RateController):
+    """Release the request slot of a streamed response once it is closed (body read or abandoned)"""
+    close = response.close
+    released = threading.Event()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if not released.is_set():
+                released.set()
+                controller.release()
+
+    response.close = close_and_release
@@ -0,0 +1,186 @@
+"""
+Cache of the buildings parsed from OSM region dumps (Geofabrik)
+
+Parsing a region dump takes minutes, the parsed buildings (id, geometry, timestamp, tags) are therefore
+kept as one GeoParquet file per dump, keyed by the size, modification time and md5 of the dump.
+A dump with the same size and modification time is a hit without reading it, a touched dump
+(etc: downloaded again) is a hit only if its md5 did not change.
+
+Two readers fill the cache:
+- pyrosm: the whole region is parsed in memory (`pyrosm.OSM.get_buildings`) and returned as a GeoDataFrame
+- stream: buildings are streamed in bounded chunks into the cache (see `pbf_reader`), the region is never held
+  in memory. The buildings of an area are spread over the whole id range of the region, an id filter on the
+  Parquet file would decompress almost all of it for every area: the cache therefore comes with an
+  uncompressed, memory-mapped copy (Arrow IPC, see `region_table`) published once per cached region, areas
+  find their rows through its id index and only these pages are read (`RegionBuildings.select`)
+"""
+import json
+import os
+
+import geopandas as gpd
+import pyarrow.parquet as pq
+from pyrosm import OSM
+
+from src.cheapatlas.commons.building_store import AtomicParquetWriter, read_parquet_partition
+from src.cheapatlas.commons.downloader import file_md5
+from src.cheapatlas.commons.pbf_reader import iter_buildings
+from src.cheapatlas.commons.region_table import RegionTable, publish_region_table
+
+import logging
+log = logging.getLogger(__name__)
+
+READERS = ('pyrosm', 'stream')
+# schema metadata key holding the key of the cached dump
+SOURCE_METADATA = b'cheapatlas.source'
+CRS = 'EPSG:4326'
+
+
+class RegionCache:
+    """
+    Args:
+        folder: location of the cached regions (etc: data/01_raw/geofabrik_buildings)
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def path(self, pbf_path: str) -> str:
+        name = os.path.basename(pbf_path)
+        for suffix in ('.osm.pbf', '.pbf'):
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+                break
+        return os.path.join(self.folder, f'{name}.parquet')
+
+    def table_path(self, pbf_path: str) -> str:
+        """Memory-mapped copy of the cached buildings read by the areas"""
+        return os.path.splitext(self.path(pbf_path))[0] + '.arrow'
+
+    def is_current(self, pbf_path: str) -> bool:
+        """Check if the buildings of a region dump are cached and the dump did not change since"""
+        path = self.path(pbf_path)
+        if not os.path.exists(path):
+            return False
+        try:
+            metadata = pq.read_schema(path).metadata or {}
+            cached = json.loads(metadata[SOURCE_METADATA])
+        except (OSError, KeyError, ValueError):
+            log.warning(f'Can not read the key of cached region {path}, parsing the dump again')
+            return False
+
+        stat = os.stat(pbf_path)
+        if stat.st_size != cached['size']:
+            return False
+        return stat.st_mtime_ns == cached['mtime_ns'] or file_md5(pbf_path) == cached['md5']
+
+    def load(self, pbf_path: str):
+        """
+        Buildings of a region dump parsed before
+
+        Returns:
+            GeoDataFrame, None if the dump is not cached or changed since
+        """
+        if not self.is_current(pbf_path):
+            return None
+        return gpd.GeoDataFrame(read_parquet_partition(self.path(pbf_path)), geometry='geometry', crs=CRS)
+
+    def save(self, pbf_path: str, buildings):
+        """Cache the buildings parsed from a region dump (replaces the previous version atomically)"""
+        self.build(pbf_path, [buildings])
+
+    def build(self, pbf_path: str, chunks) -> int:
+        """
+        Cache the buildings of a region dump written chunk by chunk (etc: `pbf_reader.iter_buildings`)
+
+        Returns:
+            number of cached buildings
+        """
+        stat = os.stat(pbf_path)
+        source = {'file': os.path.basename(pbf_path),
+                  'size': stat.st_size,
+                  'mtime_ns': stat.st_mtime_ns,
+                  'md5': file_md5(pbf_path)}
+        with AtomicParquetWriter(self.path(pbf_path), metadata={SOURCE_METADATA: json.dumps(source).encode()}) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+        return writer.rows
+
+    def open(self, pbf_path: str, max_chunk_mb: float = 64, node_index: str = 'flex_mem'):
+        """
+        Cached buildings of a region dump, streamed into the cache first if the dump is not cached yet
+
+        Args:
+            pbf_path: location of the region dump
+            max_chunk_mb: memory ceiling of a streamed chunk
+            node_index: osmium node location index (see `pbf_reader.iter_buildings`)
+        """
+        path, table_path = self.path(pbf_path), self.table_path(pbf_path)
+        if not self.is_current(pbf_path):
+            log.info(f'Streaming buildings of {pbf_path} into {path}')
+            self.build(pbf_path, iter_buildings(pbf_path, max_chunk_mb=max_chunk_mb, node_index=node_index))
+        # published again whenever the cached region was rebuilt after it
+        buildings = RegionBuildings(path, table_path)
+        if not os.path.exists(table_path) or os.stat(table_path).st_mtime_ns < os.stat(path).st_mtime_ns:
+            log.info(f'Publishing buildings of {path} into {table_path}')
+            publish_region_table(buildings, table_path)
+        return buildings
+
+
+class RegionBuildings:
+    """
+    Buildings of a region in the cache, read area by area
+
+    Args:
+        path: cached region file
+        table_path: memory-mapped copy of the cached region (see `RegionCache.open`)
+    """
+
+    def __init__(self, path: str, table_path: str):
+        self.path = path
+        self.table = RegionTable(table_path)
+
+    def __len__(self):
+        return pq.ParquetFile(self.path).metadata.num_rows
+
+    def select(self, ids, columns=('id', 'geometry', 'timestamp')):
+        """
+        Buildings with the given OSM ids (etc: buildings crawled in an area)
+        Rows are found through the id index of the memory-mapped table (built once per process), only the pages
+        of these rows are read: the cost grows with the number of ids, not with the size of the region
+        """
+        return self.table.select(ids, columns)
+
+
+def read_region_buildings(pbf_path: str, cache: RegionCache = None, reader: str = 'pyrosm', **stream_args):
+    """
+    Buildings of a region dump, from the cache if the dump is unchanged
+
+    Args:
+        pbf_path: location of the region dump
+        cache: parsed region cache, the dump is always parsed if None (pyrosm reader only)
+        reader: pyrosm (GeoDataFrame of the region) or stream (`RegionBuildings` in the cache)
+        stream_args: arguments of `RegionCache.open` (max_chunk_mb, node_index)
+    """
+    if reader not in READERS:
+        raise ValueError(f'Unknown region reader {reader}, expected one of {READERS}')
+    if reader == 'stream':
+        if cache is None:
+            raise ValueError('The stream region reader needs a buildings cache location')
+        buildings = cache.open(pbf_path, **stream_args)
+        log.info(f'{len(buildings)} buildings of {pbf_path} in {buildings.path}')
+        return buildings
+
+    if cache is not None:
+        buildings = cache.load(pbf_path)
+        if buildings is not None:
+            log.info(f'Loaded {len(buildings)} buildings of {pbf_path} from {cache.path(pbf_path)}')
+            return buildings
+
+    buildings = OSM(pbf_path).get_buildings()
+
+    if cache is not None and buildings is not None:
+        try:
+            cache.save(pbf_path, buildings)
+        except Exception as e:
+            log.warning(f'Cannot cache the buildings of {pbf_path}. Error: {e}')
+    return buildings
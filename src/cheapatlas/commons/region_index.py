@@ -0,0 +1,54 @@
+"""
+Id index of the region buildings, built once per region
+
+Ids are sorted once (argsort), the buildings of an area are then found by binary search (`searchsorted`):
+the cost of a lookup grows with the number of buildings of the area, not with the size of the region,
+instead of hashing the whole region table in a merge for every area.
+"""
+import numpy as np
+import pandas as pd
+
+
+class RegionIndex:
+    """
+    Args:
+        ids: OSM ids of the region buildings, in table order (duplicates allowed, etc: a node and a way)
+    """
+
+    def __init__(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        self.order = np.argsort(ids, kind='stable')
+        self.sorted_ids = ids[self.order]
+
+    def __len__(self):
+        return len(self.sorted_ids)
+
+    def positions(self, ids) -> np.ndarray:
+        """Table positions of all the rows with one of `ids` (ascending id order)"""
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        start = np.searchsorted(self.sorted_ids, ids, side='left')
+        end = np.searchsorted(self.sorted_ids, ids, side='right')
+        counts = end - start
+        # expand the [start, end) ranges of the found ids
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.order[np.repeat(start, counts) + offsets]
+
+
+class IndexedBuildings:
+    """
+    Region buildings dataframe with an id index, read area by area like `RegionBuildings`
+
+    Args:
+        buildings: (Geo)DataFrame of the region buildings
+    """
+
+    def __init__(self, buildings: pd.DataFrame):
+        self.buildings = buildings
+        self.index = RegionIndex(buildings['id'])
+
+    def __len__(self):
+        return len(self.buildings)
+
+    def select(self, ids, columns=('id', 'geometry', 'timestamp')):
+        """Buildings with the given OSM ids (etc: buildings crawled in an area)"""
+        return self.buildings.iloc[self.index.positions(ids)][list(columns)].reset_index(drop=True)
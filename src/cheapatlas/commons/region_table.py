@@ -0,0 +1,97 @@
+"""
+Read-only region buildings table shared by the worker processes enhancing the areas of a region
+
+The `id`, `geometry` (WKB) and `timestamp` columns of the region buildings are published once into an
+uncompressed Arrow IPC file. Workers memory-map it: the columns are not pickled to every worker nor copied,
+the pages are shared through the OS page cache, only the rows of an area are materialised by `select`,
+found with an id index built once per worker.
+"""
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from src.cheapatlas.commons.atomic_io import atomic_path
+from src.cheapatlas.commons.geometry import GEOMETRY_COLUMN, to_wkb
+from src.cheapatlas.commons.region_index import RegionIndex
+
+COLUMNS = ('id', GEOMETRY_COLUMN, 'timestamp')
+SCHEMA = pa.schema([('id', pa.int64()), (GEOMETRY_COLUMN, pa.binary()), ('timestamp', pa.int64())])
+CRS = 'EPSG:4326'
+
+
+def publish_region_table(buildings, path: str):
+    """
+    Write the region buildings shared with the workers
+
+    Args:
+        buildings: GeoDataFrame of the region or `RegionBuildings` (cached region, copied row group by row group)
+        path: location of the Arrow IPC file
+    Returns:
+        `RegionTable` of the file
+    """
+    with atomic_path(path) as tmp_path, pa.OSFile(tmp_path, 'wb') as sink, \
+            pa.ipc.new_file(sink, SCHEMA) as writer:
+        for df in iter_frames(buildings):
+            writer.write_table(region_batch(df))
+    return RegionTable(path)
+
+
+def iter_frames(buildings):
+    if isinstance(buildings, pd.DataFrame):
+        yield buildings
+        return
+    parquet = pq.ParquetFile(buildings.path)
+    for i in range(parquet.num_row_groups):
+        yield parquet.read_row_group(i, columns=list(COLUMNS)).to_pandas()
+
+
+def region_batch(df: pd.DataFrame) -> pa.Table:
+    timestamp = pd.to_numeric(df['timestamp'], errors='coerce') if 'timestamp' in df.columns else None
+    return pa.table({'id': pa.array(df['id'].to_numpy(dtype=np.int64)),
+                     GEOMETRY_COLUMN: pa.array(to_wkb(df[GEOMETRY_COLUMN]), type=pa.binary()),
+                     'timestamp': pa.array(timestamp, type=pa.int64(), from_pandas=True) if timestamp is not None
+                     else pa.nulls(len(df), pa.int64())}, schema=SCHEMA)
+
+
+class RegionTable:
+    """
+    Memory-mapped region buildings, attached zero-copy (picklable, workers re-open the file)
+
+    Args:
+        path: Arrow IPC file written by `publish_region_table`
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._table = None
+        self._index = None
+
+    def __getstate__(self):
+        return {'path': self.path, '_table': None, '_index': None}
+
+    @property
+    def table(self) -> pa.Table:
+        if self._table is None:
+            self._table = pa.ipc.open_file(pa.memory_map(self.path)).read_all()
+        return self._table
+
+    @property
+    def index(self) -> RegionIndex:
+        if self._index is None:
+            self._index = RegionIndex(self.table.column('id').to_numpy())
+        return self._index
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def select(self, ids, columns=COLUMNS):
+        """Buildings with the given OSM ids (etc: buildings crawled in an area) as a GeoDataFrame"""
+        rows = self.table.select(list(columns)).take(pa.array(self.index.positions(ids)))
+        df = rows.drop([GEOMETRY_COLUMN]).to_pandas() if GEOMETRY_COLUMN in columns else rows.to_pandas()
+        if GEOMETRY_COLUMN not in columns:
+            return df
+        df[GEOMETRY_COLUMN] = shapely.from_wkb(rows.column(GEOMETRY_COLUMN).to_numpy(zero_copy_only=False))
+        return gpd.GeoDataFrame(df[list(columns)], geometry=GEOMETRY_COLUMN, crs=CRS)
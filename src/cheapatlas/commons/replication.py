@@ -0,0 +1,171 @@
+"""
+Keep OSM region dumps current with replication diffs (`.osc.gz`) instead of full re-downloads
+
+- The replication state (sequence number) is read from the PBF header, as written by Geofabrik
+- Diffs are merged into the dump with pyosmium, the result replaces the dump atomically
+- The ids of touched buildings are reported: ways/relations with a `building` tag that were
+  created, modified or deleted, and building ways whose nodes moved
+"""
+import os
+
+import osmium
+import osmium.io as oio
+from osmium.replication.server import ReplicationServer
+
+import logging
+log = logging.getLogger(__name__)
+
+SEQUENCE_HEADER = 'osmosis_replication_sequence_number'
+TIMESTAMP_HEADER = 'osmosis_replication_timestamp'
+BASE_URL_HEADER = 'osmosis_replication_base_url'
+
+
+class ChangeCollector(osmium.SimpleHandler):
+    """Collect building ids and node ids touched by a set of changes"""
+
+    def __init__(self):
+        super().__init__()
+        self.buildings = set()
+        self.nodes = set()
+
+    def node(self, n):
+        self.nodes.add(n.id)
+
+    def way(self, w):
+        # deleted objects carry no tags, keep them as they may have been buildings
+        if w.deleted or 'building' in w.tags:
+            self.buildings.add(w.id)
+
+    def relation(self, r):
+        if r.deleted or 'building' in r.tags:
+            self.buildings.add(r.id)
+
+
+class NodeRefCollector(osmium.SimpleHandler):
+    """Collect building ways referencing any of `nodes`"""
+
+    def __init__(self, nodes):
+        super().__init__()
+        self.nodes = nodes
+        self.buildings = set()
+
+    def way(self, w):
+        if 'building' in w.tags and any(ref.ref in self.nodes for ref in w.nodes):
+            self.buildings.add(w.id)
+
+
+def replication_url(download_url: str) -> str:
+    """Replication base url of a Geofabrik dump (etc: .../bremen-latest.osm.pbf ==> .../bremen-updates)"""
+    return download_url.replace('-latest.osm.pbf', '-updates')
+
+
+def read_header(pbf_path: str) -> dict:
+    """Read the replication fields of an OSM file header"""
+    reader = oio.Reader(pbf_path, osmium.osm.osm_entity_bits.NOTHING)
+    try:
+        header = reader.header()
+        return {key: header.get(key) for key in (SEQUENCE_HEADER, TIMESTAMP_HEADER, BASE_URL_HEADER)}
+    finally:
+        reader.close()
+
+
+def merge_changes(pbf_path: str, changes: osmium.MergeInputReader, header: dict = None):
+    """
+    Merge `changes` into the dump at `pbf_path` (replaced in place)
+
+    Args:
+        pbf_path: OSM dump, without history
+        changes: reader holding the diffs, oldest first
+        header: header fields of the updated dump (etc: replication sequence number)
+    Returns:
+        set of touched building ids (ways and relations)
+    """
+    tmp_path = pbf_path + '.update.osm.pbf'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    h = oio.Header()
+    for key, value in (header or {}).items():
+        if value is not None:
+            h.set(key, str(value))
+    reader = oio.Reader(pbf_path)
+    writer = oio.Writer(oio.File(tmp_path), h)
+    try:
+        changes.apply_to_reader(reader, writer, False)
+    except BaseException:
+        writer.close()
+        os.remove(tmp_path)
+        raise
+    finally:
+        reader.close()
+    writer.close()
+
+    # Only read the changes after merging, simplifying them in place breaks `apply_to_reader`
+    collector = ChangeCollector()
+    changes.apply(collector, simplify=True)
+
+    # Building geometry also changes if only its nodes moved
+    if collector.nodes:
+        node_refs = NodeRefCollector(collector.nodes)
+        node_refs.apply_file(tmp_path)
+        collector.buildings |= node_refs.buildings
+
+    os.replace(tmp_path, pbf_path)
+    return collector.buildings
+
+
+def apply_change_files(pbf_path: str, change_files, sequence: int = None):
+    """
+    Merge local change files (`.osc`/`.osc.gz`, oldest first) into the dump at `pbf_path`
+
+    Returns:
+        set of touched building ids
+    """
+    changes = osmium.MergeInputReader()
+    for change_file in change_files:
+        changes.add_file(change_file)
+
+    header = read_header(pbf_path)
+    if sequence is not None:
+        header[SEQUENCE_HEADER] = sequence
+    return merge_changes(pbf_path, changes, header)
+
+
+def update_region(pbf_path: str, server_url: str, max_size_kb: int = 512 * 1024):
+    """
+    Bring the dump at `pbf_path` up to date with the diffs of its replication server
+
+    Args:
+        pbf_path: OSM dump with replication sequence number in its header
+        server_url: replication base url (etc: https://download.geofabrik.de/europe/germany/bremen-updates)
+        max_size_kb: diffs held in memory per merge, larger backlogs are merged in several rounds
+    Returns:
+        set of touched building ids, None if the dump was already up to date
+    Raises:
+        ValueError: dump has no replication sequence number (full download needed)
+    """
+    header = read_header(pbf_path)
+    if not header[SEQUENCE_HEADER]:
+        raise ValueError(f'No replication sequence number in {pbf_path}')
+    sequence = int(header[SEQUENCE_HEADER])
+
+    touched = None
+    with ReplicationServer(server_url) as server:
+        while True:
+            diffs = server.collect_diffs(sequence + 1, max_size=max_size_kb)
+            if diffs is None:
+                break
+
+            state = server.get_state_info(diffs.id)
+            header = {BASE_URL_HEADER: server_url,
+                      SEQUENCE_HEADER: diffs.id,
+                      TIMESTAMP_HEADER: state.timestamp.strftime('%Y-%m-%dT%H:%M:%SZ') if state else None}
+            buildings = merge_changes(pbf_path, diffs.reader, header)
+            touched = buildings if touched is None else touched | buildings
+            log.info(f'Applied diffs {sequence + 1}..{diffs.id} to {os.path.basename(pbf_path)}, '
+                         f'{len(buildings)} building(s) touched')
+
+            sequence = diffs.id
+            if sequence >= diffs.newest:
+                break
+    return touched
@@ -0,0 +1,135 @@
+"""
+Content-addressed on-disk cache for raw HTTP responses (e.g. Overpass API)
+
+- Entries are gzip-compressed and keyed by the SHA-256 hash of the rendered query
+- Entries older than `ttl_days` are treated as missing
+- Total size is bounded by `max_size_mb`, least recently used entries are evicted first
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Args:
+        cache_dir: cache location (etc: data/01_raw/overpass_cache)
+        ttl_days: time-to-live of an entry, None to keep entries forever
+        max_size_mb: size bound of the cache, None for unbounded
+        offline: cache-only mode, callers must not fall back to the network on a miss
+    """
+
+    suffix = '.gz'
+
+    def __init__(self, cache_dir: str, ttl_days: float = None, max_size_mb: float = None,
+                 offline: bool = False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl_days * 86400 if ttl_days is not None else None
+        self.max_size = max_size_mb * 2 ** 20 if max_size_mb is not None else None
+        self.offline = offline
+        self._lock = threading.Lock()
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self._size = sum(os.path.getsize(path) for path in self._entries())
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Build the cache from its `parameters.yml` section. Return None if caching is disabled"""
+        if not config or not config.get('path'):
+            return None
+        return cls(config['path'],
+                   ttl_days=config.get('ttl_days'),
+                   max_size_mb=config.get('max_size_mb'),
+                   offline=config.get('offline', False))
+
+    @staticmethod
+    def key(query: str) -> str:
+        return hashlib.sha256(query.strip().encode('utf-8')).hexdigest()
+
+    def path(self, query: str) -> str:
+        key = self.key(query)
+        return os.path.join(self.cache_dir, key[:2], key + self.suffix)
+
+    def get(self, query: str):
+        """Return the path of a fresh entry for `query` (and mark it as recently used), else None"""
+        path = self.path(query)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        if self.ttl is not None and time.time() - mtime > self.ttl:
+            self.discard(query)
+            return None
+
+        # access time tracks recency for LRU eviction, modification time tracks age for TTL
+        os.utime(path, (time.time(), mtime))
+        return path
+
+    def open(self, query: str):
+        """Open a fresh entry as a decompressed binary stream, or return None"""
+        path = self.get(query)
+        return gzip.open(path, 'rb') if path is not None else None
+
+    def put(self, query: str, chunks) -> str:
+        """Compress an iterable of raw byte chunks into the cache entry of `query`"""
+        path = self.path(query)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            with self._lock:
+                old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+                self._size += os.path.getsize(path) - old_size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # never evict the entry just written, the caller is about to read it
+        self.evict(protected=path)
+        return path
+
+    def discard(self, query: str):
+        path = self.path(query)
+        with self._lock:
+            if os.path.exists(path):
+                self._size -= os.path.getsize(path)
+                os.remove(path)
+
+    def evict(self, protected: str = None):
+        """
+        Remove least recently used entries until the cache fits into `max_size`
+        The entry at path `protected` is kept, even if it alone exceeds `max_size`
+        """
+        if self.max_size is None or self._size <= self.max_size:
+            return
+
+        with self._lock:
+            entries = sorted(((os.stat(path), path) for path in self._entries()),
+                             key=lambda x: x[0].st_atime)
+            for stat, path in entries:
+                if self._size <= self.max_size:
+                    break
+                if path == protected:
+                    continue
+                os.remove(path)
+                self._size -= stat.st_size
+                log.info(f'Evicted {os.path.basename(path)} from response cache')
+
+    def _entries(self):
+        for path, subdirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(self.suffix):
+                    yield os.path.join(path, name)
@@ -0,0 +1,84 @@
+"""
+Process pool scheduling of independent jobs (etc: Geofabrik regions) within a memory budget
+
+Every job comes with an estimate of its peak memory. Jobs are started largest first, as long as the
+estimates of the running jobs fit in the budget, so small jobs (etc: city-states) run alongside a large one.
+A job larger than the whole budget runs alone.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def run_within_budget(fn, jobs, memory_budget_mb: float, max_workers: int):
+    """
+    Run `fn(*args)` for every job in a process pool
+
+    A worker process dying (etc: killed by the out-of-memory killer) breaks the pool and every job running in it.
+    The pool is rebuilt and these jobs are run again one at a time, a job crashing alone is logged and left out
+
+    Args:
+        fn: module level function (pickled to the workers)
+        jobs: list of (name, estimated memory in MB, args)
+        memory_budget_mb: sum of the estimates of the jobs running at once
+        max_workers: maximum number of jobs running at once
+    Returns:
+        dictionary of job name -> result, failed jobs are logged and left out
+    """
+    # (name, estimate, args, run alone)
+    pending = sorted([(name, estimate, args, False) for name, estimate, args in jobs],
+                     key=lambda x: x[1], reverse=True)
+    running = {}
+    results = {}
+
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        while pending or running:
+            used = sum(job[1] for job in running.values())
+            for job in list(pending):
+                name, estimate, args, alone = job
+                if len(running) >= max_workers or any(other[3] for other in running.values()):
+                    break
+                if running and (alone or used + estimate > memory_budget_mb):
+                    continue
+                if not running and estimate > memory_budget_mb:
+                    log.warning(f'{name} needs ~{estimate:.0f} MB, more than the budget of {memory_budget_mb} MB. Running it alone')
+                try:
+                    future = executor.submit(fn, *args)
+                except BrokenProcessPool:
+                    # broken by a running job, collected below
+                    break
+                pending.remove(job)
+                running[future] = job
+                used = used + estimate
+                log.info(f'Started {name} (~{estimate:.0f} MB), {len(running)} running with ~{used:.0f}/{memory_budget_mb} MB')
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                # every job of the pool is lost with it, the others are finished once it has shut down
+                executor.shutdown(wait=True)
+                done = list(running)
+            broken = []
+            for future in done:
+                job = running.pop(future)
+                try:
+                    results[job[0]] = future.result()
+                except BrokenProcessPool:
+                    broken.append(job)
+                except Exception as e:
+                    log.error(f'{job[0]} failed. Error: {e}')
+
+            if broken:
+                for name, estimate, args, alone in broken:
+                    if alone or len(broken) == 1:
+                        log.error(f'{name} failed. Its worker process terminated abruptly')
+                    else:
+                        log.warning(f'Worker process terminated abruptly while running {name}, retrying it alone')
+                        pending.append((name, estimate, args, True))
+                pending.sort(key=lambda x: x[1], reverse=True)
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+    finally:
+        executor.shutdown(wait=True)
+    return results
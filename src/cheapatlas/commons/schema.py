@@ -0,0 +1,124 @@
+"""
+Typed schema of the building objects, used by every reader and writer of the building stages
+
+- repeated labels (building types, tags, city, street) are categorical (dictionary encoded in Parquet)
+- ids are int64, node lists list<int64> (see `node_lists`)
+- coordinates stay float64 (float32 rounds them to about a metre), footprint features are float32
+- building levels are nullable small ints, codes (AGS, PLZ) and free text stay strings
+Columns not in the schema (etc: geometry, timestamp) keep their dtype.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_float_dtype, is_string_dtype
+
+from src.cheapatlas.commons.node_lists import NODES_COLUMN, node_list_series
+
+CATEGORY = 'category'
+TEXT = 'text'  # strings, None where missing
+LEVELS = 'Int16'
+NODE_LIST = 'node_list'
+
+BUILDING_DTYPES = {
+    'type': CATEGORY,
+    'id': 'int64',
+    NODES_COLUMN: NODE_LIST,
+    'center.lat': 'float64',
+    'center.lon': 'float64',
+    'tags.building': CATEGORY,
+    'tags.building:levels': LEVELS,
+    'tags.source': CATEGORY,
+    'tags.addr:city': CATEGORY,
+    'tags.addr:housenumber': TEXT,
+    'tags.addr:postcode': TEXT,
+    'tags.addr:street': CATEGORY,
+    'tags.addr:suburb': CATEGORY,
+    # 02_intermediate onwards
+    'building_levels': LEVELS,
+    'postcode': TEXT,
+    'building_types': CATEGORY,
+    # 03_primary onwards
+    'surface_area': 'float32',
+    'rectangularity': 'float32',
+    'total_area': 'float32',
+    'building_block': CATEGORY,
+    # boundary codes, leading zeros kept
+    'ags': TEXT,
+    'plz': TEXT,
+    'state': TEXT,
+    'district': TEXT,
+}
+
+
+def apply_schema(df: pd.DataFrame, dtypes: dict = None) -> pd.DataFrame:
+    """
+    Cast the columns of a dataframe to their schema dtype, columns already typed are left as is
+
+    Args:
+        df: building objects of any stage
+        dtypes: column -> dtype, `BUILDING_DTYPES` by default
+    """
+    dtypes = BUILDING_DTYPES if dtypes is None else dtypes
+    columns = {column: cast(df[column], dtype) for column, dtype in dtypes.items()
+               if column in df.columns and not has_dtype(df[column], dtype)}
+    return df.assign(**columns) if columns else df
+
+
+def conform(df: pd.DataFrame, columns, dtypes: dict = None) -> pd.DataFrame:
+    """Dataframe with exactly `columns` (missing ones added empty) cast to the schema"""
+    return apply_schema(df.reindex(columns=list(columns)), dtypes)
+
+
+def csv_dtypes(dtypes: dict = None) -> dict:
+    """`dtype` argument of `pd.read_csv` parsing text columns as strings and the others as close as possible"""
+    dtypes = BUILDING_DTYPES if dtypes is None else dtypes
+    result = {}
+    for column, dtype in dtypes.items():
+        if dtype == CATEGORY:
+            result[column] = CATEGORY
+        elif dtype in ('float32', 'float64'):
+            result[column] = dtype
+        elif dtype != 'int64':
+            # ids are not forced (no NA in int64), levels and node lists are parsed after reading
+            result[column] = str
+    return result
+
+
+def has_dtype(series: pd.Series, dtype) -> bool:
+    if dtype == CATEGORY:
+        return isinstance(series.dtype, pd.CategoricalDtype)
+    if dtype == TEXT:
+        return series.dtype == object or is_string_dtype(series.dtype)
+    if dtype == NODE_LIST:
+        return isinstance(series.dtype, pd.ArrowDtype)
+    return str(series.dtype) == dtype
+
+
+def cast(series: pd.Series, dtype) -> pd.Series:
+    """Cast one column to a schema dtype, values that cannot be converted become missing"""
+    if dtype == NODE_LIST:
+        return node_list_series(series, index=series.index)
+    if dtype in (TEXT, CATEGORY):
+        text = to_text(series)
+        return text.astype(CATEGORY) if dtype == CATEGORY else text
+    values = pd.to_numeric(series, errors='coerce')
+    if dtype == LEVELS:
+        # "2.5" ==> 2, nonsense heights (etc: 1e6) ==> missing
+        values = np.trunc(values.where(values.abs() < 2 ** 15))
+    return values.astype(dtype)
+
+
+def to_text(series: pd.Series) -> pd.Series:
+    """Strings of a column, None where missing, integral floats without decimals (etc: postcodes read as numbers)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    if is_float_dtype(series.dtype) and (series.dropna() % 1 == 0).all():
+        series = series.astype('Int64')
+    return series.astype(object).map(as_text)
+
+
+def as_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, float) and np.isnan(value) or value is pd.NA:
+        return None
+    return str(value)
@@ -0,0 +1,35 @@
+"""
+Naive building types classification from the OSM `building` tag, driven by the taxonomy in parameters.yml
+
+The taxonomy is compiled once into a tag -> building type lookup. Buildings are classified by recoding the
+categories of their tags (a few hundred distinct values) instead of looking up every building.
+"""
+import numpy as np
+import pandas as pd
+
+OTHER = 'other'
+
+
+class BuildingTaxonomy:
+    """
+    Args:
+        taxonomy: building type -> OSM building tags (etc: `building_taxonomy` parameter),
+            the first building type listing a tag wins, tags listed nowhere are 'other'
+    """
+
+    def __init__(self, taxonomy: dict):
+        self.categories = list(taxonomy) + ([] if OTHER in taxonomy else [OTHER])
+        self.other = self.categories.index(OTHER)
+        self.lookup = {}
+        for code, tags in enumerate(taxonomy.values()):
+            for tag in tags or []:
+                self.lookup.setdefault(tag, code)
+
+    def classify(self, tags: pd.Series) -> pd.Series:
+        """Categorical building types of the `tags.building` column"""
+        if not isinstance(tags.dtype, pd.CategoricalDtype):
+            tags = tags.astype(object).astype('category')
+        # missing tags have code -1, the last entry
+        recode = np.array([self.lookup.get(tag, self.other) for tag in tags.cat.categories] + [self.other])
+        codes = recode[tags.cat.codes.to_numpy()]
+        return pd.Series(pd.Categorical.from_codes(codes, categories=self.categories), index=tags.index)
@@ -0,0 +1,38 @@
+"""
+Bounding box tiling for areas too large or dense for a single Overpass query
+
+A bounding box is a tuple (south, west, north, east) in degrees, as used by Overpass QL filters.
+"""
+import math
+
+
+def split_bbox(bbox):
+    """Split a bounding box into 4 equal quadrants"""
+    south, west, north, east = bbox
+    mid_lat = (south + north) / 2
+    mid_lon = (west + east) / 2
+    return [(south, west, mid_lat, mid_lon),
+            (south, mid_lon, mid_lat, east),
+            (mid_lat, west, north, mid_lon),
+            (mid_lat, mid_lon, north, east)]
+
+
+def grid_tiles(bbox, n: int):
+    """Split a bounding box into a regular n x n grid"""
+    south, west, north, east = bbox
+    lat_step = (north - south) / n
+    lon_step = (east - west) / n
+    return [(south + i * lat_step, west + j * lon_step,
+             south + (i + 1) * lat_step, west + (j + 1) * lon_step)
+            for i in range(n) for j in range(n)]
+
+
+def plan_tiles(bbox, estimated_count: int = None, max_per_tile: int = 50000):
+    """
+    Plan the tiles of an area from its estimated number of buildings
+    Without estimation the area is split into 4 quadrants
+    """
+    if not estimated_count:
+        return split_bbox(bbox)
+    n = max(math.ceil(math.sqrt(estimated_count / max_per_tile)), 1)
+    return grid_tiles(bbox, n) if n > 1 else split_bbox(bbox)
@@ -0,0 +1,2 @@
+"""Custom Kedro datasets
+"""
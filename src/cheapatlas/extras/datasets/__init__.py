@@ -0,0 +1,4 @@
+"""Custom Kedro datasets
+"""
+from .building_store_dataset import BuildingStoreDataSet  # NOQA
+from .optional_json_dataset import OptionalJSONDataSet  # NOQA
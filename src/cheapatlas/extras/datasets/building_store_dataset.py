@@ -0,0 +1,53 @@
+"""
+Kedro dataset of the per-area building objects of a pipeline stage
+"""
+import os
+from typing import Any, Dict
+
+from kedro.io import AbstractDataSet
+
+from src.cheapatlas.commons.building_store import BuildingStore
+
+
+class BuildingStoreDataSet(AbstractDataSet):
+    """
+    Loading returns the `BuildingStore` of the stage, nodes read and write single areas through it
+    (a stage does not fit in memory at once). Saving a dictionary of area id -> dataframe replaces these areas
+
+    Example catalog entry:
+        int_buildings:
+          type: cheapatlas.extras.datasets.BuildingStoreDataSet
+          filepath: data/02_intermediate/buildings_data
+          backend: parquet
+
+    Args:
+        filepath: folder of the stage
+        boundary_type: PLZ or AGS
+        backend: csv or parquet (Hive-partitioned by state/district/AGS)
+        save_args: BuildingStore settings (etc: compression)
+    """
+
+    def __init__(self, filepath: str, boundary_type: str = 'ags', backend: str = 'csv',
+                 save_args: Dict[str, Any] = None):
+        self._filepath = filepath
+        self._boundary_type = boundary_type
+        self._backend = backend
+        self._save_args = save_args or {}
+
+    def _store(self) -> BuildingStore:
+        return BuildingStore(self._filepath, self._boundary_type, self._backend, **self._save_args)
+
+    def _load(self) -> BuildingStore:
+        return self._store()
+
+    def _save(self, data: Dict[str, Any]) -> None:
+        store = self._store()
+        for boundary_id, df in data.items():
+            store.write(boundary_id, df)
+
+    def _exists(self) -> bool:
+        return os.path.exists(self._filepath)
+
+    def _describe(self) -> Dict[str, Any]:
+        return dict(filepath=self._filepath, boundary_type=self._boundary_type,
+                    backend=self._backend, save_args=self._save_args)
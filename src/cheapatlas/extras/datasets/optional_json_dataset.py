@@ -0,0 +1,51 @@
+"""
+Kedro dataset of a JSON file that may not exist yet
+"""
+import copy
+import json
+import os
+from typing import Any, Dict
+
+from kedro.io import AbstractDataSet
+
+from src.cheapatlas.commons.atomic_io import atomic_path
+
+
+class OptionalJSONDataSet(AbstractDataSet):
+    """
+    Like `json.JSONDataSet`, but loading a missing file returns `default` instead of failing.
+    Nodes that only consume the output of another pipeline (etc: region dumps changed in the last
+    Geofabrik refresh) therefore also run before that pipeline ever ran
+
+    Example catalog entry:
+        geofabrik_changed_regions:
+          type: cheapatlas.extras.datasets.OptionalJSONDataSet
+          filepath: data/01_raw/geofabrik_changed_regions.json
+          default: {}
+
+    Args:
+        filepath: location of the JSON file
+        default: value loaded while the file does not exist
+        save_args: `json.dump` settings (etc: indent)
+    """
+
+    def __init__(self, filepath: str, default: Any = None, save_args: Dict[str, Any] = None):
+        self._filepath = filepath
+        self._default = default
+        self._save_args = save_args or {}
+
+    def _load(self) -> Any:
+        if not os.path.exists(self._filepath):
+            return copy.deepcopy(self._default)
+        with open(self._filepath, 'r') as f:
+            return json.load(f)
+
+    def _save(self, data: Any) -> None:
+        with atomic_path(self._filepath) as tmp_path, open(tmp_path, 'w') as f:
+            json.dump(data, f, **self._save_args)
+
+    def _exists(self) -> bool:
+        return os.path.exists(self._filepath)
+
+    def _describe(self) -> Dict[str, Any]:
+        return dict(filepath=self._filepath, default=self._default, save_args=self._save_args)
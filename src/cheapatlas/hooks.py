@@ -29,7 +29,7 @@
 """Project hooks."""
 from typing import Any, Dict, Iterable, Optional
 
-from kedro.config import ConfigLoader
+from kedro.config import ConfigLoader, TemplatedConfigLoader
 from kedro.framework.hooks import hook_impl
 from kedro.io import DataCatalog
 from kedro.pipeline import Pipeline
@@ -61,7 +61,8 @@ class ProjectHooks:
 
     @hook_impl
     def register_config_loader(self, conf_paths: Iterable[str]) -> ConfigLoader:
-        return ConfigLoader(conf_paths)
+        # ${...} placeholders in catalog/parameters are filled from globals.yml (etc: storage backend)
+        return TemplatedConfigLoader(conf_paths, globals_pattern="*globals.yml")
 
     @hook_impl
     def register_catalog(
@@ -32,8 +32,7 @@ generated using Kedro 0.16.6
 import pandas as pd
 import numpy as np
 import os
-import re
-from shapely import wkt
+import shapely
 from shapely.geometry import box, Polygon
 from geopandas import GeoDataFrame
 
@@ -42,7 +41,15 @@ import hdbscan
 import logging
 log = logging.getLogger(__name__)
 
+from src.cheapatlas.commons.area_stats import area_stats
+from src.cheapatlas.commons.geometry import to_geometry_array
 from src.cheapatlas.commons.helpers import _left
+from src.cheapatlas.commons.manifest import DEFAULT_MANIFEST_PATH, DONE, StageManifest, file_fingerprint
+
+# Progress manifest stages of the per-area outputs
+PRI_BUILDINGS_STAGE = 'pri_buildings'
+FEA_BUILDINGS_STAGE = 'fea_buildings'
+MODEL_OUTPUT_STAGE = 'model_output'
 
 # Classify building types
 from sklearn.model_selection import train_test_split
@@ -57,8 +64,9 @@ warnings.filterwarnings("ignore", category=DeprecationWarning)
 # 1st node
 def generate_features(plz_ags,
                       boundary_type,
-                      int_buildings_path,
-                      pri_buildings_path):
+                      int_buildings,
+                      pri_buildings,
+                      manifest_path=None):
     """
     Scan all available PLZ/AGS in the region.
     Populate PLZ/AGS building objects with data from region OSM dump (Geofabrik)
@@ -66,18 +74,17 @@ def generate_features(plz_ags,
     Args:
         plz_ags: list of AGS in the region
         boundary_type: PLZ or AGS code
-        int_buildings_path: output save to 02_intermediate
-        pri_buildings_path: output save to 03_primary
+        int_buildings: store of the inputs in 02_intermediate
+        pri_buildings: store of the outputs in 03_primary
+        manifest_path: location of the progress manifest
     """
     k = 0
 
-    # create saving location folder if not exists
-    if not os.path.exists(pri_buildings_path):
-        os.makedirs(pri_buildings_path)
-
     # Check for progress of already done areas
-    name_list = os.listdir(pri_buildings_path)
-    id_list = [x.split('.')[0].split('_')[2] for x in name_list if 'buildings' in x]
+    stage = pri_buildings.stage_name(PRI_BUILDINGS_STAGE)
+    manifest = StageManifest(manifest_path or DEFAULT_MANIFEST_PATH)
+    manifest.bootstrap(stage, pri_buildings)
+    id_list = list(manifest.done_ids(stage))
 
     # Get list of AGS codes
     plz_ags = plz_ags[[boundary_type]]
@@ -87,41 +94,41 @@ def generate_features(plz_ags,
 
     while k < len(plz_ags):
         boundary_id = plz_ags[boundary_type].iloc[k]
-        buildings_path = f'{int_buildings_path}/buildings_{boundary_type}_{boundary_id}.csv'
 
         try:
-            # Read in building objects data in the area
-            df = pd.read_csv(buildings_path,
-                             dtype={'tags.addr:suburb': 'object',
-                                    'tags.building:levels': 'object',
-                                    'tags.source': str,
-                                    'postcode': str},  # supposed to be AGS
-                             converters={"nodes": lambda x: x.strip("[]").split(", ")})  # read column as list
-            # Filter out NaN
-            df = df[df.geometry.isna() == False].reset_index(drop=True)
+            with manifest.track(stage, boundary_id, input_hash=file_fingerprint(int_buildings.path(boundary_id))) as result:
+                # Read in building objects data in the area
+                df = int_buildings.read(boundary_id)  # typed with the schema registry
+                # Filter out NaN
+                df = df[df.geometry.isna() == False].reset_index(drop=True)
 
-            # Convert geometry to GeoSeries
-            df['geometry'] = df['geometry'].apply(wkt.loads)
-            # Convert to GeoPandas type
-            df_geo = GeoDataFrame(df, geometry='geometry')
+                # Convert geometry to GeoSeries (decoded in bulk: WKB from Parquet, WKT text from CSV)
+                df['geometry'] = to_geometry_array(df['geometry'])
+                # Convert to GeoPandas type
+                df_geo = GeoDataFrame(df, geometry='geometry')
 
-            # Shape & Size
-            df_geo[['surface_area','rectangularity']] = df_geo.apply(lambda row: pd.Series(shape_size(row['geometry'])),axis=1)
+                # Shape & Size
+                shape, size = shape_sizes(df_geo.geometry.values)
+                df_geo['surface_area'] = shape
+                df_geo['rectangularity'] = size
 
-            # Total area
-            df_geo['total_area'] = df_geo['building_levels'].astype(int) * df_geo['surface_area']
+                # Total area
+                df_geo['total_area'] = df_geo['building_levels'].astype(int) * df_geo['surface_area']
 
-            # Save result to 02_intermediate/buildings_plz/buildings_<boundary_type>_<boundary_id>.csv
-            logging.info(f'Total of {len(df)} buildings in {boundary_type} {boundary_id} at position {k+1}/{len(plz_ags)}. Saving result...')
+                # Save result to 03_primary/buildings_data
+                logging.info(f'Total of {len(df)} buildings in {boundary_type} {boundary_id} at position {k+1}/{len(plz_ags)}. Saving result...')
 
-            # Save result
-            df_geo.to_csv(f'{pri_buildings_path}/buildings_{boundary_type}_{boundary_id}.csv', index=False)
+                # Save result
+                output_path = pri_buildings.write(boundary_id, df_geo)
+                result.update(rows=len(df_geo), output_path=output_path, stats=area_stats(df_geo))
 
         except Exception as e:
             logging.warning(f'Cannot enhance data on {boundary_type} {boundary_id} at position {k+1}/{len(plz_ags)}. Error: {e}')
         finally:
             k = k + 1
 
+    manifest.close()
+
 
 def shape_size(footprint_coord):
     """
@@ -146,11 +153,33 @@ def shape_size(footprint_coord):
     return (shape, size)
 
 
+def shape_sizes(footprints):
+    """
+    Vectorised `shape_size` over an array of footprints
+
+    Returns:
+        (shape, size) arrays, NaN for missing footprints or footprints without area (etc: points)
+    """
+    footprints = np.asarray(footprints, dtype=object)
+    bounds = shapely.bounds(footprints)
+    bbox_area = (bounds[:, 2] - bounds[:, 0]) * (bounds[:, 3] - bounds[:, 1]) * (10**10)
+
+    # Surface area
+    size = shapely.area(footprints) * (10**10)
+
+    # Shape of a building footprint = Rectangularity
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shape = np.where(bbox_area > 0, size / bbox_area, np.nan)
+
+    return (shape, size)
+
+
 # 2nd node
 def building_block_clustering(plz_ags:pd.DataFrame,
                               boundary_type:str,
-                              pri_buildings_path:str,
-                              fea_buildings_path:str):
+                              pri_buildings,
+                              fea_buildings,
+                              manifest_path:str=None):
     """
     This node aims to cluster building footprints into block using HDBSCAN and save district-level data into 04_feature
     1. Aggregate data from municipality-level (AGS key) to district-level (the first 5-digit of AGS key)
@@ -159,21 +188,20 @@ def building_block_clustering(plz_ags:pd.DataFrame,
     Args:
         plz_ags: list of municipalities in Germany
         boundary_type: PLZ or AGS code
-        pri_buildings_path: inputs from 03_primary
-        fea_buildings_path: outputs save to 04_feature
+        pri_buildings: store of the inputs in 03_primary
+        fea_buildings: store of the outputs in 04_feature
+        manifest_path: location of the progress manifest
     """
-    # create saving location folder if not exists
-    if not os.path.exists(fea_buildings_path):
-        os.makedirs(fea_buildings_path)
-
     # Generate list of districts
     plz_ags['ags_district'] = plz_ags[boundary_type].apply(lambda x: _left(x, 5))
     # Group to get only district-level ==> ~ 400 districts
     plz_ags_dist = plz_ags.groupby('ags_district').size().to_frame('count').reset_index()
 
     # Check for progress of already done areas
-    name_list = os.listdir(fea_buildings_path)
-    id_list = [x.split('.')[0].split('_')[2] for x in name_list if 'buildings' in x]
+    stage = fea_buildings.stage_name(FEA_BUILDINGS_STAGE)
+    manifest = StageManifest(manifest_path or DEFAULT_MANIFEST_PATH)
+    manifest.bootstrap(stage, fea_buildings)
+    id_list = list(manifest.done_ids(stage))
 
     # Get list of AGS codes
     plz_ags_dist = plz_ags['ags_district']
@@ -182,40 +210,39 @@ def building_block_clustering(plz_ags:pd.DataFrame,
     # Iterate through list of district and perform clustering on each of them
     for idx, dist_id in enumerate(plz_ags_dist.ags_district):
         try:
-            logging.info(f'Assembling footprints data for district {dist_id} at position {idx+1}/{len(plz_ags_dist)+1}')
-            dist_df = generate_dist_data(dist_id, pri_buildings_path)
-
-            # Drop unnecessary column
-            dist_df.drop(columns=['Unnamed: 0'], errors='ignore', inplace=True)
-            #### TEMP #### RUN ONLY ONCE
-            dist_df.rename(columns={'postcode': 'ags'}, errors='ignore', inplace=True)
-
-            # Perform on district-level dataframe
-            # parameters follow the paper suggestion baseline
-            buildings_clust_df = hdbscan_bld(dist_df,
-                                             min_cluster_size=8, #min number of buildings in 1 cluster
-                                             cluster_selection_epsilon=0.0003,  # 3 meters
-                                             min_samples=2)
-            # Save result
-            buildings_clust_df.to_csv(f'{fea_buildings_path}/buildings_{boundary_type}_{dist_id}.csv', index=False)
+            # Input: all municipality outputs of the district in 03_primary
+            input_hash = file_fingerprint(*[x['output_path'] for x in manifest.entries(pri_buildings.stage_name(PRI_BUILDINGS_STAGE),
+                                                                                          prefix=dist_id)
+                                            if x['status'] == DONE])
+            with manifest.track(stage, dist_id, input_hash=input_hash) as result:
+                logging.info(f'Assembling footprints data for district {dist_id} at position {idx+1}/{len(plz_ags_dist)+1}')
+                dist_df = generate_dist_data(dist_id, pri_buildings)
+
+                # Drop unnecessary column
+                dist_df.drop(columns=['Unnamed: 0'], errors='ignore', inplace=True)
+                #### TEMP #### RUN ONLY ONCE
+                dist_df.rename(columns={'postcode': 'ags'}, errors='ignore', inplace=True)
+
+                # Perform on district-level dataframe
+                # parameters follow the paper suggestion baseline
+                buildings_clust_df = hdbscan_bld(dist_df,
+                                                 min_cluster_size=8, #min number of buildings in 1 cluster
+                                                 cluster_selection_epsilon=0.0003,  # 3 meters
+                                                 min_samples=2)
+                # Save result
+                output_path = fea_buildings.write(dist_id, buildings_clust_df)
+                result.update(rows=len(buildings_clust_df), output_path=output_path,
+                              stats=area_stats(buildings_clust_df))
         except Exception as e:
             logging.warning(f'Cannot clustering data at district {dist_id} at position {idx+1}/{len(plz_ags_dist)+1}. Error: {e}')
 
-def generate_dist_data(dist_id, buildings_pri_path):
+    manifest.close()
+
+def generate_dist_data(dist_id, pri_buildings):
     """Generate district-level building footprints dataframe"""
 
-    regex = re.compile(f'(buildings_ags_{dist_id})')
-    # Create district building dataframe
-    li = []
-    for root, dirs, files in os.walk(buildings_pri_path):
-        for file in files:
-            if regex.match(file):
-                df = pd.read_csv(os.path.join(buildings_pri_path, file),
-                                 index_col=None, header=0,
-                                 low_memory = False)
-                li.append(df)
-
-    dist_df = pd.concat(li, axis=0, ignore_index=True)
+    # Create district building dataframe from all municipalities of the district
+    dist_df = pri_buildings.read_prefix(dist_id)
     return dist_df
 
 def hdbscan_bld(buildings_df: pd.DataFrame, min_cluster_size: int, cluster_selection_epsilon: int, min_samples: int):
@@ -255,8 +282,9 @@ def hdbscan_bld(buildings_df: pd.DataFrame, min_cluster_size: int, cluster_selec
 # 3rd node
 def building_types_classification(plz_ags:pd.DataFrame,
                                   boundary_type:str,
-                                  fea_buildings_path:str,
-                                  model_output_path:str):
+                                  fea_buildings,
+                                  model_output_buildings,
+                                  manifest_path:str=None):
     """
     Classify building footprints into residential and non-residential. 
     Merge results with existing naive classification (from data_preparation pipeline)
@@ -264,22 +292,21 @@ def building_types_classification(plz_ags:pd.DataFrame,
     Args:
         plz_ags: list of municipalities in Germany
         boundary_type: PLZ or AGS code
-        fea_buildings_path: inputs from 04_feature
-        model_output_path: outputs to 07_model_output
+        fea_buildings: store of the inputs in 04_feature
+        model_output_buildings: store of the outputs in 07_model_output
+        manifest_path: location of the progress manifest
     """
 
-    # create saving location folder if not exists
-    if not os.path.exists(model_output_path):
-        os.makedirs(model_output_path)
-
     # Generate list of districts
     plz_ags['ags_district'] = plz_ags[boundary_type].apply(lambda x: _left(x, 5))
     # Group to get only district-level ==> ~ 400 districts
     plz_ags_dist = plz_ags.groupby('ags_district').size().to_frame('count').reset_index()
 
     # Check for progress of already done areas
-    name_list = os.listdir(model_output_path)
-    id_list = [x.split('.')[0].split('_')[2] for x in name_list if 'buildings' in x]
+    stage = model_output_buildings.stage_name(MODEL_OUTPUT_STAGE)
+    manifest = StageManifest(manifest_path or DEFAULT_MANIFEST_PATH)
+    manifest.bootstrap(stage, model_output_buildings)
+    id_list = list(manifest.done_ids(stage))
 
     # Get list of AGS codes
     plz_ags_dist = plz_ags['ags_district']
@@ -288,16 +315,20 @@ def building_types_classification(plz_ags:pd.DataFrame,
     for idx, dist_id in enumerate(plz_ags_dist.ags_district):
         try:
             logging.info(f'Classifying footprints for district {dist_id} at position {idx + 1}/{len(plz_ags_dist) + 1}')
-            buildings_clust_df = pd.read_csv(os.path.join(fea_buildings_path,f'buildings_ags_{dist_id}.csv'),
-                                             low_memory=False)
-            classified_buildings_clust_df = xgboost_classify_building(buildings_clust_df)
-
-            # Save result
-            classified_buildings_clust_df.to_csv(f'{model_output_path}/buildings_{boundary_type}_{dist_id}.csv', index=False)
+            with manifest.track(stage, dist_id, input_hash=file_fingerprint(fea_buildings.path(dist_id))) as result:
+                buildings_clust_df = fea_buildings.read(dist_id)
+                classified_buildings_clust_df = xgboost_classify_building(buildings_clust_df)
+
+                # Save result
+                output_path = model_output_buildings.write(dist_id, classified_buildings_clust_df)
+                result.update(rows=len(classified_buildings_clust_df), output_path=output_path,
+                              stats=area_stats(classified_buildings_clust_df))
         except Exception as e:
             logging.warning(
                 f'Cannot classifying footprints in district {dist_id} at position {idx + 1}/{len(plz_ags_dist) + 1}. Error: {e}')
 
+    manifest.close()
+
 
 def xgboost_classify_building(buildings_clust_df):
     """
@@ -40,8 +40,9 @@ def create_pipeline(**kwargs):
             func=generate_features,
             inputs=['raw_plz_ags',
                     'params:boundary_type',
-                    'params:int_buildings_path',
-                    'params:pri_buildings_path'],
+                    'int_buildings',
+                    'pri_buildings',
+                    'params:manifest_path'],
             outputs=None,
             name='generate_footprint_features'
         ),
@@ -49,8 +50,9 @@ def create_pipeline(**kwargs):
             func=building_block_clustering,
             inputs=['raw_plz_ags',
                     'params:boundary_type',
-                    'params:pri_buildings_path',
-                    'params:fea_buildings_path'],
+                    'pri_buildings',
+                    'fea_buildings',
+                    'params:manifest_path'],
             outputs=None,
             name='building_block_clustering'
         ),
@@ -58,8 +60,9 @@ def create_pipeline(**kwargs):
             func=building_types_classification,
             inputs=['raw_plz_ags',
                     'params:boundary_type',
-                    'params:fea_buildings_path',
-                    'params:model_output_path'],
+                    'fea_buildings',
+                    'model_output_buildings',
+                    'params:manifest_path'],
             outputs=None,
             name='building_type_classification'
         )
@@ -29,37 +29,72 @@
 This is a boilerplate pipeline 'data_acquisition'
 generated using Kedro 0.16.6
 """
-import urllib.request
 from urllib.parse import urlparse
-from tqdm import tqdm  # progress bar
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 
+import time
 import pandas as pd
 import requests
+from pyrosm import OSM
 import os
-import time
+
+from src.cheapatlas.commons.rate_control import RateController, request_with_backoff
+from src.cheapatlas.commons.response_cache import ResponseCache
+from src.cheapatlas.commons.overpass_parser import (END_MARKER, GEOMETRY_COLUMN, OverpassError, csv_fields,
+                                                    iter_area_frames, iter_csv_frames, iter_elements,
+                                                    iter_file_chunks, iter_frames)
+from src.cheapatlas.commons.tiling import plan_tiles, split_bbox
+from src.cheapatlas.commons.downloader import download_files
+from src.cheapatlas.commons.freshness import FreshnessManifest
+from src.cheapatlas.commons.helpers import _left
+from src.cheapatlas.commons.manifest import DEFAULT_MANIFEST_PATH, FAILED, StageManifest, file_fingerprint
+from src.cheapatlas.commons.osm_extract import extract_buildings
+from src.cheapatlas.commons.replication import SEQUENCE_HEADER, read_header, replication_url, update_region
+from src.cheapatlas.commons.schema import conform
 # for logging
 import logging
 log = logging.getLogger(__name__)
 
+OVERPASS_URL = "http://overpass-api.de/api/interpreter"
+CHUNK_SIZE = 2 ** 16
+# Derived element separating the result sets of a multi-area query
+AREA_MARKER = 'boundary_marker'
+# Progress manifest stage of the building objects per area in 01_raw
+RAW_BUILDINGS_STAGE = 'raw_buildings'
+
+# Standard column set of crawled building objects
+BUILDING_COLUMNS = ('type', 'id', 'nodes', 'center.lat', 'center.lon',
+                    'tags.building', 'tags.building:levels', 'tags.source',
+                    'tags.addr:city', 'tags.addr:housenumber', 'tags.addr:postcode',
+                    'tags.addr:street', 'tags.addr:suburb')
+# Crawled with wire format "geom": footprint as hex WKB
+GEOMETRY_COLUMNS = BUILDING_COLUMNS + (GEOMETRY_COLUMN,)
+
 
 # 1st node
-def get_data(plz_ags, boundary_type, saved_location):
+def get_data(plz_ags, boundary_type, raw_buildings, overpass, acquisition_mode='overpass', manifest_path=None):
     """
     Function to acquire building objects in each postal code
-    Check current crawling progress by scanning "saved_location" for missing postal codes
+    Check current crawling progress in the progress manifest (stage "raw_buildings" of the store)
+    Areas are crawled concurrently by a bounded pool of workers sharing one HTTP session
         Args:
 
              plz_ags: collection of postal code and ags code in Germany
              boundary_type: separate crawled data based on PLZ or AGS code
-             saved_location: saved location of crawled data
+             raw_buildings: store of the crawled data (01_raw)
+             overpass: Overpass API settings (url, status_url, max_concurrency, areas_per_query, retries, backoff and response cache)
+             acquisition_mode: overpass or pbf, this node only runs in overpass mode (see "extract_pbf_data")
+             manifest_path: location of the progress manifest
     """
-    # Create saved location if not existed
-    if not os.path.exists(saved_location):
-        os.makedirs(saved_location)
+    if acquisition_mode != 'overpass':
+        return None
 
     # Check for progress of crawled postal codes
-    name_list = os.listdir(saved_location)
-    done_id = [x.split('.')[0].split('_')[2] for x in name_list if 'buildings' in x]
+    stage = raw_buildings.stage_name(RAW_BUILDINGS_STAGE)
+    manifest = StageManifest(manifest_path or DEFAULT_MANIFEST_PATH)
+    manifest.bootstrap(stage, raw_buildings)
+    done_id = manifest.done_ids(stage)
 
     # Get to-be-crawled list
     id_list = plz_ags[plz_ags[boundary_type].isin(done_id) == False][[boundary_type]]\
@@ -68,43 +103,250 @@ def get_data(plz_ags, boundary_type, saved_location):
 
     logging.info(f'Start crawling for a total of {len(id_list)} {boundary_type}(s) out of {len(plz_ags[[boundary_type]].drop_duplicates())} {boundary_type}(s)')
 
-    # Define start-end point
-    start = 0
+    max_concurrency = max(int(overpass.get('max_concurrency', 1)), 1)
     end = len(id_list)
 
-    while start <= end - 1:
-        # Get all the building foot prints in target postal code
-        boundary_id = id_list[boundary_type][start]
+    # Number of in-flight requests adapts to the throttling of the endpoint
+    controller = RateController(max_concurrency=max_concurrency,
+                                backoff_base=overpass.get('backoff_base', 1.0),
+                                backoff_max=overpass.get('backoff_max', 120.0))
+    # Raw responses are kept, so re-parsing never touches the network again
+    cache = ResponseCache.from_config(overpass.get('cache'))
+    if cache is not None and cache.offline:
+        logging.info(f'Offline mode, replaying responses from {cache.cache_dir}')
+
+    # One pooled keep-alive session shared by all workers
+    with create_session(max_concurrency) as session, \
+            ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        if overpass.get('status_url') and not (cache is not None and cache.offline):
+            try:
+                controller.update_from_status(session.get(overpass['status_url']).text)
+            except requests.exceptions.RequestException as e:
+                logging.warning(e)
+
+        # Small areas are packed into multi-area queries to save per-request overhead
+        areas_per_query = max(int(overpass.get('areas_per_query', 1)), 1)
+        id_batches = [list(id_list[boundary_type][i:i + areas_per_query])
+                      for i in range(0, end, areas_per_query)]
+
+        futures = {executor.submit(timed,
+                                   crawl_batch,
+                                   session,
+                                   controller,
+                                   overpass,
+                                   cache,
+                                   boundary_type,
+                                   boundary_ids,
+                                   raw_buildings): boundary_ids
+                   for boundary_ids in id_batches}
+
+        start = 0
+        wire_format = overpass.get('wire_format', 'json')
+        for future in as_completed(futures):
+            try:
+                duration, saved = future.result()
+            except Exception as e:
+                logging.error(e)
+                duration, saved = None, {}
+
+            for boundary_id in futures[future]:
+                start = start + 1
+                input_hash = ResponseCache.key(with_wire_format(build_overpass_query(boundary_type, boundary_id), wire_format))
+                if saved.get(boundary_id):
+                    manifest.record(stage, boundary_id,
+                                    rows=saved[boundary_id],
+                                    input_hash=input_hash,
+                                    duration=duration / len(futures[future]) if duration else None,
+                                    output_path=raw_buildings.path(boundary_id))
+                    logging.info(f'{start}/{end} Complete extraction for {boundary_type} {boundary_id}')
+                else:
+                    manifest.record(stage, boundary_id, FAILED, input_hash=input_hash)
+                    logging.error(f'{start}/{end} Can not extract data for {boundary_type} {boundary_id}')
+
+    manifest.close()
+    return None
 
-        start = start + 1
 
-        # Extract buildings
-        results_df = get_buildings(boundary_type, boundary_id)
+def timed(func, *args):
+    """Call func(*args), return (elapsed seconds, result)"""
+    start = time.monotonic()
+    result = func(*args)
+    return time.monotonic() - start, result
 
-        # Add boundary id
-        results_df.insert(len(results_df), boundary_type, boundary_id)
 
-        save_path = f'{saved_location}/buildings_{boundary_type}_{boundary_id}.csv'
+def create_session(max_concurrency: int):
+    """
+    Create a HTTP session with a connection pool large enough for all crawling workers
+    Connections are kept alive between requests and responses are requested gzip-compressed
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=max_concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate',
+                            'Connection': 'keep-alive'})
+    return session
 
-        # Save results
-        if results_df.empty:
-            logging.error(f'{start}/{end} Can not extract data for {boundary_type} {boundary_id}')
-        else:
-            # Saving files
-            save_building_result(results_df, save_path)
-            logging.info(f'{start}/{end} Complete extraction for {boundary_type} {boundary_id}')
 
+def crawl_area(session, controller, overpass, cache, boundary_type, boundary_id, raw_buildings):
+    """
+    Extract and save building objects of a single PLZ/AGS area
+    The response is streamed batch by batch into a temporary file, renamed once complete
+    Areas failing as a whole are crawled in bounding box tiles (if tiling is enabled)
+
+    Returns:
+        number of saved building objects, 0 if no data could be extracted
+    """
+    try:
+        with raw_buildings.writer(boundary_id) as writer:
+            # Extract buildings
+            for results_df in iter_buildings(boundary_type, boundary_id,
+                                             session=session,
+                                             controller=controller,
+                                             overpass=overpass,
+                                             cache=cache):
+                # Add boundary id
+                results_df[boundary_type] = boundary_id
+
+                # Saving files
+                save_building_result(results_df, writer)
+    except OverpassError as e:
+        # Area too large or dense for one query (etc: timeout, out of memory)
+        if not (overpass or {}).get('tiling', {}).get('enabled', False):
+            raise
+        logging.warning(f'{e}. Splitting {boundary_type} {boundary_id} into tiles')
+        with raw_buildings.writer(boundary_id) as writer:
+            crawl_tiled(session, controller, overpass, cache, boundary_type, boundary_id, writer)
+
+    return writer.rows
+
+
+def crawl_tiled(session, controller, overpass, cache, boundary_type, boundary_id, writer):
+    """
+    Crawl a PLZ/AGS area tile by tile into `writer` (see `BuildingStore.writer`)
+    Tiles are planned from the area's bounding box and estimated building count,
+    failing tiles are split again into quadrants up to `overpass['tiling']['max_depth']` times.
+    Buildings crossing tile borders are returned for every tile and are deduplicated by OSM type and id
+
+    Returns:
+        number of saved building objects
+    """
+    tiling = overpass.get('tiling', {})
+    batch_size = overpass.get('batch_size', 10000)
+    wire_format = overpass.get('wire_format', 'json')
+
+    bbox = get_area_bbox(boundary_type, boundary_id, session, controller, overpass, cache)
+    estimated_count = count_buildings(boundary_type, boundary_id, session, controller, overpass, cache)
+    tiles = [(tile, 0) for tile in plan_tiles(bbox, estimated_count,
+                                               tiling.get('max_buildings_per_tile', 50000))]
+    logging.info(f'Crawling {boundary_type} {boundary_id} (~{estimated_count} buildings) in {len(tiles)} tiles')
+
+    seen = set()
+    rows = 0
+    while tiles:
+        tile, depth = tiles.pop()
+        overpass_query = with_wire_format(build_tile_query(boundary_type, boundary_id, tile), wire_format)
+        try:
+            for results_df in iter_query_frames(overpass_query, session, controller, overpass, cache,
+                                                batch_size=batch_size, wire_format=wire_format):
+                # Drop buildings already saved from a neighbouring tile
+                keys = list(zip(results_df['type'], results_df['id']))
+                is_new = [key not in seen for key in keys]
+                seen.update(keys)
+
+                save_building_result(results_df[is_new].assign(**{boundary_type: boundary_id}), writer)
+                rows = rows + sum(is_new)
+        except OverpassError as e:
+            if depth >= tiling.get('max_depth', 4):
+                raise
+            logging.warning(f'{e}. Splitting tile {tile} of {boundary_type} {boundary_id}')
+            tiles.extend((sub_tile, depth + 1) for sub_tile in split_bbox(tile))
+    return rows
+
+
+def get_area_bbox(boundary_type, boundary_id, session=None, controller=None, overpass=None, cache=None):
+    """Bounding box (south, west, north, east) of a PLZ/AGS boundary relation"""
+    statements = ['[out:json];'] + area_statements(boundary_type, boundary_id, 'a')
+    statements += ['rel(pivot.a);', 'out bb;']
+    for element in iter_query_elements('\n'.join(statements), session, controller, overpass, cache):
+        if 'bounds' in element:
+            bounds = element['bounds']
+            return bounds['minlat'], bounds['minlon'], bounds['maxlat'], bounds['maxlon']
+    raise OverpassError(f'No boundary found for {boundary_type} {boundary_id}')
+
+
+def count_buildings(boundary_type, boundary_id, session=None, controller=None, overpass=None, cache=None):
+    """Estimated number of buildings in a PLZ/AGS area, None if the count query fails as well"""
+    statements = ['[out:json];'] + area_statements(boundary_type, boundary_id, 'a')
+    statements += ['nwr["building"](area.a);', 'out count;']
+    try:
+        for element in iter_query_elements('\n'.join(statements), session, controller, overpass, cache):
+            if element.get('type') == 'count':
+                return int(element['tags']['total'])
+    except OverpassError as e:
+        logging.warning(e)
     return None
 
 
-def get_buildings(boundary_type: str, boundary_id: str):
+def crawl_batch(session, controller, overpass, cache, boundary_type, boundary_ids, raw_buildings):
     """
-    Acquire list of buildings from OpenStreetMap through the following ID type
+    Extract and save building objects of several PLZ/AGS areas with one multi-area query
+    Falls back to one query per area if the multi-area query fails (etc: timeout)
+
+    Returns:
+        dictionary of boundary id -> number of saved building objects (0 if not saved)
+    """
+    if len(boundary_ids) == 1:
+        return {boundary_ids[0]: crawl_area(session, controller, overpass, cache,
+                                            boundary_type, boundary_ids[0], raw_buildings)}
+
+    overpass = overpass or {}
+    wire_format = overpass.get('wire_format', 'json')
+    overpass_query = with_wire_format(build_batch_query(boundary_type, boundary_ids), wire_format, key=boundary_type)
+    writers = {boundary_id: raw_buildings.writer(boundary_id) for boundary_id in boundary_ids}
+
+    try:
+        with open_overpass(overpass_query, session, controller, overpass, cache) as chunks:
+            if chunks is None:
+                raise OverpassError(f'No response for {boundary_type}(s) {boundary_ids}')
+            # Split result sets back into their areas
+            parse = iter_csv_frames if wire_format == 'csv' else iter_area_frames
+            for boundary_id, results_df in parse(chunks, building_columns(wire_format),
+                                                 marker=AREA_MARKER,
+                                                 key=boundary_type,
+                                                 batch_size=overpass.get('batch_size', 10000)):
+                results_df[boundary_type] = boundary_id
+                save_building_result(results_df, writers[boundary_id])
+    except Exception as e:
+        logging.warning(f'Multi-area query failed, fall back to single queries. Error: {e}')
+        for writer in writers.values():
+            writer.abort()
+        if cache is not None:
+            cache.discard(overpass_query)
+
+        saved = {}
+        for boundary_id in boundary_ids:
+            try:
+                saved[boundary_id] = crawl_area(session, controller, overpass, cache,
+                                                boundary_type, boundary_id, raw_buildings)
+            except Exception as e:
+                logging.error(e)
+                saved[boundary_id] = 0
+        return saved
+
+    saved = {}
+    for boundary_id, writer in writers.items():
+        saved[boundary_id] = writer.rows if writer.commit() else 0
+    return saved
+
+
+def build_overpass_query(boundary_type: str, boundary_id: str):
+    """
+    Render the Overpass QL query for all buildings in the following ID type
         - Postal code (PLZ)
         - Official community key (AGS)
     """
-
-    overpass_url = "http://overpass-api.de/api/interpreter"
     if boundary_type == 'plz':
         overpass_query = f"""
                         [out:json];
@@ -125,65 +367,234 @@ def get_buildings(boundary_type: str, boundary_id: str):
                         );
                         out center;  
                         """
-    status = 0
-    counter = 0
-    # Try 3 times with wait time 1s if status is not 200
-    while (status != 200) & (counter <= 3):
-        # Send request to api
-        response = requests.get(overpass_url,
-                                params={'data': overpass_query})
-        status = response.status_code
-        counter = counter + 1
+    else:
+        raise ValueError(f'Unknown boundary type {boundary_type}')
+    return overpass_query
 
-        if status == 200:
-            counter = 3
 
-        time.sleep(1)  # wait 1s
+def build_batch_query(boundary_type: str, boundary_ids):
+    """
+    Render one Overpass QL query for all buildings in several PLZ/AGS areas
+    The result set of each area is preceded by a derived marker element tagged with its boundary id
+    """
+    statements = ['[out:json];']
+    for k, boundary_id in enumerate(boundary_ids):
+        statements += area_statements(boundary_type, boundary_id, f'a{k}')
+        statements.append(f'make {AREA_MARKER} {boundary_type}="{boundary_id}";')
+        statements.append('out;')
+        statements.append(f'nwr["building"](area.a{k});')
+        statements.append('out center;')
 
-    try:
-        # Only get contains of elements (building footprints)
-        data = response.json()
-        data = data['elements']
+    return '\n'.join(statements)
 
-        result = pd.json_normalize(data)
-    except:
-        result = pd.DataFrame()  # return empty dataframe
-    return result
 
+def build_tile_query(boundary_type: str, boundary_id: str, bbox):
+    """Render the Overpass QL query for all buildings of a PLZ/AGS area inside a bounding box tile"""
+    south, west, north, east = bbox
+    statements = ['[out:json];'] + area_statements(boundary_type, boundary_id, 'a')
+    statements.append(f'nwr["building"](area.a)({south},{west},{north},{east});')
+    statements.append('out center;')
+    return '\n'.join(statements)
 
-def save_building_result(df, csv_path):
-    """ Write results to csv file
-        If newly crawled data has different column sets ==> manipulate the set to fit the standard and save
+
+def with_wire_format(overpass_query: str, wire_format: str = 'json', key: str = None):
+    """
+    Switch a `[out:json]` query to another Overpass output format
+        - json: unchanged
+        - csv: tab-separated standard columns, closed by an end marker row to detect incomplete responses
+        - geom: json with the full geometry of every building instead of its center
+    `key` adds the boundary id column of multi-area markers
+    """
+    if wire_format == 'json':
+        return overpass_query
+    elif wire_format == 'geom':
+        return overpass_query.replace('out center;', 'out geom;')
+    elif wire_format == 'csv':
+        header = f'[out:csv({csv_fields(BUILDING_COLUMNS, key)}; true; "\\t")]'
+        return overpass_query.replace('[out:json]', header, 1) + f'\nmake {END_MARKER};\nout;'
+    raise ValueError(f'Unknown Overpass wire format {wire_format}')
+
+
+def area_statements(boundary_type: str, boundary_id: str, name: str):
+    """Overpass QL statements storing the area of a PLZ/AGS boundary into the set `name`"""
+    if boundary_type == 'plz':
+        return ['area["ISO3166-1"="DE"]->.b;',
+                f"rel(area.b)[postal_code='{boundary_id}'];",
+                f'map_to_area ->.{name};']
+    elif boundary_type == 'ags':
+        return [f'area[type=boundary]["de:amtlicher_gemeindeschluessel"="{boundary_id}"]->.{name};']
+    raise ValueError(f'Unknown boundary type {boundary_type}')
+
+
+def get_buildings(boundary_type: str, boundary_id: str,
+                  session=None, controller: RateController = None, overpass: dict = None,
+                  cache: ResponseCache = None):
     """
+    Acquire list of buildings from OpenStreetMap through the following ID type
+        - Postal code (PLZ)
+        - Official community key (AGS)
+    Throttled (429/504) or failed requests are retried with backoff by the rate controller
+    Raw responses are served from / stored to the response cache if given
+    """
+    try:
+        result = pd.concat(list(iter_buildings(boundary_type, boundary_id,
+                                               session, controller, overpass, cache)),
+                           ignore_index=True)
+    except Exception as e:
+        logging.warning(e)
+        result = pd.DataFrame()  # return empty dataframe
+    return result
 
-    standard_df = pd.DataFrame(columns=('type', 'id', 'nodes', 'center.lat', 'center.lon',
-                                        'tags.building', 'tags.building:levels', 'tags.source',
-                                        'tags.addr:city', 'tags.addr:housenumber', 'tags.addr:postcode',
-                                        'tags.addr:street', 'tags.addr:suburb'))
 
-    # Convert to standard dataframe columns
-    df = pd.concat([standard_df, df])[standard_df.columns]
+def iter_buildings(boundary_type: str, boundary_id: str,
+                   session=None, controller: RateController = None, overpass: dict = None,
+                   cache: ResponseCache = None):
+    """
+    Stream building objects of a PLZ/AGS area as dataframes of at most `overpass['batch_size']` rows
+    with the standard column set. Nothing is yielded on a cache miss in offline mode
 
-    if not os.path.exists(csv_path):
-        df.to_csv(csv_path, header=True, index=False)
-    else:
-        df.to_csv(csv_path, mode='a', header=False, index=False)
+    Raises:
+        OverpassError: no response, broken response or Overpass runtime error (etc: timeout)
+    """
+    overpass = overpass or {}
+    wire_format = overpass.get('wire_format', 'json')
+    overpass_query = with_wire_format(build_overpass_query(boundary_type, boundary_id), wire_format)
+
+    yield from iter_query_frames(overpass_query, session, controller, overpass, cache,
+                                 batch_size=overpass.get('batch_size', 10000),
+                                 wire_format=wire_format)
+
+
+def iter_query_frames(overpass_query: str, session=None, controller: RateController = None,
+                      overpass: dict = None, cache: ResponseCache = None, batch_size: int = 10000,
+                      wire_format: str = 'json'):
+    """Stream the elements of an Overpass query (JSON or CSV output) as dataframes with the standard column set"""
+    with open_overpass(overpass_query, session, controller, overpass, cache) as chunks:
+        if chunks is None:
+            if cache is not None and cache.offline:
+                return
+            raise OverpassError('No response from Overpass API')
+        try:
+            # Only get contains of elements (building footprints)
+            if wire_format == 'csv':
+                for _, results_df in iter_csv_frames(chunks, BUILDING_COLUMNS, batch_size=batch_size):
+                    yield results_df
+            else:
+                yield from iter_frames(chunks, building_columns(wire_format), batch_size=batch_size)
+        except OverpassError:
+            # Do not replay a broken response
+            if cache is not None:
+                cache.discard(overpass_query)
+            raise
+
+
+def iter_query_elements(overpass_query: str, session=None, controller: RateController = None,
+                        overpass: dict = None, cache: ResponseCache = None):
+    """Stream the raw elements of a (small) Overpass query"""
+    with open_overpass(overpass_query, session, controller, overpass, cache) as chunks:
+        if chunks is None:
+            raise OverpassError('No response from Overpass API')
+        try:
+            yield from iter_elements(chunks)
+        except OverpassError:
+            if cache is not None:
+                cache.discard(overpass_query)
+            raise
+
+
+@contextmanager
+def open_overpass(overpass_query: str, session=None, controller: RateController = None,
+                  overpass: dict = None, cache: ResponseCache = None):
+    """
+    Open the raw response of an Overpass query, from the response cache if possible
 
+    Yields:
+        iterator of (decompressed) byte chunks of the response body, None if not available
+    """
+    overpass = overpass or {}
+
+    if cache is not None:
+        payload = cache.open(overpass_query)
+        if payload is not None:
+            with payload:
+                yield iter_file_chunks(payload, CHUNK_SIZE)
+            return
+        if cache.offline:
+            yield None
+            return
+
+    http = session if session is not None else requests
+    controller = controller if controller is not None else RateController()
+
+    # Send request to api
+    response = request_with_backoff(http,
+                                    overpass.get('url', OVERPASS_URL),
+                                    controller,
+                                    max_retries=overpass.get('max_retries', 3),
+                                    status_url=overpass.get('status_url'),
+                                    params={'data': overpass_query},
+                                    stream=True)
+    if response is None:
+        yield None
+        return
+
+    with response:
+        if cache is None:
+            yield response.iter_content(chunk_size=CHUNK_SIZE)
+            return
+        # Stream body into the cache and replay it from there
+        cache.put(overpass_query, response.iter_content(chunk_size=CHUNK_SIZE))
+
+    payload = cache.open(overpass_query)
+    if payload is None:
+        # entry gone already (etc: evicted by a parallel worker), stream the query straight from the server
+        logging.warning('Response left the cache before it was read, querying Overpass API again without cache')
+        with open_overpass(overpass_query, session, controller, overpass) as chunks:
+            yield chunks
+        return
+    with payload:
+        yield iter_file_chunks(payload, CHUNK_SIZE)
+
+
+def building_columns(wire_format: str = 'json'):
+    """Column set of building objects crawled with `wire_format`"""
+    return GEOMETRY_COLUMNS if wire_format == 'geom' else BUILDING_COLUMNS
+
+
+def save_building_result(df, writer):
+    """ Write results to the file of an area (see `BuildingStore.writer`)
+        If newly crawled data has different column sets ==> manipulate the set to fit the standard and save
+        Footprint geometry (if crawled) is kept after the standard columns
+    """
 
-# 2nd node
+    # Convert to standard dataframe columns, typed with the schema registry
+    df = conform(df, GEOMETRY_COLUMNS if GEOMETRY_COLUMN in df.columns else BUILDING_COLUMNS)
 
-class DownloadProgressBar(tqdm):
-    def update_to(self, b=1, bsize=1, tsize=None):
-        if tsize is not None:
-            self.total = tsize
-        self.update(b * bsize - self.n)
+    writer.write(df)
 
 
+# 2nd node
 def download_url(state_list, geofabrik):
+    """
+    Download Geofabrik region dumps of all states in "state_list"
+    Several regions are fetched concurrently, partial files are resumed
+    and every file is verified against its md5 sidecar before it is renamed into place.
+    Regions unchanged on the server since the last run (ETag/Last-Modified in the freshness manifest) are skipped
+
+    With update_mode "replication", existing dumps are brought up to date with the daily diffs (.osc.gz)
+    of their replication server instead, only missing dumps are downloaded in full
+
+    Args:
+        state_list: list of states in Germany
+        geofabrik: Geofabrik settings (output_path, manifest_path, update_mode, max_parallel_downloads, download urls per state)
+    Returns:
+        changed_regions: region files changed in this run, mapped to the ids of the touched buildings
+            (None if the whole file was downloaded) (etc: {'bremen-latest.osm.pbf': [4711, 4712]})
+    """
+    jobs = []
     # Iterate through states list
     for state in state_list:
         url_list = geofabrik[state]
-        logging.info(f'Downloading Geofabrik data for {state}')
         save_folder = geofabrik['output_path'] + state + "/"
 
         # create saving location folder if not exists
@@ -193,7 +604,151 @@ def download_url(state_list, geofabrik):
         for url in url_list['download_url']:
             filename = urlparse(url).path.split('/')
             output_path = save_folder + filename[len(filename) - 1]
+            jobs.append((url, output_path))
+
+    changed_regions = {}
+    max_workers = geofabrik.get('max_parallel_downloads', 4)
+    if geofabrik.get('update_mode', 'download') == 'replication':
+        jobs, changed_regions = update_regions(jobs, max_workers, geofabrik.get('replication_max_size_kb', 512 * 1024))
+
+    manifest = FreshnessManifest(geofabrik['manifest_path']) if geofabrik.get('manifest_path') else None
 
-            with DownloadProgressBar(unit='B', unit_scale=True,
-                                     miniters=1, desc=url.split('/')[-1]) as t:
-                urllib.request.urlretrieve(url, filename=output_path, reporthook=t.update_to)
+    logging.info(f'Checking {len(jobs)} Geofabrik file(s) for {len(state_list)} state(s)')
+    results = download_files(jobs,
+                             max_workers=max_workers,
+                             verify_md5=geofabrik.get('verify_md5', True),
+                             manifest=manifest)
+    for url, output_path in jobs:
+        if results[url] is True:
+            changed_regions[os.path.basename(output_path)] = None
+
+    logging.info(f'{len(changed_regions)} Geofabrik file(s) changed: {sorted(changed_regions)}')
+    return changed_regions
+
+
+def update_regions(jobs, max_workers: int = 4, max_size_kb: int = 512 * 1024):
+    """
+    Apply replication diffs to the existing dumps of (url, output_path) jobs
+
+    Returns:
+        jobs left for a full download (no local dump / no replication state in its header),
+        dictionary of updated region file -> sorted list of touched building ids
+    """
+    def update(job):
+        url, output_path = job
+        if not os.path.exists(output_path):
+            return None
+        try:
+            return update_region(output_path, replication_url(url), max_size_kb)
+        except ValueError as e:
+            # Dump without replication state
+            logging.warning(e)
+            return None
+
+    download_jobs = []
+    changed_regions = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(update, job): job for job in jobs}
+        for future in as_completed(futures):
+            url, output_path = futures[future]
+            try:
+                touched = future.result()
+            except Exception as e:
+                logging.error(f'Can not apply replication diffs to {output_path}. Error: {e}')
+                continue
+
+            if touched is not None:
+                changed_regions[os.path.basename(output_path)] = sorted(touched)
+            elif not os.path.exists(output_path) or not read_header(output_path)[SEQUENCE_HEADER]:
+                download_jobs.append((url, output_path))
+    return download_jobs, changed_regions
+
+
+# 3rd node
+def extract_pbf_data(plz_ags, boundary_type, raw_buildings, geofabrik, changed_regions, acquisition_mode,
+                     manifest_path=None):
+    """
+    PBF-only acquisition: extract building objects of each postal code straight from the Geofabrik region dumps
+    (instead of crawling Overpass, see "acquisition_mode")
+    Buildings are assigned to their PLZ/AGS with a spatial join against the boundaries in the dump,
+    results are saved like in "get_data". Regions are read if some of their areas are not extracted yet,
+    or if the dump changed in the last refresh (all areas of the region are extracted again, once per dump version)
+
+        Args:
+
+             plz_ags: collection of postal code and ags code in Germany
+             boundary_type: separate extracted data based on PLZ or AGS code
+             raw_buildings: store of the extracted data (01_raw)
+             geofabrik: Geofabrik settings (output_path, ags_code of each region dump)
+             changed_regions: region files changed in the last refresh (output of "download_url")
+             acquisition_mode: overpass or pbf, this node only runs in pbf mode
+             manifest_path: location of the progress manifest
+    """
+    if acquisition_mode != 'pbf':
+        return None
+
+    # Check for progress of extracted postal codes
+    stage = raw_buildings.stage_name(RAW_BUILDINGS_STAGE)
+    manifest = StageManifest(manifest_path or DEFAULT_MANIFEST_PATH)
+    manifest.bootstrap(stage, raw_buildings)
+    done_id = manifest.done_ids(stage)
+    changed_regions = changed_regions or {}
+
+    region_list_path = [os.path.join(path, name) for path, subdirs, files in os.walk(geofabrik['output_path'])
+                        for name in files if name in geofabrik['ags_code']]
+
+    for i, region_path in enumerate(region_list_path):
+        target_region = os.path.basename(region_path)
+        target_ags_list = geofabrik['ags_code'][target_region]
+        ags_len = len(target_ags_list[0])
+
+        # Areas belong to the region
+        region_ids = plz_ags[_left(plz_ags.ags.str, ags_len).isin(target_ags_list)][boundary_type].drop_duplicates()
+        input_hash = file_fingerprint(region_path)
+        if target_region not in changed_regions:
+            region_ids = region_ids[~region_ids.isin(done_id)]
+        else:
+            # changed regions stay listed until the next refresh, areas extracted from this dump are current
+            region_ids = region_ids[[not manifest.is_done(stage, boundary_id, input_hash) for boundary_id in region_ids]]
+        if len(region_ids) == 0:
+            logging.info(f'{i}/{len(region_list_path)} All {boundary_type}(s) of {target_region} are extracted. Skip')
+            continue
+
+        logging.info(f'{i}/{len(region_list_path)} Extracting {len(region_ids)} {boundary_type}(s) from {target_region}')
+        try:
+            start = time.monotonic()
+            saved = extract_region(region_path, boundary_type, set(region_ids), raw_buildings)
+            for boundary_id, rows in saved.items():
+                manifest.record(stage, boundary_id,
+                                rows=rows,
+                                input_hash=input_hash,
+                                duration=(time.monotonic() - start) / len(saved),
+                                output_path=raw_buildings.path(boundary_id))
+            logging.info(f'Complete extraction for {len(saved)}/{len(region_ids)} {boundary_type}(s) of {target_region}')
+            missing = sorted(set(region_ids) - set(saved))
+            if missing:
+                logging.warning(f'No boundary or buildings in {target_region} for {boundary_type}(s) {missing}')
+        except Exception as e:
+            logging.error(e)
+            logging.error(f'Can not extract data from {target_region}')
+
+    manifest.close()
+    return None
+
+
+def extract_region(region_path, boundary_type, boundary_ids, raw_buildings):
+    """
+    Extract and save building objects of the PLZ/AGS areas "boundary_ids" from one region dump
+
+    Returns:
+        dictionary of saved area id -> number of building objects
+    """
+    osm = OSM(region_path)
+    buildings = extract_buildings(osm, boundary_type, BUILDING_COLUMNS, boundary_ids)
+
+    saved = {}
+    for boundary_id, results_df in buildings.groupby(boundary_type, sort=False):
+        with raw_buildings.writer(boundary_id) as writer:
+            save_building_result(results_df, writer)
+        saved[boundary_id] = writer.rows
+    return saved
@@ -41,7 +41,10 @@ def create_pipeline(**kwargs):
                 func=get_data,
                 inputs=['raw_plz_ags',
                         'params:boundary_type',
-                        'params:raw_buildings_path'],
+                        'raw_buildings',
+                        'params:overpass',
+                        'params:acquisition_mode',
+                        'params:manifest_path'],
                 outputs=None,
                 name='get_overpass_data'
             ),
@@ -49,8 +52,20 @@ def create_pipeline(**kwargs):
                 func=download_url,
                 inputs=['params:state_list',
                         'params:geofabrik'],
-                outputs=None,
+                outputs='geofabrik_changed_regions',
                 name='get_geofabrik_data'
+            ),
+            node(
+                func=extract_pbf_data,
+                inputs=['raw_plz_ags',
+                        'params:boundary_type',
+                        'raw_buildings',
+                        'params:geofabrik',
+                        'geofabrik_changed_regions',
+                        'params:acquisition_mode',
+                        'params:manifest_path'],
+                outputs=None,
+                name='get_pbf_data'
             )
     ], tags='data_acquisition_pipeline'
     )
@@ -32,85 +32,268 @@ generated using Kedro 0.16.6
 import pandas as pd
 import numpy as np
 import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
-from pyrosm import OSM
+from src.cheapatlas.commons.area_stats import area_stats
+from src.cheapatlas.commons.atomic_io import AtomicCsvWriter
+from src.cheapatlas.commons.geometry import to_geometry_array
 from src.cheapatlas.commons.helpers import _left
+from src.cheapatlas.commons.manifest import DEFAULT_MANIFEST_PATH, StageManifest, file_fingerprint
+from src.cheapatlas.commons.region_cache import RegionBuildings, RegionCache, read_region_buildings
+from src.cheapatlas.commons.region_index import IndexedBuildings
+from src.cheapatlas.commons.region_table import publish_region_table
+from src.cheapatlas.commons.scheduler import run_within_budget
+from src.cheapatlas.commons.taxonomy import BuildingTaxonomy
 
 # for logging
 import logging
 log = logging.getLogger(__name__)
 
+# Progress manifest stage of the enhanced building objects per area in 02_intermediate
+INT_BUILDINGS_STAGE = 'int_buildings'
+# Progress manifest stage of the region dump changes already enhanced (boundary id: region dump name)
+REGION_CHANGES_STAGE = 'int_region_changes'
+# estimated memory of a region worker beside the region buildings (interpreter, libraries, one area)
+WORKER_MEMORY_MB = 256
+
 
 def get_region_data(plz_ags,
                     boundary_type,
                     geofabrik,
-                    int_buildings_path, buildings_boundary_path):
+                    building_taxonomy,
+                    int_buildings, raw_buildings,
+                    changed_regions=None, manifest_path=None):
     """
     Enhance building objects data in all PLZ with data from OSM region dump (Geofabrik)
     1. Geometry
-    2. Classification (manual)
+    2. Classification (manual, `building_taxonomy`)
+
+    Areas of regions changed in the last Geofabrik refresh are enhanced again
+    (only those with touched buildings if the dump was updated with replication diffs), once per change of the dump,
+    regions without change are only read if some of their areas were not enhanced yet
+    With `region_workers` > 1, regions are enhanced in parallel worker processes, as many at once
+    as their estimated memory (from the size of their dump) fits in `memory_budget_mb`
 
     Args:
         plz_ags: collection of postal code and ags code in Germany
         boundary_type: PLZ or AGS
-        geofabrik: Geofabrik region OSM data saved location (etc: data/01_raw/geofabrik/)
-        int_buildings_path: output save to 02_intermediate
-        buildings_boundary_path: saved location of 01_raw/buildings_path
+        geofabrik: Geofabrik region OSM data saved location (etc: data/01_raw/geofabrik/), parsed buildings cache,
+            region reader (pyrosm: whole region in memory, stream: bounded chunks into the cache) and parallel mode
+        building_taxonomy: building type -> OSM building tags of the naive classification
+        int_buildings: store of the output in 02_intermediate
+        raw_buildings: store of the building objects in 01_raw
+        changed_regions: region files changed in the last refresh -> touched building ids (None: whole file),
+            None to treat all regions as unchanged
+        manifest_path: location of the progress manifest
     Returns:
 
     """
 
-    # full path pbf
-    region_list_path = [os.path.join(path, name) for path, subdirs, files in os.walk(geofabrik['output_path']) for name in files]
-    # region pbf name
-    pbf_list = [name for path, subdirs, files in os.walk(geofabrik['output_path']) for name in files]
-
-    # create saving location folder if not exists
-    if not os.path.exists(int_buildings_path):
-        os.makedirs(int_buildings_path)
-
-    # Start loop for all region
-    i = 0
-    while i < len(pbf_list):
-        # Get target region
-        target_region_path = region_list_path[i]
-        target_region = pbf_list[i]
+    # full path pbf (only known region dumps, etc: no partial downloads)
+    region_list_path = {name: os.path.join(path, name) for path, subdirs, files in os.walk(geofabrik['output_path'])
+                        for name in files if name in geofabrik['ags_code']}
+    # region pbf name (regions without dump are still enhanced if their areas were crawled with geometry)
+    pbf_list = list(geofabrik['ags_code'])
+    changed_regions = changed_regions or {}
+    # Buildings parsed from unchanged region dumps are loaded from the cache
+    cache = RegionCache(geofabrik['buildings_cache_path']) if geofabrik.get('buildings_cache_path') else None
+    read_args = dict(cache=cache, reader=geofabrik.get('region_reader', 'pyrosm'),
+                     **{key: geofabrik[key] for key in ('max_chunk_mb', 'node_index') if key in geofabrik})
+    manifest_path = manifest_path or DEFAULT_MANIFEST_PATH
+    # Compiled once, sent along to the workers
+    taxonomy = BuildingTaxonomy(building_taxonomy)
+
+    # Progress of already enhanced areas
+    stage = int_buildings.stage_name(INT_BUILDINGS_STAGE)
+    manifest = StageManifest(manifest_path)
+    manifest.bootstrap(stage, int_buildings)
+
+    # Regions to enhance: (name, dump path, arguments of `enhance_region` but the area workers)
+    jobs = []
+    for target_region in pbf_list:
+        target_region_path = region_list_path.get(target_region)
         # Get AGS code belong to the target region
         target_ags_list = geofabrik['ags_code'].get(target_region)
-
-        logging.info(f'{i}/{len(pbf_list)} Reading OSM info of {target_region}')
         # Length of AGS (2 or 3)
         ags_len = len(target_ags_list[0])
 
-        # Initialize the OSM parser object
-        osm = OSM(target_region_path)
         try:
-            # Get buildings in the region
-            buildings = osm.get_buildings()
-
             # Extract info of all PLZ/AGS belong to that region
             region_id_list = plz_ags[(_left(plz_ags.ags.str, ags_len).isin(target_ags_list))][[boundary_type]].drop_duplicates().reset_index(drop=True)
 
-            logging.info(f'Total of {len(buildings)} buildings for {len(region_id_list)} {boundary_type}(s) in region {target_region}')
+            # Unchanged region without pending areas ==> skip reading the dump
+            touched_ids = changed_regions.get(target_region, [])
+            is_changed = (touched_ids is None or len(touched_ids) > 0) \
+                and not is_change_enhanced(manifest, int_buildings, target_region_path)
+            pending_ids = np.setdiff1d(region_id_list, [] if is_changed else list(manifest.done_ids(stage)))
+            if len(pending_ids) == 0:
+                logging.info(f'{target_region} is unchanged and all its {boundary_type}(s) are enhanced. Skip')
+                continue
+
+            jobs.append((target_region, target_region_path,
+                         (target_region, target_region_path, region_id_list, boundary_type,
+                          raw_buildings, int_buildings, taxonomy, is_changed,
+                          set(touched_ids) if touched_ids is not None else None,
+                          read_args, manifest_path)))
+        except Exception as e:
+            logging.error(e)
+            logging.error(f'Cannot read {target_region} file')
+    manifest.close()
+
+    region_workers = geofabrik.get('region_workers', 1)
+    if region_workers > 1 and len(jobs) > 1:
+        # Regions are independent: several at once in a process pool, as many as fit in the memory budget.
+        # No nested process pools: the areas of a region running in a pool worker are enhanced one after another
+        memory_per_pbf_mb = geofabrik.get('memory_per_pbf_mb', 15)
+        run_within_budget(enhance_region,
+                          [(target_region, region_memory_mb(target_region_path, memory_per_pbf_mb), args + (1,))
+                           for target_region, target_region_path, args in jobs],
+                          geofabrik.get('memory_budget_mb', 8192), region_workers)
+        return
+
+    area_workers = geofabrik.get('area_workers', 1)
+    for i, (target_region, _, args) in enumerate(jobs):
+        logging.info(f'{i}/{len(jobs)} Reading OSM info of {target_region}')
+        try:
+            enhance_region(*args, area_workers)
+        except Exception as e:
+            logging.error(e)
+            logging.error(f'Cannot read {target_region} file')
+
+
+def region_memory_mb(pbf_path, memory_per_pbf_mb: float, area_workers: int = 1) -> float:
+    """
+    Estimated peak memory of enhancing a region, from the size of its dump (no dump: crawled geometry only)
+    With `area_workers` > 1, each area worker process comes on top (the region buildings are shared memory-mapped)
+    """
+    size_mb = os.path.getsize(pbf_path) / 2 ** 20 if pbf_path and os.path.exists(pbf_path) else 0
+    workers = 1 + (area_workers if area_workers > 1 else 0)
+    return workers * WORKER_MEMORY_MB + size_mb * memory_per_pbf_mb
+
+
+def region_change_key(target_region_path):
+    """Fingerprint of the region dump a change was enhanced from, None if not downloaded"""
+    return file_fingerprint(target_region_path) if target_region_path else None
+
+
+def is_change_enhanced(manifest, int_buildings, target_region_path):
+    """
+    Check if the areas of a changed region dump were already enhanced from its current version
+    `geofabrik_changed_regions` is kept until the next refresh, later runs do not enhance the same change again
+    """
+    change_key = region_change_key(target_region_path)
+    return change_key is not None and manifest.is_done(int_buildings.stage_name(REGION_CHANGES_STAGE),
+                                                      os.path.basename(target_region_path), change_key)
+
 
+def enhance_region(target_region, target_region_path, region_id_list, boundary_type,
+                   raw_buildings, int_buildings, taxonomy, is_changed, touched_ids, read_args, manifest_path,
+                   area_workers=1):
+    """
+    Enhance the areas of one region (run in a worker process in parallel mode, see `get_region_data`)
 
+    Args:
+        target_region: region dump name (etc: bremen-latest.osm.pbf)
+        target_region_path: location of the region dump, None if not downloaded
+        region_id_list: dataframe of the PLZ/AGS in the region
+        boundary_type: PLZ or AGS
+        raw_buildings: store of the building objects in 01_raw
+        int_buildings: store of the output in 02_intermediate
+        taxonomy: compiled `BuildingTaxonomy` of the naive classification
+        is_changed: region dump changed in the last refresh, its areas are enhanced again
+        touched_ids: with is_changed, only enhance again the areas containing these building ids (None: all)
+        read_args: arguments of `read_region_buildings` (cache, reader, stream settings)
+        manifest_path: location of the progress manifest
+        area_workers: PLZ/AGS enhanced at once in worker processes, sharing the region buildings
+            through a memory-mapped table (see `region_table`)
+    """
+    stage = int_buildings.stage_name(INT_BUILDINGS_STAGE)
+    manifest = StageManifest(manifest_path)
+    table_folder = None
+    try:
+        pending_ids = np.setdiff1d(region_id_list, [] if is_changed else list(manifest.done_ids(stage)))
+
+        # Areas crawled with their footprint geometry do not need the region dump
+        buildings = None
+        if not all(has_crawled_geometry(raw_buildings, boundary_id) for boundary_id in pending_ids):
+            if target_region_path is None:
+                logging.warning(f'{target_region} is not downloaded, only {boundary_type}(s) crawled with geometry are enhanced')
+            else:
+                # Get buildings in the region (parsed with pyrosm, streamed or cached)
+                buildings = read_region_buildings(target_region_path, **read_args)
+
+                logging.info(f'Total of {len(buildings)} buildings for {len(region_id_list)} {boundary_type}(s) in region {target_region}')
+
+        if area_workers > 1 and len(pending_ids) > 1:
+            # Region buildings published once, workers attach to the memory-mapped file
+            if isinstance(buildings, RegionBuildings):
+                # streamed region: its cache already comes with the memory-mapped table
+                buildings = buildings.table
+            elif buildings is not None:
+                # next to the region cache rather than in a temporary folder possibly held in memory (tmpfs)
+                cache = read_args.get('cache')
+                if cache is not None:
+                    os.makedirs(cache.folder, exist_ok=True)
+                table_folder = tempfile.mkdtemp(prefix='region_table_', dir=cache.folder if cache else None)
+                buildings = publish_region_table(buildings, os.path.join(table_folder, f'{target_region}.arrow'))
+
+            # Areas dealt round-robin to the workers
+            id_lists = [region_id_list.iloc[i::area_workers * 4] for i in range(area_workers * 4)]
+            with ProcessPoolExecutor(max_workers=area_workers) as executor:
+                for future in [executor.submit(enhance_areas, id_list, buildings, raw_buildings, int_buildings,
+                                               taxonomy, is_changed, touched_ids, manifest_path)
+                               for id_list in id_lists if len(id_list) > 0]:
+                    future.result()
+        else:
             # Iterate through list of PLZ/AGS to enhance dataset
             enhance_area(region_id_list,
                         'ags',
                         buildings,
-                        buildings_boundary_path,
-                        int_buildings_path)
-
-        except Exception as e:
-            logging.error(e)
-            logging.error(f'Cannot read {target_region} file')
-            pass
-        finally:
-            i = i + 1
+                        raw_buildings,
+                        int_buildings,
+                        taxonomy,
+                        force=is_changed,
+                        touched_ids=touched_ids,
+                        manifest=manifest)
+
+        # Change of the dump consumed, areas failing meanwhile are still pending
+        if is_changed and target_region_path:
+            manifest.record(int_buildings.stage_name(REGION_CHANGES_STAGE), target_region,
+                            input_hash=region_change_key(target_region_path))
+    finally:
+        manifest.close()
+        if table_folder is not None:
+            shutil.rmtree(table_folder, ignore_errors=True)
+
+
+def enhance_areas(region_id_list, buildings, raw_buildings, int_buildings, taxonomy, force, touched_ids,
+                  manifest_path):
+    """`enhance_area` in a worker process, with its own connection to the progress manifest"""
+    manifest = StageManifest(manifest_path)
+    try:
+        enhance_area(region_id_list.reset_index(drop=True),
+                    'ags',
+                    buildings,
+                    raw_buildings,
+                    int_buildings,
+                    taxonomy,
+                    force=force,
+                    touched_ids=touched_ids,
+                    manifest=manifest)
+    finally:
+        manifest.close()
+
+
+def has_crawled_geometry(raw_buildings, boundary_id):
+    """Check if the building objects of an area were crawled with their footprint (Overpass wire format "geom")"""
+    return raw_buildings.exists(boundary_id) and 'geometry' in raw_buildings.columns(boundary_id)
 
 
 def enhance_area(region_id_list, boundary_type,
-                buildings, buildings_boundary_path, int_buildings_path):
+                buildings, raw_buildings, int_buildings, taxonomy,
+                force=False, touched_ids=None, manifest=None):
     """
     Scan all available PLZ/AGS in the region.
     Populate PLZ/AGS building objects with data from region OSM dump (Geofabrik)
@@ -118,57 +301,81 @@ def enhance_area(region_id_list, boundary_type,
     Args:
         region_id_list: list of PLZs in the region
         boundary_type: PLZ or AGS code
-        buildings: buildings dataframe from region OSM
-        buildings_boundary_path: saved location at 01_raw/buildings_path
-        int_buildings_path: output save to 02_intermediate
+        buildings: buildings dataframe from region OSM (indexed by id), `RegionBuildings` or `RegionTable`
+            (read area by area), not needed for areas crawled with geometry
+        raw_buildings: store of the building objects in 01_raw
+        int_buildings: store of the output in 02_intermediate
+        taxonomy: compiled `BuildingTaxonomy` of the naive classification
+        force: enhance again areas already enhanced (etc: region dump changed)
+        touched_ids: with force, only enhance again the areas containing these building ids
+        manifest: progress manifest, the default one if None
     """
     k = 0
+    if manifest is None:
+        manifest = StageManifest(DEFAULT_MANIFEST_PATH)
 
     # Check for progress of already enhanced areas
-    name_list = os.listdir(int_buildings_path)
-    id_list = [x.split('.')[0].split('_')[2] for x in name_list if 'buildings' in x]
+    stage = int_buildings.stage_name(INT_BUILDINGS_STAGE)
+    enhanced_ids = manifest.done_ids(stage)
+    id_list = [] if force else list(enhanced_ids)
 
     # Get to-be-enhanced list (exclude those that already enhanced with GeoFabrik data)
     region_id_list = pd.DataFrame(np.setdiff1d(region_id_list, id_list), columns = [boundary_type])
     logging.info(f'Total of {len(region_id_list)} {boundary_type}(s) in the region')
 
+    if isinstance(buildings, pd.DataFrame):
+        # Id index built once, each area looks up its buildings instead of a merge with the whole region
+        buildings = IndexedBuildings(buildings)
+
     while k < len(region_id_list):
         boundary_id = region_id_list[boundary_type].iloc[k]
-        buildings_path = f'{buildings_boundary_path}/buildings_{boundary_type}_{boundary_id}.csv'
 
         # Read in building objects data in the postal code
         try:
-            df = pd.read_csv(buildings_path,
-                             dtype={'tags.addr:suburb': 'object',
-                                    'tags.building:levels': 'object',
-                                    'tags.source': str,
-                                    'tags.addr:postcode': str},
-                             converters={"nodes": lambda x: x.strip("[]").split(", ")})  # read column as list
-
-            # remove empty elements (no lat/lon)
-            df = df[df['center.lat'].isna() == False].reset_index(drop=True)
-
-            # replace NaN in building_levels
-            df = df.rename(columns={'tags.building:levels': 'building_levels',
-                                    'tags.addr:postcode': 'postcode'})
-
-            # add boundary_id to boundary_type column
-            df[boundary_type] = boundary_id
-            # Fill all missing building level = 1 floor
-            df.building_levels = df.building_levels.fillna(1)
-
-            df_res = df.merge(buildings[['id', 'geometry', 'timestamp']],
-                              how='left',
-                              on='id')
-            df_res.geometry = df_res.geometry.fillna(np.nan)
-
-            # Naive building types classification
-            df_res['building_types'] = df_res['tags.building'].apply(lambda x: manual_classify_building(x))
-
-            # Save result to 02_intermediate/buildings_plz/buildings_<boundary_type>_<boundary_id>.csv
-            logging.info(f'Total of {len(df)} buildings in {boundary_type} {boundary_id} at position {k}/{len(region_id_list)}. Saving result...')
-            # Save result
-            df_res.to_csv(f'{int_buildings_path}/buildings_{boundary_type}_{boundary_id}.csv', index=False)
+            df = raw_buildings.read(boundary_id)  # typed with the schema registry
+
+            # Dump updated with replication diffs: enhanced areas without touched buildings are still current
+            if touched_ids is not None and boundary_id in enhanced_ids and not df['id'].isin(touched_ids).any():
+                continue
+
+            if 'geometry' not in df.columns and buildings is None:
+                logging.warning(f'No region dump to enhance {boundary_type} {boundary_id} at position {k}/{len(region_id_list)}')
+                continue
+
+            with manifest.track(stage, boundary_id, input_hash=file_fingerprint(raw_buildings.path(boundary_id))) as result:
+                # remove empty elements (no lat/lon)
+                df = df[df['center.lat'].isna() == False].reset_index(drop=True)
+
+                # replace NaN in building_levels
+                df = df.rename(columns={'tags.building:levels': 'building_levels',
+                                        'tags.addr:postcode': 'postcode'})
+
+                # add boundary_id to boundary_type column
+                df[boundary_type] = boundary_id
+                # Fill all missing building level = 1 floor
+                df.building_levels = df.building_levels.fillna(1)
+
+                if 'geometry' in df.columns:
+                    # Footprint crawled with the building (WKB), no need for the region dump
+                    df_res = df.drop(columns='geometry').assign(
+                        geometry=to_geometry_array(df['geometry']),
+                        timestamp=np.nan)
+                else:
+                    # Only the buildings of the area are read from the region
+                    region_df = buildings.select(df['id'])
+                    df_res = df.merge(region_df[['id', 'geometry', 'timestamp']],
+                                      how='left',
+                                      on='id')
+                    df_res.geometry = df_res.geometry.fillna(np.nan)
+
+                # Naive building types classification (categorical, one recode of the distinct tags)
+                df_res['building_types'] = taxonomy.classify(df_res['tags.building'])
+
+                # Save result to 02_intermediate/buildings_data
+                logging.info(f'Total of {len(df)} buildings in {boundary_type} {boundary_id} at position {k}/{len(region_id_list)}. Saving result...')
+                # Save result
+                output_path = int_buildings.write(boundary_id, df_res)
+                result.update(rows=len(df_res), output_path=output_path, stats=area_stats(df_res))
 
         except Exception:
             logging.warning(f'Cannot enhance data on {boundary_type} {boundary_id} at position {k}/{len(region_id_list)}')
@@ -176,83 +383,11 @@ def enhance_area(region_id_list, boundary_type,
             k = k + 1
 
 
-def manual_classify_building(building_type):
-    """
-    Adopt manual classification from the paper and add further tags
-    'Estimation of Building Types on OpenStreetMap Based on Urban Morphology Analysis'
-    
-    """
-
-    residential = ['apartments','aparments (s)',
-                   'domitory','house','residential',
-                   'retirement_home', 'terrace',
-                   # self-add
-                  'allotment_house', 'bungalow','summer_house','semidetached_house',
-                  'terraced_house','dwelling_house','dormitory','family_house','static_caravan',
-                   'ger','houseboat']
-    
-    commercial = ['bank','bar','boat_rental','cafe',
-                 'club','dentist','doctors','fast_food','fuel',
-                 'guest_house','hostel','hotel','pharmacy',
-                 'pub','restaurant','restaurant;bierg','shop','supermarket',
-                  # self-added
-                 'commercial','retail','fuel_station','service','kiosk'
-                 ]
-    
-    accessory_storage = ['carport','garage','garages','hut','roof','shelter',
-                         # self-add
-                        'barn','basement','storage_tank','shed','cabin','bunker','chimney','detached',
-                         'parking_garage','container','hangar','silo'
-                        ]
-    
-    accessory_supply = ['car_wash','surveillance','tower','warehouse',
-                        # self-add
-                       'aviary','farm_auxiliary','farm','power','electricity',
-                        'transformer_house','transformer_tower','cowshed'
-                       ]
-    
-    industrial = ['industrial',
-                  # self-add
-                  'construction','manufacture']
-    
-    public = ['MDF','attraction','arts_center','canteen','castle','hospital','church',
-             'college','community_centre','museum','fire_station','greenhouse',
-             'information','kindergarten','library','office','parking',
-             'place_of_worship','police','public','public_building','school',
-             'science_park','station','townhall','train_station','university',
-             'youth_centre','theatre','toilets',
-              # self-add
-              'cathedral','historic','ambulance_station','bridge','government','transportation',
-              'synagogue','sports_centre','ship','mosque','tech_cab','railway','gymnasium','religious',
-              'chapel','civic','sports_hall','pavilion','bahnhof','shrine','ruins','digester'
-             ]
-    
-    not_classified = ['yes','YES']
-    
-    if (building_type in residential):
-        result = 'residential'
-    elif (building_type in commercial):
-        result = 'commercial'
-    elif (building_type in accessory_storage):
-        result = 'accessory_storage'
-    elif (building_type in accessory_supply):
-        result = 'accessory_supply'
-    elif (building_type in industrial):
-        result = 'industrial'
-    elif (building_type in public):
-        result = 'public'
-    elif (building_type in not_classified):
-        result = 'to_be_classified'
-    else:
-        result = 'other'
-    
-    return result
-
-
 def calculate_residential_diff(plz_ags: pd.DataFrame,
                                de_living: pd.DataFrame,
-                               int_buildings_path: str,
-                               rep_diff_result_path: str):
+                               int_buildings,
+                               rep_diff_result_path: str,
+                               manifest_path=None):
     """
     2nd node in data preparation pipeline
     Aim to generate a result dataframe showing the discrepancies between official residential buildings count vs OSM count
@@ -260,8 +395,10 @@ def calculate_residential_diff(plz_ags: pd.DataFrame,
     Args:
         plz_ags: PLZ and AGS list of Germany
         de_living: official residential buildings dataset from Statistical Gov Office Germany
-        int_buildings_path: saved buildings data location in 02_intermediate
+        int_buildings: store of the buildings data in 02_intermediate
         rep_diff_result_path: location of reporting for diff
+        manifest_path: location of the progress manifest, building type counts of the enhanced areas are read
+            from its summary table (areas enhanced before it existed are read once and added to it)
 
     """
     # Rename columns
@@ -275,33 +412,42 @@ def calculate_residential_diff(plz_ags: pd.DataFrame,
     # Remove extra spaces in Names
     de_living['place'] = de_living['place'].apply(lambda x: x.strip())
 
-    for count, boundary_id in enumerate(plz_ags.ags.drop_duplicates()):
-        try:
-            osm_filename = os.path.join(int_buildings_path, f'buildings_ags_{boundary_id}.csv')
-            ags_osm = pd.read_csv(osm_filename)
-
-            diff_result = get_diff_residential_count(de_living, ags_osm, boundary_id)
-
-            if not os.path.exists(rep_diff_result_path):
-                diff_result.to_csv(rep_diff_result_path, header=True, index=False)
-            else:
-                diff_result.to_csv(rep_diff_result_path, mode='a', header=False, index=False)
-            logging.info(f'Complete calculation for {boundary_id} AGS at {count}/{len(plz_ags.ags.drop_duplicates())}')
-        except Exception as e:
-            logging.error(e)
-            logging.error(f'Cannot calculate for {boundary_id} AGS at {count}/{len(plz_ags.ags.drop_duplicates())}')
+    # Building type counts of the enhanced areas, no need to read their footprints
+    stage = int_buildings.stage_name(INT_BUILDINGS_STAGE)
+    manifest = StageManifest(manifest_path or DEFAULT_MANIFEST_PATH)
+    manifest.bootstrap(stage, int_buildings)
+    stats = manifest.stats(stage)
+
+    # Report is rebuilt on every run and replaces the previous one once complete
+    with AtomicCsvWriter(rep_diff_result_path) as writer:
+        for count, boundary_id in enumerate(plz_ags.ags.drop_duplicates()):
+            try:
+                if str(boundary_id) not in stats:
+                    # Enhanced before the summary table existed: read once and keep its summary
+                    stats[str(boundary_id)] = area_stats(int_buildings.read(boundary_id, columns=['building_types']))
+                    manifest.record_stats(stage, boundary_id, stats[str(boundary_id)])
+
+                diff_result = get_diff_residential_count(de_living, stats[str(boundary_id)], boundary_id)
+
+                writer.write(diff_result)
+                logging.info(f'Complete calculation for {boundary_id} AGS at {count}/{len(plz_ags.ags.drop_duplicates())}')
+            except Exception as e:
+                logging.error(e)
+                logging.error(f'Cannot calculate for {boundary_id} AGS at {count}/{len(plz_ags.ags.drop_duplicates())}')
+    manifest.close()
     return None
 
 
 def get_diff_residential_count(de_living: pd.DataFrame,
-                               ags_osm: pd.DataFrame,
+                               type_counts: dict,
                                boundary_id: str):
     """
     Calculate the difference between area's official residential buildings count vs OSM count
 
     Args:
         de_living: official residential buildings dataset from Germany Statistical Office
-        ags_osm: preprocessed data in a AGS (municipal) area from OSM and Geofabrik with preliminary classification for building types
+        type_counts: summary of the AGS (municipal) area from OSM and Geofabrik with preliminary classification,
+            building type -> (buildings, surface area) (see `area_stats`)
         boundary_id: AGS code of the area
 
     Results:
@@ -316,8 +462,8 @@ def get_diff_residential_count(de_living: pd.DataFrame,
     ags_place = de_living[de_living.ags == boundary_id].place.iloc[0]
 
     # OSM residential buildings count
-    osm_count = len(ags_osm[ags_osm.building_types == 'residential'])
-    osm_unidentified_count = len(ags_osm[ags_osm.building_types == 'to_be_classified'])
+    osm_count = type_counts.get('residential', (0, None))[0]
+    osm_unidentified_count = type_counts.get('to_be_classified', (0, None))[0]
 
     # differences in number
     abs_diff = abs(osm_count - official_count)
@@ -41,8 +41,11 @@ def create_pipeline(**kwargs):
             inputs=['raw_plz_ags',
                     'params:boundary_type',
                     'params:geofabrik',
-                    'params:int_buildings_path',
-                    'params:raw_buildings_path'],
+                    'params:building_taxonomy',
+                    'int_buildings',
+                    'raw_buildings',
+                    'geofabrik_changed_regions',
+                    'params:manifest_path'],
             outputs=None,
             name='enhance_bld_data'
         ),
@@ -50,8 +53,9 @@ def create_pipeline(**kwargs):
             func=calculate_residential_diff,
             inputs=['raw_plz_ags',
                     'raw_de_living',
-                    'params:int_buildings_path',
-                    'params:rep_diff_result_path'],
+                    'int_buildings',
+                    'params:rep_diff_result_path',
+                    'params:manifest_path'],
             outputs=None,
             name='calculate_residential_diff'
         )
@@ -0,0 +1,51 @@
+"""
+Fixtures shared by the tests of the commons modules
+"""
+import osmium
+import pytest
+
+NODE = '<node id="{}" version="1" timestamp="2020-01-01T00:00:00Z" lat="{}" lon="{}"/>'
+
+
+def way(way_id, refs, tags):
+    return (f'<way id="{way_id}" version="1" timestamp="2020-01-01T00:00:00Z">'
+            + ''.join(f'<nd ref="{ref}"/>' for ref in refs)
+            + ''.join(f'<tag k="{k}" v="{v}"/>' for k, v in tags.items()) + '</way>')
+
+
+def municipality(relation_id, way_id, ags):
+    return (f'<relation id="{relation_id}" version="1" timestamp="2020-01-01T00:00:00Z">'
+            f'<member type="way" ref="{way_id}" role="outer"/>'
+            '<tag k="type" v="boundary"/><tag k="boundary" v="administrative"/><tag k="admin_level" v="8"/>'
+            f'<tag k="de:amtlicher_gemeindeschluessel" v="{ags}"/></relation>')
+
+
+@pytest.fixture
+def region_dump(tmp_path):
+    """2 municipalities side by side (lon 8.0-8.1 and 8.1-8.2), 3 buildings, 1 building outside both"""
+    elements = [NODE.format(1, 53.0, 8.0), NODE.format(2, 53.0, 8.1), NODE.format(3, 53.1, 8.1),
+                NODE.format(4, 53.1, 8.0), NODE.format(5, 53.0, 8.2), NODE.format(6, 53.1, 8.2)]
+    ways = [way(100, [1, 2, 3, 4, 1], {}), way(101, [2, 5, 6, 3, 2], {})]
+
+    node_id = 10
+    for way_id, lat, lon, tags in [(200, 53.05, 8.05, {'building': 'house', 'building:levels': '2', 'addr:street': 'A'}),
+                                   (201, 53.05, 8.15, {'building': 'garage', 'source': 'survey'}),
+                                   (202, 53.02, 8.12, {'building': 'yes', 'addr:suburb': 'X'}),
+                                   (203, 54.00, 9.00, {'building': 'yes'})]:
+        refs = []
+        for d_lat, d_lon in [(0, 0), (0, 0.001), (0.001, 0.001), (0.001, 0)]:
+            elements.append(NODE.format(node_id, lat + d_lat, lon + d_lon))
+            refs.append(node_id)
+            node_id += 1
+        ways.append(way(way_id, refs + refs[:1], tags))
+
+    xml_path = tmp_path / 'region.osm'
+    xml_path.write_text('<?xml version="1.0" encoding="UTF-8"?><osm version="0.6">'
+                        + '\n'.join(elements + ways + [municipality(1000, 100, '04011000'),
+                                                       municipality(1001, 101, '04012000')])
+                        + '</osm>')
+    pbf_path = str(tmp_path / 'region-latest.osm.pbf')
+    with osmium.SimpleWriter(pbf_path) as writer:
+        for obj in osmium.FileProcessor(str(xml_path)):
+            writer.add(obj)
+    return pbf_path
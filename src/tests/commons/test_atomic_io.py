@@ -0,0 +1,41 @@
+"""
+Tests for atomic output writes
+"""
+import os
+
+import pandas as pd
+import pytest
+
+from src.cheapatlas.commons.atomic_io import AtomicCsvWriter, write_csv
+
+
+def test_writer_commits_batches_and_overwrites(tmp_path):
+    path = str(tmp_path / 'buildings_ags_01001000.csv')
+    write_csv(pd.DataFrame({'id': [9]}), path)
+
+    with AtomicCsvWriter(path) as writer:
+        writer.write(pd.DataFrame({'id': [1, 2]}))
+        # Previous complete file stays in place until commit
+        assert pd.read_csv(path)['id'].tolist() == [9]
+        writer.write(pd.DataFrame({'id': [3]}))
+
+    assert writer.rows == 3
+    assert pd.read_csv(path)['id'].tolist() == [1, 2, 3]
+    assert os.listdir(tmp_path) == ['buildings_ags_01001000.csv']
+
+
+def test_interrupted_writes_leave_no_file(tmp_path):
+    path = str(tmp_path / 'buildings_ags_01001000.csv')
+    with pytest.raises(RuntimeError):
+        with AtomicCsvWriter(path) as writer:
+            writer.write(pd.DataFrame({'id': [1, 2]}))
+            raise RuntimeError('worker killed')
+
+    with pytest.raises(KeyError):
+        write_csv(pd.DataFrame({'id': [1]}), path, columns=['missing'])
+
+    # Nothing written at all ==> no empty file either
+    with AtomicCsvWriter(path) as writer:
+        pass
+    assert not writer.commit()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,98 @@
+"""
+Tests for the per-area building storage backends
+"""
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+import shapely
+
+from src.cheapatlas.commons.building_store import BACKENDS, BuildingStore
+from src.cheapatlas.commons.node_lists import to_node_list_array
+
+
+def buildings(ags, ids):
+    return pd.DataFrame({'type': 'way',
+                         'id': ids,
+                         'center.lat': [50.1] * len(ids),
+                         'tags.building': ['house', None][:len(ids)] + ['yes'] * (len(ids) - 2),
+                         'ags': ags})
+
+
+def test_parquet_partitions_round_trip(tmp_path):
+    store = BuildingStore(str(tmp_path), 'ags', 'parquet')
+    with store.writer('01001000') as writer:
+        writer.write(buildings('01001000', [1, 2]))
+        # later batch with a missing tag and a float id column ==> cast to the schema of the first batch
+        writer.write(buildings('01001000', [3.0]).assign(**{'tags.building': None}))
+    store.write('01002000', buildings('01002000', [4]))
+    store.write('02000000', buildings('02000000', [5]))
+
+    path = store.path('01001000')
+    assert path == os.path.join(str(tmp_path), 'state=01', 'district=01001', 'ags=01001000', 'part-0.parquet')
+    # Partition key not stored in the file, restored on read
+    assert 'ags' not in pq.read_schema(path).names
+    assert pq.ParquetFile(path).metadata.row_group(0).column(0).compression == 'ZSTD'
+
+    df = store.read('01001000')
+    assert list(df.columns) == ['type', 'id', 'center.lat', 'tags.building', 'ags']
+    assert df['id'].tolist() == [1, 2, 3]
+    assert df['tags.building'].iloc[0] == 'house' and df['tags.building'].iloc[1:].isna().all()
+    assert set(df['ags']) == {'01001000'}
+
+    assert sorted(store.existing()) == ['01001000', '01002000', '02000000']
+    assert store.read_prefix('01001')['id'].tolist() == [1, 2, 3]
+    assert store.read_prefix('010')['id'].tolist() == [1, 2, 3, 4]
+    assert store.read('01002000', columns=['id', 'ags']).to_dict('list') == {'id': [4], 'ags': ['01002000']}
+
+
+def test_district_level_and_csv_backend(tmp_path):
+    districts = BuildingStore(str(tmp_path / 'fea'), 'ags', 'parquet')
+    districts.write('01001', buildings('01001000', [1]))
+    assert districts.path('01001').endswith(os.path.join('state=01', 'district=01001', 'part-0.parquet'))
+    assert list(districts.existing()) == ['01001']
+    assert districts.read('01001')['ags'].tolist() == ['01001000']
+
+    csv = BuildingStore(str(tmp_path / 'csv'), 'ags', 'csv')
+    csv.write('01001000', buildings('01001000', [1, 2]))
+    assert csv.path('01001000').endswith('buildings_ags_01001000.csv')
+    assert csv.read('01001000', dtype={'ags': str})['ags'].tolist() == ['01001000'] * 2
+    assert csv.stage_name('int_buildings') == 'int_buildings'
+    assert districts.stage_name('int_buildings') == 'int_buildings.parquet'
+
+    with pytest.raises(ValueError):
+        BuildingStore(str(tmp_path), backend='feather')
+
+
+def test_footprints_stored_as_geoparquet(tmp_path):
+    store = BuildingStore(str(tmp_path), 'ags', 'parquet')
+    square = shapely.box(8.0, 50.0, 8.001, 50.001)
+    store.write('01001000', buildings('01001000', [1, 2]).assign(geometry=[square, None]))
+
+    schema = pq.read_schema(store.path('01001000'))
+    assert str(schema.field('geometry').type) == 'binary'
+    assert b'"primary_column": "geometry"' in schema.metadata[b'geo']
+
+    geometry = store.read('01001000')['geometry']
+    assert shapely.equals(geometry[0], square) and geometry[1] is None
+
+
+def test_node_lists_stored_as_int64_lists(tmp_path):
+    nodes = [[11, 12, 13], None]
+    for backend in BACKENDS:
+        store = BuildingStore(str(tmp_path / backend), 'ags', backend)
+        store.write('01001000', buildings('01001000', [1, 2]).assign(nodes=nodes))
+        df = store.read('01001000')
+        assert str(df['nodes'].dtype.pyarrow_dtype.value_type) == 'int64'
+        assert list(df['nodes'].iloc[0]) == [11, 12, 13] and pd.isna(df['nodes'].iloc[1])
+
+        # Written back unchanged (etc: intermediate stage)
+        store.write('01001000', df)
+        assert list(store.read('01001000')['nodes'].iloc[0]) == [11, 12, 13]
+
+    schema = pq.read_schema(store.path('01001000'))
+    assert str(schema.field('nodes').type.value_type) == 'int64'
+    # CSV files keep the "[1, 2]" text of earlier releases, quoted ids included
+    assert '"[11, 12, 13]"' in open(BuildingStore(str(tmp_path / 'csv'), 'ags', 'csv').path('01001000')).read()
+    assert to_node_list_array(["['1', '2']", None, '[]']).to_pylist() == [[1, 2], None, []]
@@ -0,0 +1,161 @@
+"""
+Tests for the Geofabrik download manager against a local HTTP server serving fixture files
+"""
+import hashlib
+import http.server
+import os
+import threading
+
+import pytest
+import requests
+
+from src.cheapatlas.commons.downloader import DownloadError, download_file, download_files
+from src.cheapatlas.commons.freshness import FreshnessManifest
+
+
+@pytest.fixture
+def file_server(tmp_path):
+    """Serve fixture files with Range and If-None-Match support, `.md5` sidecars and an optional connection drop"""
+    files = {}
+    state = {'drop_after': None, 'requests': []}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            state['requests'].append((self.path, self.headers.get('Range')))
+            name = self.path.lstrip('/')
+            if name.endswith('.md5'):
+                body = files[name[:-4]]['md5'].encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            data = files[name]['data']
+            if self.headers.get('If-None-Match') == files[name]['etag']:
+                self.send_response(304)
+                self.end_headers()
+                return
+            start = 0
+            if self.headers.get('Range') and self.headers.get('If-Range', files[name]['etag']) == files[name]['etag']:
+                start = int(self.headers['Range'].split('=')[1].split('-')[0])
+                if start >= len(data):
+                    self.send_response(416)
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+            else:
+                self.send_response(200)
+            self.send_header('ETag', files[name]['etag'])
+            self.send_header('Content-Length', str(len(data) - start))
+            self.end_headers()
+
+            body = data[start:]
+            if state['drop_after'] is not None:
+                body, state['drop_after'] = body[:state['drop_after']], None
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    def add(name, data, md5=None):
+        files[name] = {'data': data,
+                       'etag': f'"{hashlib.sha1(data).hexdigest()}"',
+                       'md5': f'{md5 or hashlib.md5(data).hexdigest()}  {name}\n'}
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}', add, state
+    server.shutdown()
+
+
+def test_resumes_partial_file_with_range(file_server, tmp_path):
+    url, add, state = file_server
+    data = os.urandom(300 * 1024)
+    add('bremen-latest.osm.pbf', data)
+    output_path = str(tmp_path / 'bremen-latest.osm.pbf')
+    with open(output_path + '.part', 'wb') as f:
+        f.write(data[:100 * 1024])
+
+    download_file(f'{url}/bremen-latest.osm.pbf', output_path, progress=False)
+
+    with open(output_path, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(output_path + '.part')
+    assert (f'/bremen-latest.osm.pbf', f'bytes={100 * 1024}-') in state['requests']
+
+
+def test_dropped_connection_is_resumed(file_server, tmp_path):
+    url, add, state = file_server
+    data = os.urandom(300 * 1024)
+    add('hamburg-latest.osm.pbf', data)
+    state['drop_after'] = 50 * 1024
+    output_path = str(tmp_path / 'hamburg-latest.osm.pbf')
+
+    download_file(f'{url}/hamburg-latest.osm.pbf', output_path, progress=False, timeout=5)
+
+    with open(output_path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_md5_mismatch_leaves_no_file(file_server, tmp_path):
+    url, add, state = file_server
+    add('saarland-latest.osm.pbf', b'corrupt', md5='0' * 32)
+    output_path = str(tmp_path / 'saarland-latest.osm.pbf')
+
+    with pytest.raises(DownloadError):
+        download_file(f'{url}/saarland-latest.osm.pbf', output_path, progress=False)
+    assert not os.path.exists(output_path)
+    assert not os.path.exists(output_path + '.part')
+
+
+def test_downloads_files_concurrently(file_server, tmp_path):
+    url, add, state = file_server
+    names = [f'region-{i}-latest.osm.pbf' for i in range(4)]
+    for name in names:
+        add(name, os.urandom(64 * 1024))
+
+    results = download_files([(f'{url}/{name}', str(tmp_path / name)) for name in names],
+                             max_workers=3, progress=False)
+
+    assert all(result is True for result in results.values())
+    assert sorted(os.listdir(tmp_path)) == sorted(names)
+
+
+def test_given_session_is_left_open(file_server, tmp_path):
+    url, add, state = file_server
+    add('bremen-latest.osm.pbf', os.urandom(1024))
+
+    class TrackedSession(requests.Session):
+        closed = False
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    with TrackedSession() as session:
+        results = download_files([(f'{url}/bremen-latest.osm.pbf', str(tmp_path / 'bremen-latest.osm.pbf'))],
+                                 session=session, progress=False)
+        assert results == {f'{url}/bremen-latest.osm.pbf': True}
+        assert not session.closed
+
+
+def test_unchanged_file_is_skipped(file_server, tmp_path):
+    url, add, state = file_server
+    add('hessen-latest.osm.pbf', os.urandom(64 * 1024))
+    output_path = str(tmp_path / 'hessen-latest.osm.pbf')
+    manifest = FreshnessManifest(str(tmp_path / 'manifest.json'))
+
+    assert download_file(f'{url}/hessen-latest.osm.pbf', output_path, progress=False, manifest=manifest)
+    state['requests'].clear()
+    manifest = FreshnessManifest(str(tmp_path / 'manifest.json'))  # reloaded from disk
+    assert not download_file(f'{url}/hessen-latest.osm.pbf', output_path, progress=False, manifest=manifest)
+    assert state['requests'] == [('/hessen-latest.osm.pbf', None)]  # no md5 request, no body
+
+    # Server publishes a new dump
+    data = os.urandom(64 * 1024)
+    add('hessen-latest.osm.pbf', data)
+    assert download_file(f'{url}/hessen-latest.osm.pbf', output_path, progress=False, manifest=manifest)
+    with open(output_path, 'rb') as f:
+        assert f.read() == data
@@ -0,0 +1,19 @@
+"""
+Tests for the bulk footprint conversions
+"""
+import numpy as np
+import shapely
+
+from src.cheapatlas.commons.geometry import to_geometry_array, to_wkb
+
+
+def test_mixed_encodings_decoded_in_bulk():
+    square = shapely.box(8.0, 50.0, 8.001, 50.001)
+    values = [square, square.wkt, shapely.to_wkb(square, hex=True), shapely.to_wkb(square), None, np.nan, '']
+
+    geometries = to_geometry_array(values)
+    assert all(shapely.equals(x, square) for x in geometries[:4])
+    assert list(geometries[4:]) == [None, None, None]
+
+    wkb = to_wkb(values)
+    assert wkb[1] == shapely.to_wkb(square) and wkb[-1] is None
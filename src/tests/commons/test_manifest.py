@@ -0,0 +1,110 @@
+"""
+Tests for the per-stage progress manifest
+"""
+import pandas as pd
+import pytest
+import shapely
+from pyproj import Geod
+
+from src.cheapatlas.commons.area_stats import area_stats
+from src.cheapatlas.commons.building_store import BuildingStore
+from src.cheapatlas.commons.manifest import DONE, FAILED, StageManifest, file_fingerprint
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    with StageManifest(str(tmp_path / 'progress.sqlite')) as m:
+        yield m
+
+
+def test_track_records_done_and_failed(manifest, tmp_path):
+    output_path = tmp_path / 'buildings_ags_01001000.csv'
+    with manifest.track('int_buildings', '01001000', input_hash='abc') as result:
+        output_path.write_text('id\n1\n2\n')
+        result.update(rows=2, output_path=str(output_path))
+
+    with pytest.raises(ValueError):
+        with manifest.track('int_buildings', '01002000'):
+            raise ValueError('broken area')
+
+    assert manifest.done_ids('int_buildings') == {'01001000'}
+    entry = manifest.get('int_buildings', '01001000')
+    assert entry['status'] == DONE and entry['rows'] == 2 and entry['output_size'] == 7
+    assert manifest.is_done('int_buildings', '01001000', input_hash='abc')
+    assert not manifest.is_done('int_buildings', '01001000', input_hash='changed')
+    failed = manifest.get('int_buildings', '01002000')
+    assert failed['status'] == FAILED and failed['error'] == 'broken area'
+
+
+def test_bootstrap_and_district_entries(manifest, tmp_path):
+    folder = tmp_path / 'pri'
+    folder.mkdir()
+    (folder / 'buildings_ags_01001000.csv').write_text('id\n1\n')
+    (folder / 'buildings_ags_01002000.csv').write_text('')  # interrupted write
+    (folder / 'buildings_ags_02000000.csv').write_text('id\n1\n')
+    (folder / 'buildings_ags_03000000.csv.tmp').write_text('id\n1\n')
+
+    store = BuildingStore(str(folder), 'ags', 'csv')
+    manifest.bootstrap('pri_buildings', store)
+    assert manifest.done_ids('pri_buildings') == {'01001000', '02000000'}
+
+    # Only imported once, the manifest is the source of truth afterwards
+    (folder / 'buildings_ags_01003000.csv').write_text('id\n1\n')
+    manifest.bootstrap('pri_buildings', store)
+    assert [x['boundary_id'] for x in manifest.entries('pri_buildings', prefix='010')] == ['01001000']
+
+    fingerprint = file_fingerprint(str(folder / 'buildings_ags_01001000.csv'))
+    (folder / 'buildings_ags_01001000.csv').write_text('id\n1\n2\n')
+    assert file_fingerprint(str(folder / 'buildings_ags_01001000.csv')) != fingerprint
+
+
+def test_area_stats_kept_for_done_areas(manifest):
+    # ~10 x 10 m and ~20 x 10 m footprints at 53°N, in every form a stage writes them (shapely, WKT, WKB)
+    small, large = shapely.box(8.05, 53.05, 8.05015, 53.05009), shapely.box(8.06, 53.05, 8.0603, 53.05009)
+    df = pd.DataFrame({'building_types': pd.Categorical(['residential', 'residential', 'public', None]),
+                       'geometry': [small, large.wkt, shapely.to_wkb(small), None]})
+    with manifest.track('pri_buildings', '01001000') as result:
+        result.update(rows=len(df), stats=area_stats(df))
+    with manifest.track('pri_buildings', '01002000') as result:
+        result.update(rows=1, stats=area_stats(pd.DataFrame({'id': [1]})))
+
+    stats = manifest.stats('pri_buildings')
+    assert stats['01002000'] == {'': (1, None)}
+    assert stats['01001000'][''] == (1, 0.0)
+    geod = Geod(ellps='WGS84')
+    expected = {name: abs(geod.geometry_area_perimeter(x)[0]) for name, x in (('small', small), ('large', large))}
+    assert 99 < expected['small'] < 101
+    assert stats['01001000']['public'][0] == 1
+    assert stats['01001000']['public'][1] == pytest.approx(expected['small'], rel=1e-4)
+    assert stats['01001000']['residential'][0] == 2
+    assert stats['01001000']['residential'][1] == pytest.approx(expected['small'] + expected['large'], rel=1e-4)
+    assert list(manifest.stats('pri_buildings', prefix='01002')) == ['01002000']
+
+    # a failed run of an area hides its previous summary, a new run replaces it
+    with pytest.raises(ValueError):
+        with manifest.track('pri_buildings', '01001000'):
+            raise ValueError('broken area')
+    assert list(manifest.stats('pri_buildings')) == ['01002000']
+    with manifest.track('pri_buildings', '01001000') as result:
+        result.update(rows=1, stats=area_stats(df.iloc[:1]))
+    assert manifest.stats('pri_buildings')['01001000'] == {'residential': (1, pytest.approx(expected['small'], rel=1e-4))}
+
+
+def test_done_areas_with_lost_output_are_processed_again(manifest, tmp_path):
+    folder = tmp_path / 'pri'
+    folder.mkdir()
+    for boundary_id in ('01001000', '01002000', '01003000'):
+        (folder / f'buildings_ags_{boundary_id}.csv').write_text('id\n1\n')
+    store = BuildingStore(str(folder), 'ags', 'csv')
+    manifest.bootstrap('pri_buildings', store)
+    manifest.record('int_region_changes', 'bremen-latest.osm.pbf', input_hash='abc')
+
+    (folder / 'buildings_ags_01002000.csv').unlink()
+    (folder / 'buildings_ags_01003000.csv').write_text('')  # truncated after the run
+    manifest.bootstrap('pri_buildings', store)
+
+    assert manifest.done_ids('pri_buildings') == {'01001000'}
+    assert manifest.is_done('pri_buildings', '01001000')
+    assert not manifest.is_done('pri_buildings', '01002000')
+    assert not manifest.is_done('pri_buildings', '01003000')
+    assert manifest.is_done('int_region_changes', 'bremen-latest.osm.pbf', input_hash='abc')
@@ -0,0 +1,29 @@
+"""
+Tests for the extraction of building objects per area from a small fixture region dump
+"""
+import pytest
+from pyrosm import OSM
+
+from src.cheapatlas.commons.osm_extract import extract_buildings
+
+COLUMNS = ('type', 'id', 'nodes', 'center.lat', 'center.lon',
+           'tags.building', 'tags.building:levels', 'tags.source', 'tags.addr:street', 'tags.addr:suburb')
+
+
+def test_buildings_are_assigned_to_their_area(region_dump):
+    df = extract_buildings(OSM(region_dump), 'ags', COLUMNS)
+
+    assert list(df.columns) == list(COLUMNS) + ['ags']
+    assert dict(zip(df['id'], df['ags'])) == {200: '04011000', 201: '04012000', 202: '04012000'}
+
+    house = df[df['id'] == 200].iloc[0]
+    assert house['type'] == 'way'
+    assert house['center.lat'] == pytest.approx(53.0505)
+    assert house['center.lon'] == pytest.approx(8.0505)
+    assert house['tags.building:levels'] == '2'
+    assert df.set_index('id').loc[201, 'tags.source'] == 'survey'
+
+
+def test_only_requested_areas(region_dump):
+    df = extract_buildings(OSM(region_dump), 'ags', COLUMNS, boundary_ids={'04011000'})
+    assert list(df['id']) == [200]
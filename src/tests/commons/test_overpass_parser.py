@@ -0,0 +1,130 @@
+"""
+Tests for the incremental Overpass JSON parser
+"""
+import json
+
+import pandas as pd
+import pytest
+from shapely import wkb
+
+from src.cheapatlas.commons.overpass_parser import (END_MARKER, OverpassError, elements_to_frame, iter_area_frames,
+                                                    iter_csv_frames, iter_elements, iter_frames)
+
+COLUMNS = ('type', 'id', 'nodes', 'center.lat', 'center.lon', 'tags.building', 'tags.addr:city')
+
+
+def _response(n, **extra):
+    elements = [{'type': 'way', 'id': i, 'nodes': [1, 2, 3],
+                 'center': {'lat': 52.5 + i, 'lon': 13.4},
+                 'tags': {'building': 'house', 'addr:city': 'Köln'}} for i in range(n)]
+    return json.dumps({'version': 0.6, 'osm3s': {'copyright': 'OSM'}, 'elements': elements, **extra},
+                      ensure_ascii=False).encode('utf-8')
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 4096])
+def test_batches_match_json_normalize(chunk_size):
+    raw = _response(25)
+    chunks = [raw[i:i + chunk_size] for i in range(0, len(raw), chunk_size)]
+
+    frames = list(iter_frames(chunks, COLUMNS, batch_size=10))
+
+    assert [len(f) for f in frames] == [10, 10, 5]
+    expected = pd.json_normalize(json.loads(raw)['elements']).reindex(columns=COLUMNS)
+    pd.testing.assert_frame_equal(pd.concat(frames, ignore_index=True), expected, check_dtype=False)
+
+
+def test_runtime_error_remark_is_raised():
+    with pytest.raises(OverpassError, match='timed out'):
+        list(iter_elements([_response(3, remark='runtime error: Query timed out in "query" at line 3')]))
+
+
+def test_truncated_response_is_raised():
+    with pytest.raises(OverpassError):
+        list(iter_elements([_response(3)[:-30]]))
+
+
+def _area_response(areas, before_marker=0):
+    elements = [{'type': 'way', 'id': 100 + i, 'tags': {'building': 'house'}} for i in range(before_marker)]
+    for area, n in areas:
+        elements.append({'type': 'boundary_marker', 'id': 1, 'tags': {'ags': area}})
+        elements += [{'type': 'way', 'id': int(area) * 10 + i, 'center': {'lat': 52.5, 'lon': 13.4},
+                      'tags': {'building': 'house'}} for i in range(n)]
+    return json.dumps({'elements': elements}).encode('utf-8')
+
+
+def test_json_areas_are_split_by_marker_across_batches():
+    raw = _area_response([('01001000', 5), ('01002000', 0), ('01003000', 3)])
+    chunks = [raw[i:i + 11] for i in range(0, len(raw), 11)]
+
+    frames = list(iter_area_frames(chunks, COLUMNS, marker='boundary_marker', key='ags', batch_size=2))
+
+    assert [(area, len(df)) for area, df in frames] == [('01001000', 2), ('01001000', 2), ('01001000', 1),
+                                                        ('01003000', 2), ('01003000', 1)]
+    assert all((df['id'] // 10).astype(str).str.zfill(8).eq(area).all() for area, df in frames)
+
+
+def test_json_elements_before_the_first_marker_are_raised():
+    with pytest.raises(OverpassError, match='before the first area marker'):
+        list(iter_area_frames([_area_response([('01001000', 2)], before_marker=1)], COLUMNS,
+                              marker='boundary_marker', key='ags'))
+
+
+def _csv_response(areas, complete=True, before_marker=0):
+    lines = ['@type\t@id\t@lat\t@lon\tbuilding\taddr:city\tags']
+    lines += [f'way\t{100 + i}\t52.5\t13.4\thouse\t\t' for i in range(before_marker)]
+    for area in areas:
+        lines.append(f'boundary_marker\t1\t\t\t\t\t{area}')
+        lines += [f'way\t{i}\t52.5\t13.4\thouse\tKöln\t' for i in range(3)]
+    lines.append('node\t9\t52.5\t13.4\tyes\t\t')
+    if complete:
+        lines.append(f'{END_MARKER}\t1\t\t\t\t\t')
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def test_csv_areas_are_split_by_marker():
+    raw = _csv_response(['01001000', '01002000'])
+    chunks = [raw[i:i + 7] for i in range(0, len(raw), 7)]
+
+    frames = list(iter_csv_frames(chunks, COLUMNS, batch_size=2, marker='boundary_marker', key='ags'))
+
+    result = pd.concat([df.assign(ags=area) for area, df in frames], ignore_index=True)
+    assert list(result.columns[:-1]) == list(COLUMNS)
+    assert result.groupby('ags').size().to_dict() == {'01001000': 3, '01002000': 4}
+    assert result['tags.addr:city'].iloc[0] == 'Köln'
+    assert result['center.lat'].isna().sum() == 1  # nodes have no center, like in JSON
+
+
+@pytest.mark.parametrize('batch_size', [1, 10])
+def test_csv_rows_before_the_first_marker_are_raised(batch_size):
+    with pytest.raises(OverpassError, match='way 100 before the first area marker'):
+        list(iter_csv_frames([_csv_response(['01001000'], before_marker=1)], COLUMNS, batch_size=batch_size,
+                             marker='boundary_marker', key='ags'))
+
+
+def test_incomplete_csv_response_is_raised():
+    with pytest.raises(OverpassError):
+        list(iter_csv_frames([_csv_response(['01001000'], complete=False)], COLUMNS))
+
+
+def test_out_geom_footprints():
+    square = [{'lat': 0, 'lon': 0}, {'lat': 0, 'lon': 2}, {'lat': 2, 'lon': 2}, {'lat': 2, 'lon': 0}, {'lat': 0, 'lon': 0}]
+    hole = [{'lat': 0.5, 'lon': 0.5}, {'lat': 0.5, 'lon': 1}, {'lat': 1, 'lon': 1}, {'lat': 0.5, 'lon': 0.5}]
+    elements = [
+        {'type': 'way', 'id': 1, 'bounds': {'minlat': 0, 'minlon': 0, 'maxlat': 2, 'maxlon': 2},
+         'geometry': square, 'tags': {'building': 'house'}},
+        {'type': 'node', 'id': 2, 'lat': 5, 'lon': 6, 'tags': {'building': 'yes'}},
+        {'type': 'relation', 'id': 3, 'bounds': {'minlat': 0, 'minlon': 0, 'maxlat': 2, 'maxlon': 2},
+         'members': [{'type': 'way', 'ref': 10, 'role': 'outer', 'geometry': square[:3]},
+                     {'type': 'way', 'ref': 11, 'role': 'outer', 'geometry': square[2:]},
+                     {'type': 'way', 'ref': 12, 'role': 'inner', 'geometry': hole}],
+         'tags': {'building': 'yes'}},
+    ]
+
+    df = elements_to_frame(elements, COLUMNS + ('geometry',))
+
+    # Center of the bounding box like `out center`, nodes have no center
+    assert list(df['center.lat'].fillna(-1)) == [1, -1, 1]
+    geometries = [wkb.loads(x, hex=True) for x in df['geometry']]
+    assert geometries[0].geom_type == 'Polygon' and geometries[0].area == 4
+    assert (geometries[1].x, geometries[1].y) == (6, 5)
+    assert geometries[2].area == pytest.approx(4 - 0.125)
@@ -0,0 +1,44 @@
+"""
+Tests for the streaming building reader of region dumps
+"""
+import os
+
+import pandas as pd
+import shapely
+from pyrosm import OSM
+
+from src.cheapatlas.commons.pbf_reader import iter_buildings
+from src.cheapatlas.commons.region_cache import RegionCache, read_region_buildings
+
+
+def test_buildings_streamed_in_bounded_chunks(region_dump):
+    # ~1 building per chunk
+    chunks = list(iter_buildings(region_dump, max_chunk_mb=0.0005))
+    assert len(chunks) > 1
+
+    df = pd.concat(chunks, ignore_index=True).sort_values('id').reset_index(drop=True)
+    expected = OSM(region_dump).get_buildings().sort_values('id').reset_index(drop=True)
+    assert df['id'].tolist() == expected['id'].tolist() == [200, 201, 202, 203]
+    assert df['building'].tolist() == expected['building'].tolist()
+    assert all(shapely.equals(df['geometry'].values, expected.geometry.values))
+    assert df.set_index('id').loc[200, 'tags'] == '{"building:levels": "2", "addr:street": "A"}'
+
+    inside = pd.concat(iter_buildings(region_dump, bbox=(8.0, 53.0, 8.2, 53.1)))
+    assert sorted(inside['id']) == [200, 201, 202]
+
+
+def test_areas_select_their_buildings_from_the_cache(region_dump, tmp_path):
+    cache = RegionCache(str(tmp_path / 'cache'))
+    buildings = read_region_buildings(region_dump, cache, reader='stream', max_chunk_mb=0.0005)
+    assert len(buildings) == 4
+    assert cache.is_current(region_dump)
+
+    # rows found through the id index of the memory-mapped copy, published once
+    table_path = cache.table_path(region_dump)
+    published = os.stat(table_path).st_mtime_ns
+    area = buildings.select([202, 200, 999])
+    assert sorted(area['id']) == [200, 202]
+    assert sorted(area.columns) == ['geometry', 'id', 'timestamp']
+    assert (shapely.area(area.geometry.values) > 0).all()
+    assert len(read_region_buildings(region_dump, cache, reader='stream').select([201])) == 1
+    assert os.stat(table_path).st_mtime_ns == published
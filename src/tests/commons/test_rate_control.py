@@ -0,0 +1,143 @@
+"""
+Tests for the adaptive rate controller against a local stub HTTP server
+returning scripted throttling responses
+"""
+import http.server
+import threading
+import time
+
+import pytest
+import requests
+
+from src.cheapatlas.commons.rate_control import (RateController,
+                                                 parse_overpass_status,
+                                                 parse_retry_after,
+                                                 request_with_backoff)
+
+
+@pytest.fixture
+def stub_server():
+    """Serve scripted (status, headers, body) responses in order, then 200 OK"""
+    script = []
+    hits = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            if self.path.startswith('/api/status'):
+                status, headers, body = 200, {}, b'Rate limit: 1\n1 slots available now.\n'
+            elif script:
+                status, headers, body = script.pop(0)
+            else:
+                status, headers, body = 200, {}, b'{"elements": []}'
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}', script, hits
+    server.shutdown()
+
+
+def test_retry_after_is_honoured(stub_server):
+    url, script, hits = stub_server
+    script.append((429, {'Retry-After': '1'}, b''))
+    controller = RateController(max_concurrency=4, backoff_base=0.01)
+
+    started = time.monotonic()
+    response = request_with_backoff(requests, f'{url}/api/interpreter', controller, max_retries=2)
+
+    assert response.status_code == 200
+    assert time.monotonic() - started >= 1
+    assert controller.concurrency == 2
+
+
+def test_status_endpoint_caps_concurrency(stub_server):
+    url, script, hits = stub_server
+    script.append((504, {}, b''))
+    controller = RateController(max_concurrency=4, backoff_base=0.01)
+
+    response = request_with_backoff(requests, f'{url}/api/interpreter', controller,
+                                    max_retries=1, status_url=f'{url}/api/status')
+
+    assert response.status_code == 200
+    assert '/api/status' in hits
+    assert controller.max_concurrency == 1
+
+
+def test_gives_up_after_max_retries(stub_server):
+    url, script, hits = stub_server
+    script.extend([(429, {}, b'')] * 3)
+    controller = RateController(max_concurrency=8, backoff_base=0.01)
+
+    assert request_with_backoff(requests, f'{url}/api/interpreter', controller, max_retries=2) is None
+    assert len(hits) == 3
+    assert controller.concurrency == 1
+
+
+def test_server_errors_are_retried_client_errors_raised(stub_server):
+    url, script, hits = stub_server
+    script.extend([(500, {}, b''), (400, {}, b'bad query')])
+    controller = RateController(max_concurrency=2, backoff_base=0.01)
+
+    with pytest.raises(requests.HTTPError):
+        request_with_backoff(requests, f'{url}/api/interpreter', controller, max_retries=5)
+    assert len(hits) == 2
+    assert controller._active == 0
+
+
+def test_streamed_response_holds_its_slot_until_closed(stub_server):
+    url, script, hits = stub_server
+    controller = RateController(max_concurrency=2)
+
+    response = request_with_backoff(requests, f'{url}/api/interpreter', controller, stream=True)
+    assert controller._active == 1
+    with response:
+        assert response.content == b'{"elements": []}'
+    assert controller._active == 0
+    response.close()
+    assert controller._active == 0
+
+    request_with_backoff(requests, f'{url}/api/interpreter', controller)
+    assert controller._active == 0
+
+
+def test_aimd_recovers_after_success():
+    controller = RateController(max_concurrency=4)
+    controller.on_throttle()
+    assert controller.concurrency == 2
+    for _ in range(10):
+        controller.on_success()
+    assert controller.concurrency == 4
+
+
+def test_throttling_is_logged_once_per_reduction(caplog):
+    controller = RateController(max_concurrency=4)
+    with caplog.at_level('WARNING', logger='src.cheapatlas.commons.rate_control'):
+        for _ in range(5):
+            controller.on_throttle()
+    assert controller.concurrency == 1
+    assert [x.getMessage() for x in caplog.records] == ['Endpoint is throttling, reduce concurrency to 2',
+                                                         'Endpoint is throttling, reduce concurrency to 1']
+
+
+def test_backoff_is_bounded():
+    controller = RateController(backoff_base=1.0, backoff_max=5.0)
+    assert all(0 <= controller.backoff(attempt) <= 5.0 for attempt in range(10))
+    assert controller.backoff(0, retry_after=3) == 3
+
+
+def test_parse_helpers():
+    assert parse_retry_after('7') == 7
+    assert parse_retry_after(None) is None
+    assert parse_overpass_status('Rate limit: 2\n2 slots available now.\n') == (2, 2, None)
+    assert parse_overpass_status('Rate limit: 2\n'
+                                 'Slot available after: 2021-01-01T00:00:12Z, in 12 seconds.\n'
+                                 'Slot available after: 2021-01-01T00:00:30Z, in 30 seconds.\n') == (2, 0, 12)
@@ -0,0 +1,34 @@
+"""
+Tests for the cache of buildings parsed from region dumps
+"""
+import os
+
+import shapely
+
+from src.cheapatlas.commons.region_cache import RegionCache, read_region_buildings
+
+
+def test_unchanged_dump_is_loaded_from_cache(region_dump, tmp_path):
+    cache = RegionCache(str(tmp_path / 'cache'))
+    assert cache.load(region_dump) is None
+
+    parsed = read_region_buildings(region_dump, cache)
+    assert os.path.exists(cache.path(region_dump))
+    assert cache.path(region_dump).endswith('region-latest.parquet')
+
+    cached = cache.load(region_dump)
+    assert cached.crs == parsed.crs
+    assert cached['id'].tolist() == parsed['id'].tolist()
+    assert cached['timestamp'].tolist() == parsed['timestamp'].tolist()
+    assert cached['building'].tolist() == parsed['building'].tolist()
+    assert all(shapely.equals(cached.geometry.values, parsed.geometry.values))
+
+    # Touched but identical dump ==> still a hit
+    stat = os.stat(region_dump)
+    os.utime(region_dump, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.load(region_dump) is not None
+
+    # Changed dump ==> parsed again
+    with open(region_dump, 'ab') as f:
+        f.write(b'\0')
+    assert cache.load(region_dump) is None
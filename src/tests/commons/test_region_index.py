@@ -0,0 +1,24 @@
+"""
+Tests for the id index of the region buildings
+"""
+import numpy as np
+import pandas as pd
+
+from src.cheapatlas.commons.region_index import IndexedBuildings, RegionIndex
+
+
+def test_index_finds_all_rows_of_the_ids():
+    # the same id for a node and a way building
+    ids = np.array([30, 10, 20, 10, 40])
+    index = RegionIndex(ids)
+
+    assert index.positions([10, 40, 99]).tolist() == [1, 3, 4]
+    assert index.positions([]).tolist() == []
+    assert index.positions([99]).tolist() == []
+
+    buildings = pd.DataFrame({'id': ids, 'geometry': list('abcde'), 'timestamp': range(5), 'tags': list('vwxyz')})
+    area = pd.DataFrame({'id': [40, 10, 77]})
+    expected = area.merge(buildings[['id', 'geometry', 'timestamp']], how='left', on='id')
+    merged = area.merge(IndexedBuildings(buildings).select(area['id']), how='left', on='id')
+    pd.testing.assert_frame_equal(merged.sort_values(['id', 'geometry']).reset_index(drop=True),
+                                  expected.sort_values(['id', 'geometry']).reset_index(drop=True))
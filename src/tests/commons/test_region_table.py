@@ -0,0 +1,39 @@
+"""
+Tests for the memory-mapped region table shared by the area workers
+"""
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import shapely
+from pyrosm import OSM
+
+from src.cheapatlas.commons.region_cache import RegionCache, read_region_buildings
+from src.cheapatlas.commons.region_table import RegionTable, publish_region_table
+
+
+def area_ids(table: RegionTable, ids):
+    return sorted(table.select(ids)['id'])
+
+
+def test_region_table_is_shared_with_workers(region_dump, tmp_path):
+    buildings = OSM(region_dump).get_buildings()
+    table = publish_region_table(buildings, str(tmp_path / 'region.arrow'))
+    assert len(table) == 4
+
+    area = table.select([202, 200, 999])
+    assert list(area.columns) == ['id', 'geometry', 'timestamp']
+    assert area['id'].tolist() == [200, 202]
+    expected = buildings.set_index('id').loc[[200, 202]]
+    assert all(shapely.equals(area.geometry.values, expected.geometry.values))
+    assert area['timestamp'].tolist() == expected['timestamp'].tolist()
+
+    # Only the file location is pickled to the workers
+    assert len(pickle.dumps(table)) < 200
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert list(executor.map(area_ids, [table, table], [[200], [201, 203]])) == [[200], [201, 203]]
+
+
+def test_region_table_from_streamed_region(region_dump, tmp_path):
+    cached = read_region_buildings(region_dump, RegionCache(str(tmp_path / 'cache')), reader='stream')
+    table = publish_region_table(cached, str(tmp_path / 'region.arrow'))
+    assert sorted(table.select([200, 201, 202, 203])['id']) == [200, 201, 202, 203]
@@ -0,0 +1,104 @@
+"""
+Tests for applying OSM replication diffs, on small fixture dump + change files
+"""
+import functools
+import gzip
+import http.server
+import threading
+
+import osmium
+import osmium.io as oio
+import pytest
+
+from src.cheapatlas.commons.replication import (SEQUENCE_HEADER, apply_change_files, read_header, replication_url,
+                                                update_region)
+
+NODE = '<node id="{}" version="1" timestamp="2020-01-01T00:00:00Z" lat="{}" lon="{}"/>'
+WAY = '<way id="{}" version="1" timestamp="2020-01-01T00:00:00Z">{}<tag k="{}" v="{}"/></way>'
+
+DUMP = f'''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+{NODE.format(1, 53.0, 8.0)}
+{NODE.format(2, 53.0, 8.1)}
+{NODE.format(3, 53.1, 8.1)}
+{NODE.format(4, 53.2, 8.2)}
+{NODE.format(5, 53.3, 8.3)}
+{WAY.format(10, '<nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="1"/>', 'building', 'house')}
+{WAY.format(12, '<nd ref="3"/><nd ref="4"/><nd ref="1"/><nd ref="3"/>', 'building', 'garage')}
+{WAY.format(13, '<nd ref="4"/><nd ref="5"/>', 'highway', 'residential')}
+</osm>
+'''
+
+# node 2 of building 10 moves, building 11 is created, building 12 is deleted, node 5 of a road moves
+CHANGES = f'''<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6">
+<modify>
+<node id="2" version="2" timestamp="2020-01-02T00:00:00Z" lat="53.01" lon="8.11"/>
+<node id="5" version="2" timestamp="2020-01-02T00:00:00Z" lat="53.31" lon="8.31"/>
+</modify>
+<create>
+<way id="11" version="1" timestamp="2020-01-02T00:00:00Z"><nd ref="3"/><nd ref="4"/><nd ref="5"/><nd ref="3"/><tag k="building" v="yes"/></way>
+</create>
+<delete>
+<way id="12" version="2" timestamp="2020-01-02T00:00:00Z"/>
+</delete>
+</osmChange>
+'''
+
+
+@pytest.fixture
+def replication_dump(tmp_path):
+    xml_path = tmp_path / 'region.osm'
+    xml_path.write_text(DUMP)
+    pbf_path = str(tmp_path / 'region-latest.osm.pbf')
+
+    header = oio.Header()
+    header.set(SEQUENCE_HEADER, '100')
+    with osmium.SimpleWriter(pbf_path, header=header) as writer:
+        for obj in osmium.FileProcessor(str(xml_path)):
+            writer.add(obj)
+    return pbf_path
+
+
+def test_apply_change_files(replication_dump, tmp_path):
+    change_path = str(tmp_path / '101.osc.gz')
+    with gzip.open(change_path, 'wt') as f:
+        f.write(CHANGES)
+
+    touched = apply_change_files(replication_dump, [change_path], sequence=101)
+
+    assert touched == {10, 11, 12}
+    assert read_header(replication_dump)[SEQUENCE_HEADER] == '101'
+
+    ways = {w.id: w.tags.get('building') for w in osmium.FileProcessor(replication_dump, osmium.osm.WAY)}
+    assert ways == {10: 'house', 11: 'yes', 13: None}
+    lats = {n.id: n.location.lat for n in osmium.FileProcessor(replication_dump, osmium.osm.NODE)}
+    assert lats[2] == pytest.approx(53.01)
+
+
+def test_update_region_from_replication_server(replication_dump, tmp_path):
+    # Replication directory layout: state.txt + 000/000/<sequence>.osc.gz/.state.txt
+    updates = tmp_path / 'region-updates'
+    (updates / '000' / '000').mkdir(parents=True)
+    state = 'sequenceNumber=101\ntimestamp=2020-01-02T00\\:00\\:00Z\n'
+    (updates / 'state.txt').write_text(state)
+    (updates / '000' / '000' / '101.state.txt').write_text(state)
+    with gzip.open(str(updates / '000' / '000' / '101.osc.gz'), 'wt') as f:
+        f.write(CHANGES)
+
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(updates))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f'http://127.0.0.1:{server.server_port}'
+        assert update_region(replication_dump, url) == {10, 11, 12}
+        assert read_header(replication_dump)[SEQUENCE_HEADER] == '101'
+        # Already up to date
+        assert update_region(replication_dump, url) is None
+    finally:
+        server.shutdown()
+
+
+def test_replication_url():
+    assert replication_url('http://download.geofabrik.de/europe/germany/bremen-latest.osm.pbf') == \
+        'http://download.geofabrik.de/europe/germany/bremen-updates'
@@ -0,0 +1,54 @@
+"""
+Tests for the on-disk Overpass response cache
+"""
+import os
+import time
+
+from src.cheapatlas.commons.response_cache import ResponseCache
+
+
+def test_roundtrip_is_keyed_by_query(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put('query a', [b'{"elements": ', b'[]}'])
+
+    with cache.open('query a') as f:
+        assert f.read() == b'{"elements": []}'
+    assert cache.open('query b') is None
+
+
+def test_expired_entries_are_missing(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl_days=1)
+    path = cache.put('query', [b'{}'])
+    os.utime(path, (time.time(), time.time() - 2 * 86400))
+
+    assert cache.get('query') is None
+    assert not os.path.exists(path)
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size_mb=1)
+    payload = [os.urandom(400 * 1024)]  # incompressible
+    old = cache.put('old', payload)
+    recent = cache.put('recent', payload)
+    os.utime(old, (time.time() - 60, os.path.getmtime(old)))
+    os.utime(recent, (time.time() - 120, os.path.getmtime(recent)))
+    cache.get('old')  # mark as recently used
+
+    cache.put('new', payload)
+
+    assert cache.get('recent') is None
+    assert cache.get('old') is not None
+    assert cache.get('new') is not None
+
+
+def test_entry_just_written_is_never_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size_mb=1)
+    old = cache.put('old', [os.urandom(400 * 1024)])
+
+    # larger than the whole cache: everything else goes, the new entry stays readable
+    large = cache.put('large', [os.urandom(1200 * 1024)])
+
+    assert not os.path.exists(old)
+    with cache.open('large') as f:
+        assert len(f.read()) == 1200 * 1024
+    assert os.path.exists(large)
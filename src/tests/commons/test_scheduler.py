@@ -0,0 +1,58 @@
+"""
+Tests for the memory budget scheduler of parallel jobs
+"""
+import os
+import time
+
+from src.cheapatlas.commons.scheduler import run_within_budget
+
+
+def timed_sleep(seconds: float):
+    if seconds < 0:
+        raise ValueError('negative sleep')
+    start = time.time()
+    time.sleep(seconds)
+    return start, time.time()
+
+
+def peak_estimate(results, estimates):
+    """Highest sum of the estimates of jobs running at the same time"""
+    return max(sum(estimates[other] for other, (start, end) in results.items() if start <= moment < end)
+               for moment, _ in results.values())
+
+
+def test_jobs_run_within_the_memory_budget():
+    estimates = {'large': 70, 'small-1': 20, 'small-2': 20, 'small-3': 20}
+    results = run_within_budget(timed_sleep, [(name, mb, (0.3,)) for name, mb in estimates.items()],
+                                memory_budget_mb=100, max_workers=4)
+
+    assert sorted(results) == sorted(estimates)
+    assert peak_estimate(results, estimates) == 90
+    # a small region runs alongside the large one
+    assert results['large'][0] < min(end for name, (_, end) in results.items() if name != 'large')
+
+
+def test_oversized_job_runs_alone_and_failures_are_skipped():
+    estimates = {'huge': 500, 'small': 20}
+    jobs = [(name, mb, (0.2,)) for name, mb in estimates.items()] + [('broken', 10, (-1,))]
+    results = run_within_budget(timed_sleep, jobs, memory_budget_mb=100, max_workers=4)
+
+    assert sorted(results) == ['huge', 'small']
+    assert peak_estimate(results, estimates) == 500
+
+
+def sleep_or_crash(seconds: float, crash: bool = False):
+    """Worker process killed (etc: by the out-of-memory killer) instead of sleeping"""
+    if crash:
+        time.sleep(0.1)
+        os._exit(1)
+    return timed_sleep(seconds)
+
+
+def test_crashed_worker_does_not_abort_the_other_jobs():
+    estimates = {'crashing': 50, 'small-1': 20, 'small-2': 20, 'small-3': 20}
+    jobs = [(name, mb, (0.3, name == 'crashing')) for name, mb in estimates.items()]
+    results = run_within_budget(sleep_or_crash, jobs, memory_budget_mb=100, max_workers=4)
+
+    # jobs of the broken pool are retried alone, only the crashing one is left out
+    assert sorted(results) == ['small-1', 'small-2', 'small-3']
@@ -0,0 +1,47 @@
+"""
+Tests for the schema registry of the building objects
+"""
+import pandas as pd
+
+from src.cheapatlas.commons.building_store import BuildingStore
+from src.cheapatlas.commons.schema import apply_schema, conform
+
+
+def test_apply_schema_casts_to_compact_dtypes():
+    df = apply_schema(pd.DataFrame({'id': ['1', '2', '3'],
+                                    'center.lat': [50.1234567, 50.2, None],
+                                    'tags.building': ['house', None, 'house'],
+                                    'building_levels': ['2', '2.5', 'ground'],
+                                    'postcode': [50667.0, None, 1067.0],
+                                    'timestamp': [1, 2, 3]}))
+
+    assert str(df['id'].dtype) == 'int64'
+    assert str(df['center.lat'].dtype) == 'float64' and df['center.lat'][0] == 50.1234567
+    assert isinstance(df['tags.building'].dtype, pd.CategoricalDtype)
+    assert list(df['tags.building'].cat.categories) == ['house'] and pd.isna(df['tags.building'][1])
+    assert df['building_levels'].tolist()[:2] == [2, 2] and pd.isna(df['building_levels'][2])
+    assert df['postcode'].tolist()[::2] == ['50667', '1067'] and pd.isna(df['postcode'][1])
+    # Columns outside of the schema are left as is
+    assert str(df['timestamp'].dtype) == 'int64'
+
+    standard = conform(df, ['id', 'type'])
+    assert list(standard.columns) == ['id', 'type'] and standard['type'].isna().all()
+
+
+def test_both_backends_read_the_schema_dtypes(tmp_path):
+    df = pd.DataFrame({'id': [1, 2],
+                       'center.lat': [50.1, 50.2],
+                       'tags.building': ['house', 'yes'],
+                       'tags.addr:postcode': ['01067', None],
+                       'building_types': ['residential', 'to_be_classified'],
+                       'ags': '01001000'})
+    dtypes = None
+    for backend in ('csv', 'parquet'):
+        store = BuildingStore(str(tmp_path / backend), 'ags', backend)
+        store.write('01001000', df)
+        result = store.read('01001000')
+        assert result['tags.addr:postcode'][0] == '01067' and result['ags'][0] == '01001000'
+        assert isinstance(result['building_types'].dtype, pd.CategoricalDtype)
+        if dtypes is not None:
+            assert [str(x) for x in result.dtypes] == dtypes
+        dtypes = [str(x) for x in result.dtypes]
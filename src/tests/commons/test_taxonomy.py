@@ -0,0 +1,30 @@
+"""
+Tests for the naive building types classification
+"""
+import pandas as pd
+import yaml
+
+from src.cheapatlas.commons.taxonomy import BuildingTaxonomy
+
+
+def test_taxonomy_from_parameters_classifies_a_district():
+    with open('conf/base/parameters.yml') as f:
+        taxonomy = BuildingTaxonomy(yaml.safe_load(f)['building_taxonomy'])
+
+    tags = pd.Series(['house', 'yes', 'garage', None, 'YES', 'shop', 'castle', 'cowshed', 'unknown', 'house'],
+                     index=range(10, 20))
+    expected = ['residential', 'to_be_classified', 'accessory_storage', 'other', 'to_be_classified', 'commercial',
+                'public', 'accessory_supply', 'other', 'residential']
+    for column in (tags, tags.astype('category')):
+        result = taxonomy.classify(column)
+        assert isinstance(result.dtype, pd.CategoricalDtype)
+        assert result.tolist() == expected
+        assert result.index.tolist() == list(range(10, 20))
+        assert list(result.cat.categories) == ['residential', 'commercial', 'accessory_storage', 'accessory_supply',
+                                               'industrial', 'public', 'to_be_classified', 'other']
+
+
+def test_first_building_type_listing_a_tag_wins():
+    taxonomy = BuildingTaxonomy({'residential': ['house'], 'public': ['house', 'school'], 'other': ['hut']})
+    assert taxonomy.classify(pd.Series(['house', 'school', 'hut', 'barn'])).tolist() == \
+        ['residential', 'public', 'other', 'other']
@@ -0,0 +1,25 @@
+"""
+Tests for the bounding box tiling of oversized areas
+"""
+import pytest
+
+from src.cheapatlas.commons.tiling import plan_tiles, split_bbox
+
+BBOX = (50.0, 8.0, 51.0, 9.0)
+
+
+def _area(tiles):
+    return sum((north - south) * (east - west) for south, west, north, east in tiles)
+
+
+def test_quadrants_cover_the_bbox():
+    tiles = split_bbox(BBOX)
+    assert len(tiles) == 4
+    assert _area(tiles) == pytest.approx(_area([BBOX]))
+
+
+@pytest.mark.parametrize('estimated_count, n_tiles', [(None, 4), (10000, 4), (200000, 4), (450000, 9)])
+def test_grid_follows_estimated_count(estimated_count, n_tiles):
+    tiles = plan_tiles(BBOX, estimated_count, max_per_tile=50000)
+    assert len(tiles) == n_tiles
+    assert _area(tiles) == pytest.approx(_area([BBOX]))
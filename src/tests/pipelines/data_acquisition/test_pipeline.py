@@ -33,4 +33,159 @@ Please add your pipeline tests here.
 Kedro recommends using `pytest` framework, more info about it can be found
 in the official documentation:
 https://docs.pytest.org/en/latest/getting-started.html
+
+Crawling nodes are tested against a local HTTP server answering Overpass queries for fixture areas
 """
+import http.server
+import json
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import pandas as pd
+
+from src.cheapatlas.commons.building_store import BuildingStore
+from src.cheapatlas.commons.manifest import FAILED, StageManifest
+from src.cheapatlas.commons.rate_control import RateController
+from src.cheapatlas.commons.response_cache import ResponseCache
+from src.cheapatlas.pipelines.data_acquisition.nodes import (AREA_MARKER, RAW_BUILDINGS_STAGE, build_batch_query,
+                                                             build_overpass_query, crawl_batch, get_data,
+                                                             open_overpass)
+
+AREA_ID = re.compile(r'"de:amtlicher_gemeindeschluessel"="(\d+)"')
+
+
+def area_elements(boundary_id: str, n: int = 3):
+    """Buildings of a fixture area, ids derived from the boundary id"""
+    return [{'type': 'way', 'id': int(boundary_id) * 10 + i, 'nodes': [1, 2, 3],
+             'center': {'lat': 53.0, 'lon': 8.0}, 'tags': {'building': 'house'}} for i in range(n)]
+
+
+@pytest.fixture
+def overpass_server():
+    """
+    Answer Overpass queries of AGS areas, optionally failing some areas or breaking multi-area responses
+    Connections are kept alive, the client ports and the peak of requests in flight are recorded
+    """
+    state = {'queries': [], 'failing': set(), 'broken_batch': False, 'delay': 0,
+             'ports': set(), 'active': 0, 'max_active': 0}
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)['data'][0]
+            with lock:
+                state['queries'].append(query)
+                state['ports'].add(self.client_address[1])
+                state['active'] += 1
+                state['max_active'] = max(state['max_active'], state['active'])
+            try:
+                time.sleep(state['delay'])
+                self.respond(AREA_ID.findall(query), AREA_MARKER in query)
+            finally:
+                with lock:
+                    state['active'] -= 1
+
+        def respond(self, boundary_ids, is_batch):
+            if state['failing'] & set(boundary_ids):
+                self.send_response(500)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            elements = []
+            if is_batch:
+                if state['broken_batch']:
+                    # an element without area: the whole multi-area response is unusable
+                    elements += area_elements('99', 1)
+                for boundary_id in boundary_ids:
+                    elements.append({'type': AREA_MARKER, 'id': 1, 'tags': {'ags': boundary_id}})
+                    elements += area_elements(boundary_id)
+            else:
+                elements = area_elements(boundary_ids[0])
+            body = json.dumps({'elements': elements}).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/api/interpreter', state
+    server.shutdown()
+
+
+def test_batch_query_marks_every_area():
+    query = build_batch_query('ags', ['01001000', '01002000'])
+
+    assert query.startswith('[out:json];')
+    assert AREA_ID.findall(query) == ['01001000', '01002000']
+    # the result set of each area follows its marker
+    assert query.index(f'make {AREA_MARKER} ags="01001000"') < query.index('(area.a0)') \
+        < query.index(f'make {AREA_MARKER} ags="01002000"') < query.index('(area.a1)')
+    assert query.count('out center;') == 2
+
+
+@pytest.mark.parametrize('broken_batch', [False, True])
+def test_batch_is_split_into_areas_or_falls_back(overpass_server, tmp_path, broken_batch):
+    url, state = overpass_server
+    state['broken_batch'] = broken_batch
+    store = BuildingStore(str(tmp_path / 'raw'), 'ags', 'csv')
+    boundary_ids = ['01001000', '01002000', '01003000']
+
+    saved = crawl_batch(None, RateController(), {'url': url, 'max_retries': 0, 'batch_size': 2}, None,
+                        'ags', boundary_ids, store)
+
+    assert saved == {boundary_id: 3 for boundary_id in boundary_ids}
+    for boundary_id in boundary_ids:
+        df = store.read(boundary_id)
+        assert sorted(df['id']) == [int(boundary_id) * 10 + i for i in range(3)]
+    # broken multi-area response: one query per area, nothing of the batch kept
+    assert len(state['queries']) == (4 if broken_batch else 1)
+
+
+def test_areas_are_crawled_concurrently_and_resumed(overpass_server, tmp_path):
+    url, state = overpass_server
+    state.update(failing={'01003000'}, delay=0.2)
+    store = BuildingStore(str(tmp_path / 'raw'), 'ags', 'csv')
+    manifest_path = str(tmp_path / 'progress.sqlite')
+    plz_ags = pd.DataFrame({'ags': [f'0100{i}000' for i in range(1, 7)]})
+    overpass = {'url': url, 'max_concurrency': 2, 'max_retries': 0}
+
+    get_data(plz_ags, 'ags', store, overpass, manifest_path=manifest_path)
+
+    # the failing area does not stop the others
+    assert sorted(store.existing()) == ['01001000', '01002000', '01004000', '01005000', '01006000']
+    with StageManifest(manifest_path) as manifest:
+        assert manifest.done_ids(RAW_BUILDINGS_STAGE) == set(store.existing())
+        assert manifest.get(RAW_BUILDINGS_STAGE, '01003000')['status'] == FAILED
+    # two requests in flight at most, over the two kept-alive connections of the shared session
+    assert len(state['queries']) == 6
+    assert state['max_active'] == 2
+    assert len(state['ports']) == 2
+
+    # finished areas are skipped, only the failed one is crawled again
+    state.update(failing=set(), queries=[])
+    get_data(plz_ags, 'ags', store, overpass, manifest_path=manifest_path)
+    assert AREA_ID.findall(''.join(state['queries'])) == ['01003000']
+    assert sorted(store.read('01003000')['id']) == [10030000, 10030001, 10030002]
+
+
+def test_response_gone_from_cache_is_streamed_from_server(overpass_server, tmp_path):
+    url, state = overpass_server
+    cache = ResponseCache(str(tmp_path / 'cache'), ttl_days=-1)  # every entry is expired right away
+    query = build_overpass_query('ags', '01001000')
+
+    with open_overpass(query, None, RateController(), {'url': url, 'max_retries': 0}, cache) as chunks:
+        body = json.loads(b''.join(chunks))
+
+    assert body['elements'] == area_elements('01001000')
+    assert len(state['queries']) == 2
@@ -33,4 +33,61 @@ Please add your pipeline tests here.
 Kedro recommends using `pytest` framework, more info about it can be found
 in the official documentation:
 https://docs.pytest.org/en/latest/getting-started.html
+
+Areas are enhanced from building objects crawled with their footprint, the region dump is never parsed
 """
+import os
+
+import pandas as pd
+import yaml
+
+from src.cheapatlas.commons.building_store import BuildingStore
+from src.cheapatlas.pipelines.data_preparation.nodes import get_region_data
+
+REGION = 'bremen-latest.osm.pbf'
+AREAS = {'04011000': [1, 2], '04012000': [3], '04013000': [4]}
+
+
+def enhanced_areas(int_buildings):
+    """Areas written since the outputs were last marked as old"""
+    return sorted(boundary_id for boundary_id, path in int_buildings.existing().items() if os.stat(path).st_mtime_ns)
+
+
+def mark_as_old(int_buildings):
+    for path in int_buildings.existing().values():
+        os.utime(path, ns=(0, 0))
+
+
+def test_only_areas_with_touched_buildings_are_enhanced_again(tmp_path):
+    with open('conf/base/parameters.yml') as f:
+        building_taxonomy = yaml.safe_load(f)['building_taxonomy']
+    region_path = tmp_path / 'geofabrik' / REGION
+    region_path.parent.mkdir()
+    region_path.write_bytes(b'dump')
+    geofabrik = {'output_path': str(region_path.parent), 'ags_code': {REGION: ['04']}}
+    plz_ags = pd.DataFrame({'plz': ['28195', '28197', '28199'], 'ags': list(AREAS)})
+
+    raw_buildings = BuildingStore(str(tmp_path / 'raw'), 'ags')
+    int_buildings = BuildingStore(str(tmp_path / 'int'), 'ags')
+    for boundary_id, ids in AREAS.items():
+        raw_buildings.write(boundary_id, pd.DataFrame({'type': 'way', 'id': ids,
+                                                       'center.lat': 53.05, 'center.lon': 8.8,
+                                                       'tags.building': 'house', 'tags.building:levels': 2,
+                                                       'geometry': 'POLYGON ((8.8 53.05, 8.801 53.05, 8.801 53.051, 8.8 53.05))'}))
+
+    def run(changed_regions):
+        mark_as_old(int_buildings)
+        get_region_data(plz_ags, 'ags', geofabrik, building_taxonomy, int_buildings, raw_buildings,
+                        changed_regions, str(tmp_path / 'progress.sqlite'))
+        return enhanced_areas(int_buildings)
+
+    assert run(None) == list(AREAS)
+    # dump updated with replication diffs touching building 3
+    assert run({REGION: [3]}) == ['04012000']
+    # the same change, still listed by the last refresh
+    assert run({REGION: [3]}) == []
+    assert run({}) == []
+    # next refresh
+    region_path.write_bytes(b'updated dump')
+    assert run({REGION: [3, 4]}) == ['04012000', '04013000']
+    assert run({REGION: None}) == []